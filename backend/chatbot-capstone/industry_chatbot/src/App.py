@@ -1,12 +1,23 @@
-from flask import Flask, request, jsonify, send_from_directory
+import os
+import json
+from flask import Flask, Response, request, jsonify, send_from_directory, stream_with_context
 from flask_cors import CORS
-from inference.inference import PolicyQASystem
+from inference.batching import MicroBatcher
+from qa_service import qa_system
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS for cross-origin requests
 
-qa_system = PolicyQASystem(
-    data_path=r'C:\Users\moksh\classroom\chatbot_deepseek\industry_chatbot\data\knowledge_base\cleaned_augmented_qa_pairs.json'
+# Concurrent /api/ask requests that need the encoder or the generator are grouped into
+# micro-batches and answered with one PolicyQASystem.get_answers call per batch; small talk,
+# cached answers and lexical matches are answered on the request thread (answer_fast).
+MAX_BATCH_SIZE = int(os.environ.get('QA_MAX_BATCH_SIZE', 8))
+MAX_WAIT_MS = float(os.environ.get('QA_MAX_WAIT_MS', 5))
+
+ask_batcher = MicroBatcher(
+    qa_system.get_answers,
+    max_batch_size=MAX_BATCH_SIZE,
+    max_wait_ms=MAX_WAIT_MS
 )
 
 @app.route('/api/ask', methods=['POST'])
@@ -17,12 +28,89 @@ def ask_question():
     if not query:
         return jsonify({"error": "No query provided"}), 400
     
-    response = qa_system.get_answer(query)
+    response = qa_system.answer_fast(query)
+    if response is None:
+        response = ask_batcher(query)
     return jsonify({
         "question": query,
         "answer": response
     })
 
+@app.route('/api/ask/stream', methods=['GET', 'POST'])
+def ask_question_stream():
+    """
+    Server-Sent-Events variant of /api/ask: each text chunk is sent as soon as it is
+    decoded, followed by a final ``done`` event (or an ``error`` event if answering fails
+    mid-stream). GET (``?query=``) is supported for EventSource.
+    """
+    if request.method == 'GET':
+        query = request.args.get('query', '')
+    else:
+        query = (request.get_json(silent=True) or {}).get('query', '')
+    
+    if not query:
+        return jsonify({"error": "No query provided"}), 400
+    
+    def events():
+        try:
+            for chunk in qa_system.stream_answer(query):
+                yield f"data: {json.dumps({'token': chunk})}\n\n"
+        except Exception as e:
+            # The 200 status is already sent; tell the client the stream ended early.
+            app.logger.error(f"Streaming answer failed: {e}")
+            yield 'event: error\ndata: {"error": "Failed to answer the query"}\n\n'
+            return
+        yield "event: done\ndata: {}\n\n"
+    
+    return Response(
+        stream_with_context(events()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+# Admin endpoints are disabled unless QA_ADMIN_TOKEN is set; callers must send it in X-Admin-Token.
+ADMIN_TOKEN = os.environ.get('QA_ADMIN_TOKEN')
+
+@app.route('/api/admin/reload', methods=['POST'])
+def reload_knowledge_base():
+    """
+    Rebuild the knowledge base and index (optionally from a new data file) and swap them in
+    atomically; /api/ask keeps serving the previous version until the swap.
+    """
+    if not ADMIN_TOKEN or request.headers.get('X-Admin-Token') != ADMIN_TOKEN:
+        return jsonify({"error": "Forbidden"}), 403
+    
+    data = request.get_json(silent=True) or {}
+    try:
+        version = qa_system.reload_knowledge_base(data.get('data_path'))
+    except Exception as e:
+        return jsonify({"error": f"Reload failed: {e}"}), 500
+    return jsonify({
+        "version": version,
+        "entries": len(qa_system.kb)
+    })
+
+@app.route('/api/ready')
+def readiness():
+    """
+    Report which components are loaded. Returns 503 when ``?require=generator`` is given and the
+    generator is not loaded yet, so probes can wait for a fully warmed replica.
+    """
+    status = qa_system.readiness()
+    ready = status['retrieval_model'] and status['index']
+    if request.args.get('require') == 'generator':
+        ready = ready and status['generator']
+    status['ready'] = ready
+    return jsonify(status), 200 if ready else 503
+
+@app.route('/metrics')
+def metrics():
+    """
+    Prometheus scrape endpoint: per-stage latency histograms, answer path counters,
+    best-match similarity and generated token distributions, and answer cache statistics.
+    """
+    return Response(qa_system.render_metrics(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/')
 def serve_index():
     return send_from_directory('.', 'index.html')
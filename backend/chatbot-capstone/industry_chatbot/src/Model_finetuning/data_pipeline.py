@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+"""
+Fine-tuning data pipeline: tokenization cache, packing and dynamic-padding collation.
+
+QA pairs are tokenized once and stored as one flat token array plus example offsets under a
+key derived from the data file, the tokenizer and the pipeline settings, so repeated runs
+load them from disk (memory-mapped) instead of re-tokenizing. Batches are padded only to
+their longest sequence, and short examples can be packed into shared sequences, so little
+compute is spent on pad tokens.
+"""
+from __future__ import annotations
+import os
+import json
+import time
+import shutil
+import hashlib
+import logging
+import tempfile
+import numpy as np
+from typing import TYPE_CHECKING, Dict, List, Optional, Sequence
+from data_processing.qa_io import iter_qa_records
+
+if TYPE_CHECKING:
+    import torch
+
+# Bump whenever tokenization or packing changes so stale caches are ignored.
+PIPELINE_VERSION = 1
+
+IGNORE_INDEX = -100
+
+
+def format_example(question: str, answer: str) -> str:
+    """
+    Training text of one QA pair (the inference prompt format of the fine-tuned model).
+    """
+    return f"Question: {question}\nAnswer: {answer}\n"
+
+
+def tokenizer_fingerprint(tokenizer) -> str:
+    """
+    Hash of everything about a tokenizer that affects token ids.
+    """
+    digest = hashlib.sha256(type(tokenizer).__name__.encode("utf-8"))
+    backend = getattr(tokenizer, "backend_tokenizer", None)
+    if backend is not None:
+        digest.update(backend.to_str().encode("utf-8"))
+    else:
+        digest.update(json.dumps(sorted(tokenizer.get_vocab().items())).encode("utf-8"))
+    digest.update(json.dumps(tokenizer.special_tokens_map, sort_keys=True).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def pack_examples(lengths: Sequence[int], max_length: int) -> List[List[int]]:
+    """
+    Group example indices into sequences of at most ``max_length`` tokens.
+
+    First-fit decreasing: examples are placed longest first into the first sequence with
+    room left, which keeps sequences nearly full. Examples are assumed to be no longer than
+    ``max_length`` (they are truncated when tokenized).
+    """
+    bins: List[List[int]] = []
+    room: List[int] = []
+    for index in sorted(range(len(lengths)), key=lambda i: lengths[i], reverse=True):
+        length = lengths[index]
+        for b, free in enumerate(room):
+            if length <= free:
+                bins[b].append(index)
+                room[b] -= length
+                break
+        else:
+            bins.append([index])
+            room.append(max_length - length)
+    return bins
+
+
+class TokenizedQADataset:
+    """
+    Map-style dataset of tokenized (optionally packed) QA examples.
+
+    Sequences are slices of one flat int32 token array, described by ``offsets`` (start of
+    each example) and ``sequences`` (start and end example of each sequence), so the whole
+    dataset is three small arrays that can be memory-mapped. Every item carries
+    ``position_ids`` that restart at 0 for each packed example, so packed examples see the same
+    positions as they would alone (and as prompts do at inference time). Position ids alone do
+    not stop packed examples attending to each other; ``DynamicPaddingCollator`` derives a
+    block-diagonal attention mask from them.
+    """
+
+    TOKENS_FILE = "tokens.npy"
+    OFFSETS_FILE = "offsets.npy"
+    SEQUENCES_FILE = "sequences.npy"
+    META_FILE = "meta.json"
+
+    def __init__(self, tokens: np.ndarray, offsets: np.ndarray, sequences: np.ndarray):
+        self.tokens = tokens
+        self.offsets = offsets
+        self.sequences = sequences
+
+    def __len__(self) -> int:
+        return len(self.sequences)
+
+    def example_lengths(self) -> np.ndarray:
+        return np.diff(self.offsets)
+
+    def lengths(self) -> np.ndarray:
+        """
+        Token count of every sequence.
+        """
+        return self.offsets[self.sequences[:, 1]] - self.offsets[self.sequences[:, 0]]
+
+    def __getitem__(self, index: int) -> Dict[str, List[int]]:
+        first, last = self.sequences[index]
+        start, end = self.offsets[first], self.offsets[last]
+        position_ids = np.concatenate([
+            np.arange(self.offsets[i + 1] - self.offsets[i]) for i in range(first, last)
+        ])
+        return {
+            "input_ids": self.tokens[start:end].tolist(),
+            "position_ids": position_ids.tolist()
+        }
+
+    @classmethod
+    def build(cls, texts: Sequence[str], tokenizer, max_length: int, packing: bool) -> "TokenizedQADataset":
+        """
+        Tokenize ``texts`` (each truncated to ``max_length`` tokens including a closing EOS,
+        so the model learns where an answer ends) and lay them out as one sequence each or
+        packed up to ``max_length`` tokens per sequence.
+        """
+        eos = [tokenizer.eos_token_id] if tokenizer.eos_token_id is not None else []
+        encoded = tokenizer(list(texts), add_special_tokens=False, truncation=True,
+                            max_length=max_length - len(eos))["input_ids"]
+        encoded = [ids + eos for ids in encoded]
+        order = pack_examples([len(ids) for ids in encoded], max_length) if packing else [[i] for i in range(len(encoded))]
+
+        # Store examples in sequence order so each sequence is one contiguous run of examples.
+        ordered = [encoded[i] for group in order for i in group]
+        offsets = np.zeros(len(ordered) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(ids) for ids in ordered])
+        tokens = np.fromiter((t for ids in ordered for t in ids), dtype=np.int32, count=int(offsets[-1]))
+        bounds = np.zeros(len(order) + 1, dtype=np.int64)
+        bounds[1:] = np.cumsum([len(group) for group in order])
+        sequences = np.stack([bounds[:-1], bounds[1:]], axis=1)
+        return cls(tokens, offsets, sequences)
+
+    def save(self, directory: str) -> None:
+        np.save(os.path.join(directory, self.TOKENS_FILE), self.tokens)
+        np.save(os.path.join(directory, self.OFFSETS_FILE), self.offsets)
+        np.save(os.path.join(directory, self.SEQUENCES_FILE), self.sequences)
+
+    @classmethod
+    def load(cls, directory: str, mmap: bool = True) -> "TokenizedQADataset":
+        mode = "r" if mmap else None
+        return cls(
+            np.load(os.path.join(directory, cls.TOKENS_FILE), mmap_mode=mode),
+            np.load(os.path.join(directory, cls.OFFSETS_FILE), mmap_mode=mode),
+            np.load(os.path.join(directory, cls.SEQUENCES_FILE), mmap_mode=mode)
+        )
+
+
+class TokenizedDatasetCache:
+    """
+    On-disk cache of tokenized datasets, one directory per key.
+
+    The key covers the content of the data file, the tokenizer fingerprint and the pipeline
+    settings, so any change yields a new key and a fresh tokenization. Entries are written to a
+    temporary directory and moved into place, like ``inference.index_store``.
+    """
+
+    def __init__(self, cache_dir: str, logger: Optional[logging.Logger] = None):
+        """
+        Initialize the cache.
+
+        Args:
+            cache_dir (str): Directory in which tokenized datasets are stored.
+            logger (Optional[logging.Logger]): Custom logger for tracking operations.
+        """
+        self.cache_dir = cache_dir
+        self.logger = logger or logging.getLogger(__name__)
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @staticmethod
+    def compute_key(data_path: str, tokenizer, max_length: int, packing: bool) -> str:
+        digest = hashlib.sha256()
+        digest.update(f"v{PIPELINE_VERSION}\0{tokenizer_fingerprint(tokenizer)}\0{max_length}\0{packing}\0".encode("utf-8"))
+        with open(data_path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def load_or_build(
+        self, data_path: str, tokenizer, max_length: int = 512, packing: bool = False
+    ) -> TokenizedQADataset:
+        """
+        Load the tokenized dataset for these settings, tokenizing and saving it on a miss.
+        """
+        key = self.compute_key(data_path, tokenizer, max_length, packing)
+        entry_dir = os.path.join(self.cache_dir, key)
+        if os.path.isfile(os.path.join(entry_dir, TokenizedQADataset.META_FILE)):
+            try:
+                dataset = TokenizedQADataset.load(entry_dir)
+                self.logger.info(f"Loaded tokenized dataset {key[:12]} ({len(dataset)} sequences).")
+                return dataset
+            except Exception as e:
+                self.logger.warning(f"Discarding unreadable tokenized dataset {key[:12]}: {e}")
+
+        start = time.perf_counter()
+        texts = [format_example(r["question"], r["answer"]) for r in iter_qa_records(data_path)]
+        dataset = TokenizedQADataset.build(texts, tokenizer, max_length, packing)
+        tmp_dir = tempfile.mkdtemp(prefix=f".{key[:12]}-", dir=self.cache_dir)
+        try:
+            dataset.save(tmp_dir)
+            with open(os.path.join(tmp_dir, TokenizedQADataset.META_FILE), "w", encoding="utf-8") as f:
+                json.dump({
+                    "version": PIPELINE_VERSION,
+                    "data": os.path.abspath(data_path),
+                    "examples": len(texts),
+                    "sequences": len(dataset),
+                    "tokens": int(dataset.offsets[-1]),
+                    "max_length": max_length,
+                    "packing": packing
+                }, f)
+            try:
+                os.replace(tmp_dir, entry_dir)
+            except OSError:
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+        except Exception:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+        self.logger.info(
+            f"Tokenized {len(texts)} examples into {len(dataset)} sequences in {time.perf_counter() - start:.2f}s."
+        )
+        return dataset
+
+
+class DynamicPaddingCollator:
+    """
+    Pads each batch to its longest sequence (rounded up to ``pad_to_multiple_of``) for causal
+    language modeling, and counts real and padded tokens.
+
+    Labels are the input ids with padding set to ``IGNORE_INDEX``. ``padding_ratio`` is the
+    fraction of all collated positions that were padding.
+
+    When a batch holds packed sequences (``position_ids`` restarting at 0 mid-sequence), the
+    2D padding mask is replaced by a 4D ``(batch, 1, length, length)`` additive mask that is
+    causal within each example and blocks attention across examples, and the first token of
+    every packed example after the first is not predicted from the one before it. Models take
+    such a mask as-is, so a model's own windowing (e.g. GPT-Neo's local attention layers) is
+    not applied on top of it.
+    """
+
+    def __init__(self, pad_token_id: int, pad_to_multiple_of: Optional[int] = 8):
+        self.pad_token_id = pad_token_id
+        self.pad_to_multiple_of = pad_to_multiple_of
+        self.real_tokens = 0
+        self.padded_tokens = 0
+
+    def __call__(self, features: List[Dict[str, List[int]]]) -> Dict[str, torch.Tensor]:
+        import torch
+        longest = max(len(f["input_ids"]) for f in features)
+        if self.pad_to_multiple_of:
+            longest = -(-longest // self.pad_to_multiple_of) * self.pad_to_multiple_of
+        batch = {
+            "input_ids": torch.full((len(features), longest), self.pad_token_id, dtype=torch.long),
+            "attention_mask": torch.zeros((len(features), longest), dtype=torch.long),
+            "labels": torch.full((len(features), longest), IGNORE_INDEX, dtype=torch.long)
+        }
+        with_positions = all("position_ids" in f for f in features)
+        if with_positions:
+            batch["position_ids"] = torch.zeros((len(features), longest), dtype=torch.long)
+        for row, feature in enumerate(features):
+            ids = torch.as_tensor(feature["input_ids"], dtype=torch.long)
+            batch["input_ids"][row, :len(ids)] = ids
+            batch["attention_mask"][row, :len(ids)] = 1
+            batch["labels"][row, :len(ids)] = ids
+            if with_positions:
+                batch["position_ids"][row, :len(ids)] = torch.as_tensor(feature["position_ids"], dtype=torch.long)
+        if with_positions and any(0 in f["position_ids"][1:] for f in features):
+            batch["attention_mask"] = self._packed_attention_mask(batch["position_ids"])
+            starts = batch["position_ids"] == 0
+            starts[:, 0] = False
+            batch["labels"][starts] = IGNORE_INDEX
+        real = sum(len(f["input_ids"]) for f in features)
+        self.real_tokens += real
+        self.padded_tokens += batch["input_ids"].numel() - real
+        return batch
+
+    @staticmethod
+    def _packed_attention_mask(position_ids: torch.Tensor) -> torch.Tensor:
+        """
+        Additive 4D mask (0 where attention is allowed, the dtype minimum elsewhere) letting
+        every token attend causally within its own example only.
+        """
+        import torch
+        # A position id of 0 opens a new segment. Padding positions (also 0) each become a
+        # one-token segment, so no row of the mask is fully blocked.
+        segments = torch.cumsum(position_ids == 0, dim=1)
+        length = position_ids.shape[1]
+        causal = torch.ones((length, length), dtype=torch.bool).tril()
+        allowed = (segments[:, :, None] == segments[:, None, :]) & causal
+        mask = torch.zeros(allowed.shape, dtype=torch.float32)
+        mask.masked_fill_(~allowed, torch.finfo(torch.float32).min)
+        return mask[:, None]
+
+    @property
+    def padding_ratio(self) -> float:
+        total = self.real_tokens + self.padded_tokens
+        return self.padded_tokens / total if total else 0.0
+
+    def reset(self) -> None:
+        self.real_tokens = 0
+        self.padded_tokens = 0
+
+
+def padding_ratio(lengths: Sequence[int], batches: Sequence[Sequence[int]], pad_to: Optional[int] = None) -> float:
+    """
+    Fraction of padding when the given batches of sequence indices are padded to their
+    longest member (or to ``pad_to`` for fixed-length padding).
+    """
+    real = padded = 0
+    for batch in batches:
+        width = pad_to or max(lengths[i] for i in batch)
+        real += sum(lengths[i] for i in batch)
+        padded += width * len(batch)
+    return 1.0 - real / padded if padded else 0.0
+
@@ -1,77 +1,150 @@
+"""
+Fine-tune a causal language model on the QA knowledge base.
+
+The data pipeline (``Model_finetuning.data_pipeline``) tokenizes the dataset once and caches it
+on disk, pads every batch only to its longest sequence, groups similar lengths into the same
+batches (``group_by_length``) and can pack several short QA pairs into one sequence
+(``--packing``). Training runs with fp16 on CUDA and in fp32 (or ``--bf16``) on CPU; tokens per
+second and the padding ratio are logged so the effect of these settings is visible.
+
+Usage (from the ``src`` directory):
+    python -m Model_finetuning.train_model --packing
+    python -m Model_finetuning.train_model --cpu --model EleutherAI/gpt-neo-125M --batch-size 8
+"""
+import os
+import sys
+import time
+import logging
+import argparse
 import torch
-from datasets import load_dataset
 from transformers import (
     AutoTokenizer,
     AutoModelForCausalLM,
     Trainer,
+    TrainerCallback,
     TrainingArguments,
-    DataCollatorForLanguageModeling,
+)
+from Model_finetuning.data_pipeline import DynamicPaddingCollator, TokenizedDatasetCache
+
+DEFAULT_DATA = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "..", "data", "knowledge_base", "cleaned_augmented_qa_pairs.json"
 )
 
-# Check if GPU is available
-device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-print(f"Using device: {device}")
+logger = logging.getLogger("train_model")
 
-# Path to your QA dataset JSON file
-data_file = r"C:\Users\moksh\classroom\chatbot_deepseek\industry_chatbot\data\knowledge_base\cleaned_augmented_qa_pairs.json"
 
-# Load the dataset
-dataset = load_dataset("json", data_files={"train": data_file})
+class ThroughputCallback(TrainerCallback):
+    """
+    Logs real (non-padding) tokens per second and the padding ratio counted by the collator.
+    """
 
-# Load the DialoGPT model and tokenizer
-model_checkpoint = "microsoft/DialoGPT-medium"  # You can use 'DialoGPT-small' or 'DialoGPT-large'
-tokenizer = AutoTokenizer.from_pretrained(model_checkpoint)
-model = AutoModelForCausalLM.from_pretrained(model_checkpoint)
+    def __init__(self, collator: DynamicPaddingCollator):
+        self.collator = collator
+        self.start = None
 
-# Move model to GPU
-model.to(device)
+    def on_train_begin(self, args, state, control, **kwargs):
+        self.collator.reset()
+        self.start = time.perf_counter()
 
-# Ensure the tokenizer has a padding token
-tokenizer.pad_token = tokenizer.eos_token  # Set padding token to EOS token
+    def _report(self) -> dict:
+        elapsed = max(time.perf_counter() - self.start, 1e-9)
+        return {
+            "tokens_per_second": round(self.collator.real_tokens / elapsed, 1),
+            "padded_positions_per_second": round(
+                (self.collator.real_tokens + self.collator.padded_tokens) / elapsed, 1
+            ),
+            "padding_ratio": round(self.collator.padding_ratio, 4)
+        }
 
-# Define preprocessing function
-def preprocess_function(examples):
-    inputs = [f"Question: {q}\nAnswer: {a}\n" for q, a in zip(examples["question"], examples["answer"])]
-    tokenized_inputs = tokenizer(
-        inputs,
-        truncation=True,
-        padding="max_length",
-        max_length=512,
+    def on_log(self, args, state, control, logs=None, **kwargs):
+        if self.start is not None:
+            logger.info(f"step {state.global_step}: {self._report()}")
+
+    def on_train_end(self, args, state, control, **kwargs):
+        logger.info(f"Training throughput: {self._report()} ({self.collator.real_tokens} tokens)")
+
+
+def training_arguments(args, use_cpu: bool) -> TrainingArguments:
+    """
+    Training arguments for the selected device: fp16 on CUDA, fp32 or bf16 on CPU.
+    """
+    return TrainingArguments(
+        output_dir=args.output_dir,
+        overwrite_output_dir=True,
+        num_train_epochs=args.epochs,
+        per_device_train_batch_size=args.batch_size,
+        gradient_accumulation_steps=args.gradient_accumulation_steps,
+        learning_rate=args.learning_rate,
+        save_steps=500,
+        save_total_limit=2,
+        logging_steps=args.logging_steps,
+        prediction_loss_only=True,
+        # Batches of similar lengths keep dynamic padding small.
+        group_by_length=not args.no_group_by_length,
+        use_cpu=use_cpu,
+        fp16=not use_cpu,  # Mixed precision on the GPU
+        bf16=use_cpu and args.bf16,
+        dataloader_num_workers=args.dataloader_workers,
+        report_to="none",  # Disable logging to external platforms
     )
-    return tokenized_inputs
 
-# Apply preprocessing
-tokenized_dataset = dataset["train"].map(
-    preprocess_function, batched=True, remove_columns=["question", "answer", "metadata"]
-)
 
-# Data collator
-data_collator = DataCollatorForLanguageModeling(tokenizer=tokenizer, mlm=False)
-
-# Training arguments
-training_args = TrainingArguments(
-    output_dir="./fine_tuned_model",
-    overwrite_output_dir=True,
-    num_train_epochs=3,
-    per_device_train_batch_size=2,  # Adjust for your GPU memory
-    save_steps=500,
-    save_total_limit=2,
-    prediction_loss_only=True,
-    fp16=True,  # Enable mixed precision for faster training
-    report_to="none",  # Disable logging to external platforms
-)
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fine-tune a causal LM on the QA knowledge base.")
+    parser.add_argument("--data", default=DEFAULT_DATA, help="QA pairs (JSON array or JSONL).")
+    parser.add_argument("--model", default="microsoft/DialoGPT-medium",
+                        help="Base checkpoint, e.g. microsoft/DialoGPT-small or EleutherAI/gpt-neo-125M.")
+    parser.add_argument("--output-dir", default="./fine_tuned_model")
+    parser.add_argument("--cache-dir", help="Tokenized dataset cache; defaults to tokenized_cache next to the data.")
+    parser.add_argument("--max-length", type=int, default=512)
+    parser.add_argument("--packing", action="store_true", help="Pack several QA pairs into each sequence.")
+    parser.add_argument("--no-group-by-length", action="store_true")
+    parser.add_argument("--epochs", type=float, default=3)
+    parser.add_argument("--batch-size", type=int, default=2)
+    parser.add_argument("--gradient-accumulation-steps", type=int, default=1)
+    parser.add_argument("--learning-rate", type=float, default=5e-5)
+    parser.add_argument("--logging-steps", type=int, default=50)
+    parser.add_argument("--cpu", action="store_true", help="Train on the CPU even if CUDA is available.")
+    parser.add_argument("--bf16", action="store_true", help="bf16 autocast on CPUs that support it.")
+    parser.add_argument("--threads", type=int, help="Torch threads for CPU training.")
+    parser.add_argument("--dataloader-workers", type=int, default=0)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 
-# Trainer initialization
-trainer = Trainer(
-    model=model,
-    args=training_args,
-    data_collator=data_collator,
-    train_dataset=tokenized_dataset,
-)
+    use_cpu = args.cpu or not torch.cuda.is_available()
+    if use_cpu and args.threads:
+        torch.set_num_threads(args.threads)
+    logger.info(f"Using device: {'cpu' if use_cpu else 'cuda'}")
+
+    tokenizer = AutoTokenizer.from_pretrained(args.model)
+    model = AutoModelForCausalLM.from_pretrained(args.model)
+    # Ensure the tokenizer has a padding token
+    if tokenizer.pad_token is None:
+        tokenizer.pad_token = tokenizer.eos_token
+
+    cache = TokenizedDatasetCache(
+        args.cache_dir or os.path.join(os.path.dirname(os.path.abspath(args.data)), "tokenized_cache")
+    )
+    train_dataset = cache.load_or_build(args.data, tokenizer, args.max_length, args.packing)
+    lengths = train_dataset.lengths()
+    logger.info(f"{len(train_dataset)} sequences, mean length {lengths.mean():.1f}, max {lengths.max()}")
+
+    collator = DynamicPaddingCollator(tokenizer.pad_token_id)
+    trainer = Trainer(
+        model=model,
+        args=training_arguments(args, use_cpu),
+        data_collator=collator,
+        train_dataset=train_dataset,
+        processing_class=tokenizer,
+        callbacks=[ThroughputCallback(collator)],
+    )
+    trainer.train()
+
+    # Save the fine-tuned model
+    trainer.save_model(args.output_dir)
+    tokenizer.save_pretrained(args.output_dir)
+    return 0
 
-# Start training
-trainer.train()
 
-# Save the fine-tuned model
-trainer.save_model("./fine_tuned_model")
-tokenizer.save_pretrained("./fine_tuned_model")
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+"""
+Asynchronous ASGI entry point for the policy QA service.
+
+Request handling runs on the event loop and never blocks on model work: every call into
+PolicyQASystem is handed to a bounded thread pool. When more than ``QA_MAX_PENDING`` calls are
+queued or running, new requests are rejected immediately with 503 instead of piling up, and a
+request that waits longer than ``QA_REQUEST_TIMEOUT`` seconds gets a 504.
+
+Run with any ASGI server, e.g. (from the ``src`` directory):
+    uvicorn asgi_app:app --port 5000
+"""
+import os
+import json
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+from urllib.parse import parse_qs
+from qa_service import qa_system
+
+POOL_WORKERS = int(os.environ.get('QA_POOL_WORKERS', 4))
+MAX_PENDING = int(os.environ.get('QA_MAX_PENDING', 32))
+REQUEST_TIMEOUT = float(os.environ.get('QA_REQUEST_TIMEOUT', 30))
+
+logger = logging.getLogger(__name__)
+
+
+class PoolSaturated(Exception):
+    """Raised when the inference pool already holds its maximum number of pending calls."""
+
+
+class InferencePool:
+    """
+    A bounded thread pool for blocking model calls with admission control and timeouts.
+
+    A slot is held from submission until the underlying call actually finishes (not merely
+    until the awaiting request times out), so abandoned work still counts against the limit.
+    """
+
+    def __init__(self, max_workers: int = 4, max_pending: int = 32, timeout: Optional[float] = 30.0):
+        """
+        Initialize the pool.
+
+        Args:
+            max_workers (int): Number of threads running model calls concurrently.
+            max_pending (int): Maximum number of calls queued or running before new ones are rejected.
+            timeout (Optional[float]): Seconds a caller waits for a result before giving up.
+        """
+        self.max_workers = max_workers
+        self.max_pending = max(max_pending, max_workers)
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="inference")
+        self._lock = threading.Lock()
+        self.pending = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    def _release(self, _future) -> None:
+        with self._lock:
+            self.pending -= 1
+
+    def submit(self, fn: Callable, *args: Any):
+        """
+        Submit a call to the pool, raising PoolSaturated if the queue is full.
+        """
+        with self._lock:
+            if self.pending >= self.max_pending:
+                self.rejected += 1
+                raise PoolSaturated()
+            self.pending += 1
+        try:
+            future = self._executor.submit(fn, *args)
+        except Exception:
+            self._release(None)
+            raise
+        future.add_done_callback(self._release)
+        return future
+
+    async def run(self, fn: Callable, *args: Any) -> Any:
+        """
+        Run a blocking call in the pool and await its result within the configured timeout.
+        """
+        future = self.submit(fn, *args)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+        except asyncio.TimeoutError:
+            # Drop the call if it has not started yet; a running call finishes in the background.
+            future.cancel()
+            self.record_timeout()
+            raise
+
+    def record_timeout(self) -> None:
+        with self._lock:
+            self.timed_out += 1
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "workers": self.max_workers,
+            "max_pending": self.max_pending,
+            "pending": self.pending,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out
+        }
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+pool = InferencePool(max_workers=POOL_WORKERS, max_pending=MAX_PENDING, timeout=REQUEST_TIMEOUT)
+
+CORS_HEADERS = [
+    (b'access-control-allow-origin', b'*'),
+    (b'access-control-allow-headers', b'content-type'),
+    (b'access-control-allow-methods', b'GET, POST, OPTIONS'),
+]
+
+
+async def _read_json(receive) -> Optional[dict]:
+    body = b''
+    while True:
+        message = await receive()
+        body += message.get('body', b'')
+        if not message.get('more_body'):
+            break
+    try:
+        data = json.loads(body or b'{}')
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+async def _send_json(send, status: int, payload: Any) -> None:
+    body = json.dumps(payload).encode('utf-8')
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())] + CORS_HEADERS
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def _query_from_request(scope, receive) -> Optional[str]:
+    if scope['method'] == 'GET':
+        return parse_qs(scope.get('query_string', b'').decode('utf-8')).get('query', [''])[0]
+    data = await _read_json(receive)
+    return None if data is None else data.get('query', '')
+
+
+async def ask_question(scope, receive, send) -> None:
+    query = await _query_from_request(scope, receive)
+    if not query:
+        await _send_json(send, 400, {"error": "No query provided"})
+        return
+    try:
+        response = await pool.run(qa_system.get_answer, query)
+    except PoolSaturated:
+        await _send_json(send, 503, {"error": "Server is busy, please retry shortly"})
+        return
+    except asyncio.TimeoutError:
+        await _send_json(send, 504, {"error": "Timed out while answering the query"})
+        return
+    await _send_json(send, 200, {"question": query, "answer": response})
+
+
+async def ask_question_stream(scope, receive, send) -> None:
+    """
+    Server-Sent-Events variant of /api/ask. The answer generator is drained on a pool thread
+    and each chunk is forwarded to the event loop as soon as it is produced.
+
+    The whole stream shares one ``QA_REQUEST_TIMEOUT`` deadline, counted from the request,
+    rather than a fresh timeout per chunk.
+    """
+    query = await _query_from_request(scope, receive)
+    if not query:
+        await _send_json(send, 400, {"error": "No query provided"})
+        return
+
+    loop = asyncio.get_running_loop()
+    deadline = None if pool.timeout is None else loop.time() + pool.timeout
+    chunks: asyncio.Queue = asyncio.Queue()
+    done, failed = object(), object()
+    abandoned = threading.Event()
+
+    def produce():
+        # After a timeout or disconnect the answer is still drained (the pool slot stays held
+        # until generation actually ends) but nothing more is queued for the closed response.
+        end = done
+        try:
+            for chunk in qa_system.stream_answer(query):
+                if not abandoned.is_set():
+                    loop.call_soon_threadsafe(chunks.put_nowait, chunk)
+        except Exception as e:
+            logger.error(f"Streaming answer failed: {e}")
+            end = failed
+        finally:
+            if not abandoned.is_set():
+                loop.call_soon_threadsafe(chunks.put_nowait, end)
+
+    try:
+        pool.submit(produce)
+    except PoolSaturated:
+        await _send_json(send, 503, {"error": "Server is busy, please retry shortly"})
+        return
+
+    await send({
+        'type': 'http.response.start',
+        'status': 200,
+        'headers': [(b'content-type', b'text/event-stream'), (b'cache-control', b'no-cache')] + CORS_HEADERS
+    })
+    try:
+        while True:
+            remaining = None if deadline is None else max(deadline - loop.time(), 0.0)
+            try:
+                chunk = await asyncio.wait_for(chunks.get(), remaining)
+            except asyncio.TimeoutError:
+                pool.record_timeout()
+                await send({'type': 'http.response.body', 'body': b'event: error\ndata: {"error": "timeout"}\n\n', 'more_body': True})
+                break
+            if chunk is done:
+                await send({'type': 'http.response.body', 'body': b'event: done\ndata: {}\n\n', 'more_body': True})
+                break
+            if chunk is failed:
+                await send({'type': 'http.response.body', 'body': b'event: error\ndata: {"error": "Failed to answer the query"}\n\n', 'more_body': True})
+                break
+            event = f"data: {json.dumps({'token': chunk})}\n\n".encode('utf-8')
+            await send({'type': 'http.response.body', 'body': event, 'more_body': True})
+    finally:
+        abandoned.set()
+    await send({'type': 'http.response.body', 'body': b''})
+
+
+async def pool_status(scope, receive, send) -> None:
+    await _send_json(send, 200, pool.stats())
+
+
+async def readiness(scope, receive, send) -> None:
+    status = qa_system.readiness()
+    ready = status['retrieval_model'] and status['index']
+    if parse_qs(scope.get('query_string', b'').decode('utf-8')).get('require', [''])[0] == 'generator':
+        ready = ready and status['generator']
+    status['ready'] = ready
+    await _send_json(send, 200 if ready else 503, status)
+
+
+async def metrics(scope, receive, send) -> None:
+    body = qa_system.render_metrics().encode('utf-8')
+    await send({
+        'type': 'http.response.start',
+        'status': 200,
+        'headers': [(b'content-type', b'text/plain; version=0.0.4'), (b'content-length', str(len(body)).encode())]
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+ROUTES = {
+    ('/api/ask', 'POST'): ask_question,
+    ('/api/ask/stream', 'GET'): ask_question_stream,
+    ('/api/ask/stream', 'POST'): ask_question_stream,
+    ('/api/pool', 'GET'): pool_status,
+    ('/api/ready', 'GET'): readiness,
+    ('/metrics', 'GET'): metrics,
+}
+
+
+async def app(scope, receive, send) -> None:
+    """
+    The ASGI application.
+    """
+    if scope['type'] == 'lifespan':
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                pool.shutdown()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+    if scope['type'] != 'http':
+        return
+
+    if scope['method'] == 'OPTIONS':
+        await send({'type': 'http.response.start', 'status': 204, 'headers': CORS_HEADERS})
+        await send({'type': 'http.response.body', 'body': b''})
+        return
+
+    handler = ROUTES.get((scope['path'], scope['method']))
+    if handler is None:
+        status = 405 if any(path == scope['path'] for path, _ in ROUTES) else 404
+        await _send_json(send, status, {"error": "Not found" if status == 404 else "Method not allowed"})
+        return
+    try:
+        await handler(scope, receive, send)
+    except Exception as e:
+        logger.error(f"Request handling failed: {e}")
+        await _send_json(send, 500, {"error": "Internal server error"})
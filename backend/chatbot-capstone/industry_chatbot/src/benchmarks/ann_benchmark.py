@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Recall-vs-latency benchmark for the FAISS index backends supported by ``build_faiss_index``.
+
+Synthetic corpora of increasing size are generated as clustered, L2-normalized vectors (policy
+questions form tight paraphrase clusters, so uniform random data would be unrealistically hard).
+For each corpus and backend the harness reports build time, recall@k against the exact flat
+index, p50/p99 single-query search latency and the serialized index size.
+
+Usage (from the ``src`` directory):
+    python -m benchmarks.ann_benchmark --sizes 1000 10000 100000 --output ann_results.json
+"""
+import sys
+import json
+import time
+import argparse
+import numpy as np
+import faiss
+from inference.inference import INDEX_TYPES, build_faiss_index
+
+
+def make_corpus(size: int, dim: int, num_queries: int, seed: int = 0):
+    """
+    Generate a clustered corpus and queries that are noisy copies of corpus vectors.
+    """
+    rng = np.random.default_rng(seed)
+    num_clusters = max(1, size // 20)
+    centers = rng.standard_normal((num_clusters, dim)).astype(np.float32)
+    assignments = rng.integers(0, num_clusters, size)
+    corpus = centers[assignments] + 0.35 * rng.standard_normal((size, dim)).astype(np.float32)
+    faiss.normalize_L2(corpus)
+    sources = rng.integers(0, size, num_queries)
+    queries = corpus[sources] + 0.25 * rng.standard_normal((num_queries, dim)).astype(np.float32)
+    queries = np.ascontiguousarray(queries, dtype=np.float32)
+    faiss.normalize_L2(queries)
+    return corpus, queries
+
+
+def recall_at_k(found: np.ndarray, truth: np.ndarray) -> float:
+    hits = sum(len(set(f) & set(t)) for f, t in zip(found, truth))
+    return hits / truth.size
+
+
+def benchmark_index(index: faiss.Index, queries: np.ndarray, k: int):
+    """
+    Time one query at a time (the serving pattern) and return results and latencies in ms.
+    """
+    latencies = np.empty(len(queries))
+    found = np.empty((len(queries), k), dtype=np.int64)
+    for i in range(len(queries)):
+        start = time.perf_counter()
+        _, ids = index.search(queries[i:i + 1], k)
+        latencies[i] = (time.perf_counter() - start) * 1000.0
+        found[i] = ids[0]
+    return found, latencies
+
+
+def run(sizes, dim, num_queries, k, index_types, threads):
+    faiss.omp_set_num_threads(threads)
+    results = []
+    for size in sizes:
+        corpus, queries = make_corpus(size, dim, num_queries)
+        ground_truth = None
+        for index_type in index_types:
+            start = time.perf_counter()
+            index = build_faiss_index(corpus, index_type)
+            build_seconds = time.perf_counter() - start
+            found, latencies = benchmark_index(index, queries, k)
+            if index_type == "flat":
+                ground_truth = found
+            elif ground_truth is None:
+                ground_truth = benchmark_index(build_faiss_index(corpus, "flat"), queries, k)[0]
+            row = {
+                "size": size,
+                "index_type": index_type,
+                "build_seconds": round(build_seconds, 4),
+                f"recall@{k}": round(recall_at_k(found, ground_truth if index_type != "flat" else found), 4),
+                "p50_ms": round(float(np.percentile(latencies, 50)), 4),
+                "p99_ms": round(float(np.percentile(latencies, 99)), 4),
+                "memory_mb": round(faiss.serialize_index(index).nbytes / 2 ** 20, 3)
+            }
+            results.append(row)
+            print(
+                f"{size:>8} {index_type:>6}  recall@{k}={row[f'recall@{k}']:.3f}  "
+                f"p50={row['p50_ms']:.3f}ms  p99={row['p99_ms']:.3f}ms  "
+                f"mem={row['memory_mb']:.2f}MB  build={row['build_seconds']:.2f}s"
+            )
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark FAISS index backends.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--dim", type=int, default=384, help="Embedding size (384 for all-MiniLM-L6-v2).")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--index-types", nargs="+", default=list(INDEX_TYPES), choices=INDEX_TYPES)
+    parser.add_argument("--threads", type=int, default=1, help="FAISS OpenMP threads.")
+    parser.add_argument("--output", help="Optional path for JSON results.")
+    args = parser.parse_args(argv)
+
+    results = run(args.sizes, args.dim, args.queries, args.k, args.index_types, args.threads)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+Parity check and CPU benchmark for the inference backends in ``inference.backends``.
+
+Each backend runs in its own subprocess so that load time and RSS are measured in isolation.
+The "torch" backend runs first and records reference outputs; every other backend is compared
+against them:
+
+* encoder parity: cosine similarity between reference and candidate query embeddings;
+* generator parity: top-1 agreement and max absolute difference of the first-step logits, and
+  the fraction of greedy tokens identical to the reference continuation.
+
+Usage (from the ``src`` directory):
+    python -m benchmarks.backend_benchmark --backends torch int8 onnx --output backends.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+import tempfile
+import numpy as np
+from benchmarks.memory import peak_rss_mb, rss_mb
+
+DEFAULT_DATA = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "..", "data", "knowledge_base", "cleaned_augmented_qa_pairs.json"
+)
+
+
+def sample_inputs(data_path: str, count: int):
+    """
+    Pick evenly spaced questions and their answers from the knowledge base.
+    """
+    with open(data_path, "r", encoding="utf-8") as f:
+        records = json.load(f)
+    step = max(1, len(records) // count)
+    picked = records[::step][:count]
+    return [r["question"] for r in picked], [r["answer"] for r in picked]
+
+
+def run_backend(args) -> dict:
+    import torch
+    from inference.backends import load_generator, load_retrieval_model
+    from inference.inference import build_policy_prompt
+
+    torch.set_num_threads(args.threads)
+    questions, answers = sample_inputs(args.data, args.samples)
+    prompts = [build_policy_prompt(q, a[:600]) for q, a in zip(questions, answers)]
+    baseline_rss = rss_mb()
+
+    start = time.perf_counter()
+    encoder = load_retrieval_model(args.retrieval_model, args.backend)
+    tokenizer, generator = load_generator(args.gen_model, args.backend)
+    if tokenizer.pad_token is None:
+        tokenizer.pad_token = tokenizer.eos_token
+    load_seconds = time.perf_counter() - start
+
+    # Encoder: batch latency over all sample questions and single-query latency.
+    embeddings = encoder.encode(questions, convert_to_numpy=True, normalize_embeddings=True)
+    batch_times, single_times = [], []
+    for _ in range(args.repeats):
+        start = time.perf_counter()
+        encoder.encode(questions, convert_to_numpy=True, normalize_embeddings=True)
+        batch_times.append(time.perf_counter() - start)
+        for q in questions[:8]:
+            start = time.perf_counter()
+            encoder.encode([q], convert_to_numpy=True)
+            single_times.append(time.perf_counter() - start)
+
+    # Generator: first-step logits and greedy continuation per prompt.
+    first_logits, continuations, gen_times, new_tokens = [], [], [], 0
+    with torch.inference_mode():
+        for prompt in prompts[:args.gen_samples]:
+            inputs = tokenizer(prompt, return_tensors="pt")
+            first_logits.append(generator(**inputs).logits[0, -1].float().numpy())
+            start = time.perf_counter()
+            output = generator.generate(
+                **inputs,
+                max_new_tokens=args.max_new_tokens,
+                do_sample=False,
+                pad_token_id=tokenizer.pad_token_id
+            )
+            gen_times.append(time.perf_counter() - start)
+            continuation = output[0, inputs["input_ids"].shape[1]:].numpy()
+            new_tokens += len(continuation)
+            continuations.append(np.pad(continuation, (0, args.max_new_tokens - len(continuation)), constant_values=-1))
+
+    result = {
+        "backend": args.backend,
+        "load_seconds": round(load_seconds, 3),
+        "encode_batch_ms_p50": round(float(np.median(batch_times)) * 1000, 3),
+        "encode_single_ms_p50": round(float(np.median(single_times)) * 1000, 3),
+        "generate_ms_p50": round(float(np.median(gen_times)) * 1000, 3),
+        "generate_tokens_per_second": round(new_tokens / sum(gen_times), 2),
+        "rss_mb": round(rss_mb(), 1),
+        "model_rss_mb": round(rss_mb() - baseline_rss, 1),
+        "peak_rss_mb": round(peak_rss_mb(), 1)
+    }
+
+    if args.backend == "torch":
+        np.savez(args.reference, embeddings=embeddings, logits=np.stack(first_logits), tokens=np.stack(continuations))
+    else:
+        reference = np.load(args.reference)
+        cosine = np.sum(reference["embeddings"] * embeddings, axis=1)
+        logits = np.stack(first_logits)
+        tokens = np.stack(continuations)
+        result["parity"] = {
+            "embedding_cosine_min": round(float(cosine.min()), 5),
+            "embedding_cosine_mean": round(float(cosine.mean()), 5),
+            "first_token_top1_agreement": round(float(np.mean(
+                reference["logits"].argmax(axis=1) == logits.argmax(axis=1)
+            )), 4),
+            "first_token_logit_max_abs_diff": round(float(np.abs(reference["logits"] - logits).max()), 5),
+            "greedy_token_agreement": round(float(np.mean(reference["tokens"] == tokens)), 4)
+        }
+        result["parity"]["passed"] = (
+            result["parity"]["embedding_cosine_min"] >= args.min_cosine
+            and result["parity"]["first_token_top1_agreement"] >= args.min_top1
+        )
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Parity check and benchmark for CPU inference backends.")
+    parser.add_argument("--backends", nargs="+", default=["torch", "int8", "onnx"])
+    parser.add_argument("--retrieval-model", default="sentence-transformers/all-MiniLM-L6-v2")
+    parser.add_argument("--gen-model", default="EleutherAI/gpt-neo-125M")
+    parser.add_argument("--data", default=DEFAULT_DATA)
+    parser.add_argument("--samples", type=int, default=32, help="Questions used for encoder timing and parity.")
+    parser.add_argument("--gen-samples", type=int, default=4, help="Prompts used for generator timing and parity.")
+    parser.add_argument("--max-new-tokens", type=int, default=32)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--threads", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--min-cosine", type=float, default=0.98)
+    parser.add_argument("--min-top1", type=float, default=0.75)
+    parser.add_argument("--output", help="Optional path for JSON results.")
+    parser.add_argument("--backend", help=argparse.SUPPRESS)
+    parser.add_argument("--reference", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.backend:
+        # Worker mode: benchmark a single backend and print its result as JSON.
+        print(json.dumps(run_backend(args)))
+        return 0
+
+    backends = ["torch"] + [b for b in args.backends if b != "torch"]
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        reference = os.path.join(tmp_dir, "reference.npz")
+        passthrough = [
+            "--retrieval-model", args.retrieval_model, "--gen-model", args.gen_model, "--data", args.data,
+            "--samples", str(args.samples), "--gen-samples", str(args.gen_samples),
+            "--max-new-tokens", str(args.max_new_tokens), "--repeats", str(args.repeats),
+            "--threads", str(args.threads), "--min-cosine", str(args.min_cosine), "--min-top1", str(args.min_top1),
+            "--reference", reference
+        ]
+        for backend in backends:
+            proc = subprocess.run(
+                [sys.executable, "-m", "benchmarks.backend_benchmark", "--backend", backend] + passthrough,
+                capture_output=True, text=True
+            )
+            if proc.returncode != 0:
+                print(f"{backend}: failed\n{proc.stderr[-2000:]}", file=sys.stderr)
+                results.append({"backend": backend, "error": proc.stderr.strip().splitlines()[-1:]})
+                continue
+            result = json.loads(proc.stdout.strip().splitlines()[-1])
+            results.append(result)
+            parity = result.get("parity", {})
+            print(
+                f"{backend:>6}  load={result['load_seconds']:.2f}s  "
+                f"encode(batch)={result['encode_batch_ms_p50']:.1f}ms  encode(1)={result['encode_single_ms_p50']:.2f}ms  "
+                f"generate={result['generate_ms_p50']:.1f}ms ({result['generate_tokens_per_second']:.1f} tok/s)  "
+                f"model_rss={result['model_rss_mb']:.0f}MB"
+                + (f"  parity={'ok' if parity['passed'] else 'FAILED'} "
+                   f"(cos_min={parity['embedding_cosine_min']:.4f}, top1={parity['first_token_top1_agreement']:.2f})"
+                   if parity else "")
+            )
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    return 0 if all(r.get("parity", {}).get("passed", "error" not in r) for r in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,338 @@
+#!/usr/bin/env python3
+"""
+Reproducible, offline end-to-end benchmark for PolicyQASystem and the Flask API.
+
+By default every stage runs against the bundled knowledge base and the seeded tiny models
+from ``benchmarks.tiny_models``, so no network access or model download is needed; pass
+``--retrieval-model``/``--gen-model`` to benchmark real checkpoints instead. Each stage runs in
+its own subprocess so timings and peak RSS are isolated:
+
+* cold_start: import and ``PolicyQASystem`` construction time, first with an empty index
+  cache (encode + build) and then with the persisted index (load only);
+* latency: ``get_answer`` latency per answer path with the answer cache disabled. The
+  retrieval path uses paraphrased knowledge-base questions with a threshold of -1 and the
+  generation path the same queries with a threshold above 1, so the split does not depend on
+  the encoder's similarity scores. Per-stage timings come from ``PipelineMetrics``;
+* api: requests/second and latency for ``POST /api/ask`` at several concurrency levels, served
+  by a threaded WSGI server in the worker process (micro-batching included).
+
+Results are written as JSON; ``--compare`` prints the relative change of every numeric metric
+against an earlier results file.
+
+Usage (from the ``src`` directory):
+    python -m benchmarks.e2e_benchmark --output e2e.json
+    python -m benchmarks.e2e_benchmark --output e2e_new.json --compare e2e.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import subprocess
+import tempfile
+import threading
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+import numpy as np
+from benchmarks.memory import peak_rss_mb, rss_mb
+
+DEFAULT_DATA = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "..", "data", "knowledge_base", "cleaned_augmented_qa_pairs.json"
+)
+
+STAGES = ("cold_start", "latency", "api")
+
+# Prefixes turn knowledge-base questions into distinct but answerable queries.
+PARAPHRASES = ("{}", "Could you tell me: {}", "I would like to know, {}", "Quick question - {}")
+
+
+def load_queries(data_path: str, count: int, seed: int) -> List[str]:
+    """
+    Deterministically sample ``count`` distinct paraphrased knowledge-base questions.
+    """
+    with open(data_path, "r", encoding="utf-8") as f:
+        questions = sorted({record["question"] for record in json.load(f)})
+    rng = np.random.default_rng(seed)
+    queries = [template.format(q) for template in PARAPHRASES for q in questions]
+    picked = rng.choice(len(queries), size=min(count, len(queries)), replace=False)
+    return [queries[i] for i in picked]
+
+
+def summarize(latencies: List[float]) -> Dict[str, float]:
+    values = np.asarray(latencies) * 1000.0
+    return {
+        "count": len(values),
+        "mean_ms": round(float(values.mean()), 3),
+        "p50_ms": round(float(np.percentile(values, 50)), 3),
+        "p95_ms": round(float(np.percentile(values, 95)), 3),
+        "p99_ms": round(float(np.percentile(values, 99)), 3)
+    }
+
+
+def _seed(seed: int) -> None:
+    import torch
+    np.random.seed(seed)
+    torch.manual_seed(seed)
+
+
+def run_cold_start(args) -> dict:
+    start = time.perf_counter()
+    from inference.inference import PolicyQASystem
+    import_seconds = time.perf_counter() - start
+    baseline_rss = rss_mb()
+
+    start = time.perf_counter()
+    qa_system = PolicyQASystem(
+        args.data, args.retrieval_model, args.gen_model, index_cache_dir=args.index_cache_dir
+    )
+    init_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    qa_system.get_answer(load_queries(args.data, 1, args.seed)[0], confidence_threshold=-1.0)
+    first_answer_seconds = time.perf_counter() - start
+    return {
+        "import_seconds": round(import_seconds, 3),
+        "init_seconds": round(init_seconds, 3),
+        "first_answer_seconds": round(first_answer_seconds, 3),
+        "total_seconds": round(import_seconds + init_seconds + first_answer_seconds, 3),
+        "entries": len(qa_system.kb),
+        "generator_loaded": qa_system.generator_loaded,
+        "rss_mb": round(rss_mb(), 1),
+        "system_rss_mb": round(rss_mb() - baseline_rss, 1),
+        "peak_rss_mb": round(peak_rss_mb(), 1)
+    }
+
+
+def _stage_breakdown(metrics) -> Dict[str, float]:
+    """
+    Mean milliseconds per call of every pipeline stage recorded so far.
+    """
+    breakdown = {}
+    for stage in metrics.stage_seconds.label_values():
+        count, total = metrics.stage_seconds.totals(stage)
+        breakdown[stage] = round(total / count * 1000.0, 3) if count else 0.0
+    return breakdown
+
+
+def run_latency(args) -> dict:
+    from inference.inference import PolicyQASystem
+    from inference.metrics import PipelineMetrics
+
+    _seed(args.seed)
+    queries = load_queries(args.data, args.queries, args.seed)
+    result = {}
+    # Confidence is at most 1, so a threshold above it sends every query to the generator; the
+    # generation run also disables hybrid retrieval, whose exact-term shortcut answers before
+    # any threshold is checked.
+    for path, threshold, hybrid, count in (
+        ("retrieval", -1.0, True, len(queries)),
+        ("generation", 1.01, False, min(args.generation_queries, len(queries)))
+    ):
+        qa_system = PolicyQASystem(
+            args.data, args.retrieval_model, args.gen_model,
+            index_cache_dir=args.index_cache_dir, use_answer_cache=False, hybrid_retrieval=hybrid
+        )
+        for query in queries[:args.warmup]:
+            qa_system.get_answer(query, confidence_threshold=threshold)
+        # Only count the timed queries.
+        metrics = qa_system.metrics = PipelineMetrics()
+        latencies = []
+        for query in queries[:count]:
+            start = time.perf_counter()
+            qa_system.get_answer(query, confidence_threshold=threshold)
+            latencies.append(time.perf_counter() - start)
+        result[path] = summarize(latencies)
+        result[path]["stages_mean_ms"] = _stage_breakdown(metrics)
+        if path == "generation":
+            count, total = metrics.generated_tokens.totals()
+            result[path]["generated_tokens_mean"] = round(total / max(count, 1), 1)
+    result["peak_rss_mb"] = round(peak_rss_mb(), 1)
+    return result
+
+
+def run_api(args) -> dict:
+    os.environ.update({
+        "QA_DATA_PATH": args.data,
+        "QA_RETRIEVAL_MODEL": args.retrieval_model,
+        "QA_GEN_MODEL": args.gen_model,
+        "QA_INDEX_CACHE_DIR": args.index_cache_dir,
+        "QA_ANSWER_CACHE": "1" if args.api_cache else "0"
+    })
+    _seed(args.seed)
+    from werkzeug.serving import make_server
+    import App
+
+    server = make_server("127.0.0.1", 0, App.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/api/ask"
+    queries = load_queries(args.data, args.requests, args.seed)
+
+    def ask(query: str) -> float:
+        body = json.dumps({"query": query}).encode("utf-8")
+        request = urllib.request.Request(url, data=body, headers={"Content-Type": "application/json"})
+        start = time.perf_counter()
+        with urllib.request.urlopen(request, timeout=args.request_timeout) as response:
+            response.read()
+        return time.perf_counter() - start
+
+    result = {"cache_enabled": args.api_cache}
+    try:
+        for query in queries[:args.warmup]:
+            ask(query)
+        for concurrency in args.concurrency:
+            latencies, errors = [], 0
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                futures = [executor.submit(ask, query) for query in queries]
+                for future in futures:
+                    try:
+                        latencies.append(future.result())
+                    except Exception:
+                        errors += 1
+            elapsed = time.perf_counter() - start
+            row = summarize(latencies) if latencies else {"count": 0}
+            row.update({
+                "errors": errors,
+                "seconds": round(elapsed, 3),
+                "requests_per_second": round(len(latencies) / elapsed, 2)
+            })
+            result[f"concurrency_{concurrency}"] = row
+    finally:
+        server.shutdown()
+    result["peak_rss_mb"] = round(peak_rss_mb(), 1)
+    return result
+
+
+def flatten(results: dict, prefix: str = "") -> Dict[str, float]:
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}.{key}" if prefix else key
+        if isinstance(value, dict):
+            flat.update(flatten(value, name))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def compare(current: dict, baseline: dict) -> None:
+    """
+    Print the relative change of every numeric metric present in both result files.
+    """
+    old = flatten({k: v for k, v in baseline.items() if k != "environment"})
+    new = flatten({k: v for k, v in current.items() if k != "environment"})
+    for name in sorted(set(old) & set(new)):
+        if old[name]:
+            change = (new[name] - old[name]) / abs(old[name]) * 100.0
+            print(f"{name:<60} {old[name]:>12.3f} -> {new[name]:>12.3f}  ({change:+.1f}%)")
+
+
+def environment(args) -> dict:
+    import torch
+    import transformers
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "threads": args.threads,
+        "torch": torch.__version__,
+        "transformers": transformers.__version__,
+        "retrieval_model": args.retrieval_model,
+        "gen_model": args.gen_model,
+        "data": os.path.abspath(args.data),
+        "seed": args.seed
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline end-to-end benchmark for the policy QA service.")
+    parser.add_argument("--stages", nargs="+", default=list(STAGES), choices=STAGES)
+    parser.add_argument("--data", default=DEFAULT_DATA)
+    parser.add_argument("--retrieval-model", help="Defaults to the tiny offline encoder.")
+    parser.add_argument("--gen-model", help="Defaults to the tiny offline generator.")
+    parser.add_argument("--model-dir", default=os.path.join(tempfile.gettempdir(), "policy_qa_tiny_models"),
+                        help="Where the tiny offline models are built and reused.")
+    parser.add_argument("--queries", type=int, default=200, help="Queries timed on the retrieval path.")
+    parser.add_argument("--generation-queries", type=int, default=20, help="Queries timed on the generation path.")
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--requests", type=int, default=200, help="Requests per API concurrency level.")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--api-cache", action="store_true", help="Keep the answer cache enabled for the API stage.")
+    parser.add_argument("--request-timeout", type=float, default=120.0)
+    parser.add_argument("--threads", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Optional path for JSON results.")
+    parser.add_argument("--compare", help="Earlier results file to compare against.")
+    parser.add_argument("--stage", choices=STAGES, help=argparse.SUPPRESS)
+    parser.add_argument("--index-cache-dir", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.stage:
+        # Worker mode: run a single stage and print its result as JSON.
+        import torch
+        torch.set_num_threads(args.threads)
+        runner = {"cold_start": run_cold_start, "latency": run_latency, "api": run_api}[args.stage]
+        print(json.dumps(runner(args)))
+        return 0
+
+    if not args.retrieval_model or not args.gen_model:
+        from benchmarks.tiny_models import build_tiny_models
+        encoder, generator = build_tiny_models(args.model_dir, args.data, args.seed)
+        args.retrieval_model = args.retrieval_model or encoder
+        args.gen_model = args.gen_model or generator
+
+    results = {"environment": environment(args)}
+    passthrough = [
+        "--data", args.data, "--retrieval-model", args.retrieval_model, "--gen-model", args.gen_model,
+        "--queries", str(args.queries), "--generation-queries", str(args.generation_queries),
+        "--warmup", str(args.warmup), "--requests", str(args.requests),
+        "--concurrency", *map(str, args.concurrency), "--request-timeout", str(args.request_timeout),
+        "--threads", str(args.threads), "--seed", str(args.seed)
+    ] + (["--api-cache"] if args.api_cache else [])
+
+    failed = []
+
+    def run_stage(stage: str, index_cache_dir: str) -> dict:
+        proc = subprocess.run(
+            [sys.executable, "-m", "benchmarks.e2e_benchmark", "--stage", stage, "--index-cache-dir", index_cache_dir]
+            + passthrough,
+            capture_output=True, text=True
+        )
+        if proc.returncode != 0:
+            print(f"{stage}: failed\n{proc.stderr[-2000:]}", file=sys.stderr)
+            failed.append(stage)
+            return {"error": proc.stderr.strip().splitlines()[-1:]}
+        return json.loads(proc.stdout.strip().splitlines()[-1])
+
+    with tempfile.TemporaryDirectory() as index_cache_dir:
+        for stage in args.stages:
+            if stage == "cold_start":
+                # The first run encodes the knowledge base and persists the index; the second loads it.
+                results[stage] = {
+                    "uncached_index": run_stage(stage, index_cache_dir),
+                    "cached_index": run_stage(stage, index_cache_dir)
+                }
+            else:
+                results[stage] = run_stage(stage, index_cache_dir)
+            print(f"{stage}: {json.dumps(results[stage])}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            compare(results, json.load(f))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
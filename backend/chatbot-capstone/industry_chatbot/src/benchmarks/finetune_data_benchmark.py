@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+CPU benchmark for the fine-tuning data pipeline (``Model_finetuning.data_pipeline``).
+
+For each batching strategy it reports the padding ratio over one full epoch and the training
+throughput (real, non-padding tokens per second of forward + backward + optimizer step) over
+``--steps`` batches:
+
+* ``max_length``: every sequence padded to ``--max-length`` in random order (the original
+  ``train_model.py`` behaviour);
+* ``dynamic``: random order, each batch padded to its longest sequence;
+* ``grouped``: dynamic padding with length-grouped batches (``group_by_length``);
+* ``packed``: several QA pairs packed per sequence, then grouped and dynamically padded.
+
+It also times tokenizing the dataset against loading it from the tokenized dataset cache.
+Runs against the tiny offline generator by default (``--full-size`` for gpt-neo-125M
+dimensions, or ``--model`` for a real checkpoint).
+
+Usage (from the ``src`` directory):
+    python -m benchmarks.finetune_data_benchmark --output finetune_data.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+from typing import Dict, List
+import numpy as np
+from benchmarks.e2e_benchmark import DEFAULT_DATA
+
+STRATEGIES = ("max_length", "dynamic", "grouped", "packed")
+
+
+def epoch_batches(dataset, strategy: str, batch_size: int, seed: int) -> List[List[int]]:
+    import torch
+    from transformers.trainer_pt_utils import LengthGroupedSampler
+    generator = torch.Generator().manual_seed(seed)
+    if strategy in ("grouped", "packed"):
+        order = list(LengthGroupedSampler(batch_size, lengths=dataset.lengths().tolist(), generator=generator))
+    else:
+        order = torch.randperm(len(dataset), generator=generator).tolist()
+    return [order[i:i + batch_size] for i in range(0, len(order), batch_size)]
+
+
+def run_strategy(model, dataset, strategy: str, args) -> Dict[str, float]:
+    import torch
+    from Model_finetuning.data_pipeline import DynamicPaddingCollator, padding_ratio
+    batches = epoch_batches(dataset, strategy, args.batch_size, args.seed)
+    lengths = dataset.lengths()
+    ratio = padding_ratio(lengths, batches, pad_to=args.max_length if strategy == "max_length" else None)
+
+    # Padding every batch up to a multiple of max_length pads it to exactly max_length.
+    collator = DynamicPaddingCollator(
+        args.pad_token_id, pad_to_multiple_of=args.max_length if strategy == "max_length" else 8
+    )
+    optimizer = torch.optim.AdamW(model.parameters(), lr=1e-5)
+    model.train()
+    timed = batches[:args.steps + 1]
+    elapsed = 0.0
+    for step, batch in enumerate(timed):
+        start = time.perf_counter()
+        inputs = collator([dataset[i] for i in batch])
+        loss = model(**inputs).loss
+        loss.backward()
+        optimizer.step()
+        optimizer.zero_grad(set_to_none=True)
+        if step == 0:
+            # The first step pays for allocator and kernel warm-up.
+            collator.reset()
+        else:
+            elapsed += time.perf_counter() - start
+    return {
+        "sequences": len(dataset),
+        "epoch_padding_ratio": round(ratio, 4),
+        "epoch_steps": len(batches),
+        "tokens_per_second": round(collator.real_tokens / max(elapsed, 1e-9), 1),
+        "padded_positions_per_second": round((collator.real_tokens + collator.padded_tokens) / max(elapsed, 1e-9), 1),
+        "step_seconds": round(elapsed / max(len(timed) - 1, 1), 4)
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark padding, grouping and packing for fine-tuning.")
+    parser.add_argument("--data", default=DEFAULT_DATA)
+    parser.add_argument("--model", help="Defaults to the tiny offline generator.")
+    parser.add_argument("--full-size", action="store_true", help="Random generator with gpt-neo-125M dimensions.")
+    parser.add_argument("--model-dir", default=os.path.join(tempfile.gettempdir(), "policy_qa_tiny_models"))
+    parser.add_argument("--strategies", nargs="+", default=list(STRATEGIES), choices=STRATEGIES)
+    parser.add_argument("--max-length", type=int, default=512)
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--steps", type=int, default=10, help="Timed training steps per strategy.")
+    parser.add_argument("--threads", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Optional path for JSON results.")
+    args = parser.parse_args(argv)
+
+    import torch
+    from transformers import AutoModelForCausalLM, AutoTokenizer
+    from Model_finetuning.data_pipeline import TokenizedDatasetCache
+    torch.set_num_threads(args.threads)
+    if not args.model:
+        from benchmarks.tiny_models import build_full_size_generator, build_tiny_models
+        if args.full_size:
+            args.model = build_full_size_generator(args.model_dir, args.data, args.seed)
+        else:
+            args.model = build_tiny_models(args.model_dir, args.data, args.seed)[1]
+
+    tokenizer = AutoTokenizer.from_pretrained(args.model)
+    if tokenizer.pad_token is None:
+        tokenizer.pad_token = tokenizer.eos_token
+    args.pad_token_id = tokenizer.pad_token_id
+    results = {"model": args.model, "threads": args.threads, "batch_size": args.batch_size,
+               "max_length": args.max_length}
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cache = TokenizedDatasetCache(cache_dir)
+        start = time.perf_counter()
+        cache.load_or_build(args.data, tokenizer, args.max_length, packing=False)
+        tokenize_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        plain = cache.load_or_build(args.data, tokenizer, args.max_length, packing=False)
+        load_seconds = time.perf_counter() - start
+        packed = cache.load_or_build(args.data, tokenizer, args.max_length, packing=True)
+        results["tokenization"] = {
+            "tokenize_seconds": round(tokenize_seconds, 4),
+            "cached_load_seconds": round(load_seconds, 4),
+            "examples": len(plain),
+            "tokens": int(plain.offsets[-1])
+        }
+
+        for strategy in args.strategies:
+            torch.manual_seed(args.seed)
+            model = AutoModelForCausalLM.from_pretrained(args.model)
+            results[strategy] = run_strategy(model, packed if strategy == "packed" else plain, strategy, args)
+            row = results[strategy]
+            print(f"{strategy:>10}: padding={row['epoch_padding_ratio']:.1%}  steps/epoch={row['epoch_steps']}  "
+                  f"tokens/s={row['tokens_per_second']:.0f}  step={row['step_seconds'] * 1000:.1f}ms")
+    print(f"tokenization: {results['tokenization']}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,356 @@
+#!/usr/bin/env python3
+"""
+Load generator for the Flask API: replays a seeded mix of queries against ``POST /api/ask``
+at fixed concurrency levels and, optionally, a fixed arrival rate.
+
+Queries are drawn from the shipped knowledge base, one kind per answer path:
+
+* small_talk: greetings, thanks and help requests answered by the router;
+* hit: paraphrased knowledge-base questions (high-confidence retrieval);
+* fallback: fragments of knowledge-base answers that no question covers, which fall through
+  to generation.
+
+With ``--rate`` requests arrive as a Poisson process (open loop) and latency is measured from
+each request's scheduled arrival, so queueing in front of a saturated server is included;
+``--concurrency`` then caps the requests in flight. Without it every worker sends its next
+request as soon as the previous one returns (closed loop).
+
+Unless ``--url`` points at a running server (e.g. ``prefork.py``), the app is started in-process
+on a threaded WSGI server with the "fake" inference backend (``inference.fake_models``), so runs
+are hermetic and model latency is fixed by ``--fake-latency``. The report has throughput,
+latency percentiles overall and per query kind, errors (HTTP errors, timeouts and error
+answers) and how many answers took each path, from the server's ``qa_answers_total`` counter.
+
+Usage (from the ``src`` directory):
+    python -m benchmarks.load_test --concurrency 1 8 32 --requests 500
+    python -m benchmarks.load_test --rate 50 --duration 30 --mix small_talk=0.1,hit=0.6,fallback=0.3
+    python -m benchmarks.load_test --fake-latency '{"token_ms": 5}' --batch-size 16 --output load.json
+    python -m benchmarks.load_test --url http://127.0.0.1:5000 --concurrency 16
+"""
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import logging
+import tempfile
+import threading
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
+import numpy as np
+from benchmarks.e2e_benchmark import DEFAULT_DATA, load_queries
+
+QUERY_KINDS = ("small_talk", "hit", "fallback")
+DEFAULT_MIX = "small_talk=0.1,hit=0.6,fallback=0.3"
+
+SMALL_TALK = (
+    "hi", "Hello!", "hey there", "Thanks", "thank you so much", "cheers",
+    "help", "What can you do?", "who are you"
+)
+
+# Answer fragments are phrased as questions, like a user quoting a passage of a policy.
+FALLBACK_TEMPLATES = ("What does this mean: {}?", "Can you explain \"{}\"?", "{}?")
+FALLBACK_WORDS = (6, 12)
+
+ERROR_ANSWER = re.compile(r"^I encountered an error while")
+ANSWER_METRIC = re.compile(r'^qa_answers_total\{path="(?P<path>[^"]+)"\} (?P<value>\S+)$', re.MULTILINE)
+
+
+def parse_mix(mix: str) -> Dict[str, float]:
+    """
+    Parse ``kind=weight,...`` into normalized weights over ``QUERY_KINDS``.
+    """
+    weights = {}
+    for item in mix.split(","):
+        kind, _, weight = item.partition("=")
+        kind = kind.strip()
+        if kind not in QUERY_KINDS:
+            raise ValueError(f"Unknown query kind '{kind}'; expected one of {QUERY_KINDS}")
+        weights[kind] = float(weight)
+    total = sum(weights.values())
+    if total <= 0 or any(weight < 0 for weight in weights.values()):
+        raise ValueError(f"Mix weights must be non-negative and not all zero: {mix}")
+    return {kind: weight / total for kind, weight in weights.items() if weight > 0}
+
+
+def fallback_queries(data_path: str, count: int, seed: int) -> List[str]:
+    """
+    Deterministically cut ``count`` word windows out of knowledge-base answers.
+    """
+    with open(data_path, "r", encoding="utf-8") as f:
+        answers = sorted({record["answer"] for record in json.load(f)})
+    rng = np.random.default_rng(seed)
+    queries = []
+    while len(queries) < count:
+        words = answers[rng.integers(len(answers))].split()
+        length = int(rng.integers(*FALLBACK_WORDS))
+        if len(words) < length:
+            continue
+        start = int(rng.integers(len(words) - length + 1))
+        fragment = " ".join(words[start:start + length]).strip(" .,;:")
+        queries.append(FALLBACK_TEMPLATES[len(queries) % len(FALLBACK_TEMPLATES)].format(fragment))
+    return queries
+
+
+def build_query_pool(data_path: str, seed: int, size: int = 1000) -> Dict[str, List[str]]:
+    return {
+        "small_talk": list(SMALL_TALK),
+        "hit": load_queries(data_path, size, seed),
+        "fallback": fallback_queries(data_path, size, seed)
+    }
+
+
+def request_stream(pool: Dict[str, List[str]], mix: Dict[str, float], rate: float, seed: int) -> Iterator[Tuple[float, str, str]]:
+    """
+    Endless seeded stream of ``(arrival offset in seconds, kind, query)``; offsets are Poisson
+    arrivals at ``rate`` per second, or all 0 for a closed loop.
+    """
+    rng = np.random.default_rng(seed)
+    kinds = list(mix)
+    weights = [mix[kind] for kind in kinds]
+    arrival = 0.0
+    while True:
+        kind = kinds[rng.choice(len(kinds), p=weights)]
+        queries = pool[kind]
+        if rate > 0:
+            arrival += float(rng.exponential(1.0 / rate))
+        yield arrival, kind, queries[rng.integers(len(queries))]
+
+
+def ask(url: str, query: str, timeout: float) -> str:
+    """
+    Send one query; returns "ok", "error_answer", "http_error" or "timeout".
+    """
+    body = json.dumps({"query": query}).encode("utf-8")
+    request = urllib.request.Request(url, data=body, headers={"Content-Type": "application/json"})
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            answer = json.loads(response.read().decode("utf-8")).get("answer", "")
+    except urllib.error.HTTPError:
+        return "http_error"
+    except (TimeoutError, OSError) as e:
+        # urllib wraps socket timeouts raised while connecting in URLError.
+        if isinstance(e, TimeoutError) or isinstance(getattr(e, "reason", None), TimeoutError):
+            return "timeout"
+        return "http_error"
+    return "error_answer" if ERROR_ANSWER.match(answer) else "ok"
+
+
+def scrape_answer_paths(base_url: str) -> Dict[str, float]:
+    try:
+        with urllib.request.urlopen(f"{base_url}/metrics", timeout=10) as response:
+            text = response.read().decode("utf-8")
+    except OSError:
+        return {}
+    return {match["path"]: float(match["value"]) for match in ANSWER_METRIC.finditer(text)}
+
+
+def percentiles(latencies: List[float]) -> Dict[str, float]:
+    if not latencies:
+        return {"count": 0}
+    values = np.asarray(latencies) * 1000.0
+    summary = {"count": len(values), "mean_ms": round(float(values.mean()), 3)}
+    for q in (50, 90, 95, 99):
+        summary[f"p{q}_ms"] = round(float(np.percentile(values, q)), 3)
+    summary["max_ms"] = round(float(values.max()), 3)
+    return summary
+
+
+def run_level(
+    base_url: str,
+    pool: Dict[str, List[str]],
+    mix: Dict[str, float],
+    concurrency: int,
+    rate: float,
+    requests: int,
+    duration: Optional[float],
+    timeout: float,
+    seed: int
+) -> dict:
+    """
+    Drive one concurrency level and summarize it.
+    """
+    url = f"{base_url}/api/ask"
+    stream = request_stream(pool, mix, rate, seed)
+    lock = threading.Lock()
+    results: List[Tuple[str, float, str]] = []
+    sent = 0
+    paths_before = scrape_answer_paths(base_url)
+    start = time.perf_counter()
+    deadline = start + duration if duration else None
+
+    def next_request() -> Optional[Tuple[float, str, str]]:
+        nonlocal sent
+        with lock:
+            if deadline is None and sent >= requests:
+                return None
+            arrival, kind, query = next(stream)
+            if deadline is not None and (start + arrival if rate > 0 else time.perf_counter()) >= deadline:
+                return None
+            sent += 1
+            return arrival, kind, query
+
+    def send(arrival: float, kind: str, query: str) -> None:
+        # Open-loop latency counts from the scheduled arrival, including time spent queued
+        # for a free connection.
+        began = start + arrival if rate > 0 else time.perf_counter()
+        status = ask(url, query, timeout)
+        with lock:
+            results.append((kind, time.perf_counter() - began, status))
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        if rate > 0:
+            while True:
+                item = next_request()
+                if item is None:
+                    break
+                delay = start + item[0] - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                executor.submit(send, *item)
+        else:
+            def worker() -> None:
+                while True:
+                    item = next_request()
+                    if item is None:
+                        return
+                    send(*item)
+            for _ in range(concurrency):
+                executor.submit(worker)
+    elapsed = time.perf_counter() - start
+
+    paths_after = scrape_answer_paths(base_url)
+    row = {
+        "concurrency": concurrency,
+        "rate": rate or None,
+        "seconds": round(elapsed, 3),
+        "requests": len(results),
+        "throughput_rps": round(len(results) / elapsed, 2) if elapsed else 0.0,
+        "latency": percentiles([latency for _, latency, status in results if status == "ok"])
+    }
+    errors = {status: 0 for status in ("http_error", "timeout", "error_answer")}
+    for _, _, status in results:
+        if status in errors:
+            errors[status] += 1
+    row["errors"] = errors
+    row["error_rate"] = round(sum(errors.values()) / len(results), 4) if results else 0.0
+    row["by_kind"] = {}
+    for kind in mix:
+        kind_results = [(latency, status) for k, latency, status in results if k == kind]
+        summary = percentiles([latency for latency, status in kind_results if status == "ok"])
+        summary["errors"] = sum(status != "ok" for _, status in kind_results)
+        row["by_kind"][kind] = summary
+    row["answer_paths"] = {
+        path: int(count - paths_before.get(path, 0.0))
+        for path, count in sorted(paths_after.items()) if count - paths_before.get(path, 0.0)
+    }
+    return row
+
+
+def start_server(args) -> Tuple[str, object]:
+    """
+    Start the app in-process on a threaded WSGI server; returns its base URL and the server.
+    """
+    os.environ.update({
+        "QA_DATA_PATH": args.data,
+        "QA_INFERENCE_BACKEND": args.backend,
+        "QA_INDEX_CACHE_DIR": args.index_cache_dir,
+        "QA_ANSWER_CACHE": "1" if args.answer_cache else "0",
+        "QA_LAZY_GENERATOR": "0",
+        "QA_MAX_BATCH_SIZE": str(args.batch_size),
+        "QA_MAX_WAIT_MS": str(args.max_wait_ms)
+    })
+    if args.fake_latency:
+        os.environ["QA_FAKE_LATENCY"] = args.fake_latency
+    if args.retrieval_model:
+        os.environ["QA_RETRIEVAL_MODEL"] = args.retrieval_model
+    if args.gen_model:
+        os.environ["QA_GEN_MODEL"] = args.gen_model
+    np.random.seed(args.seed)
+    from werkzeug.serving import make_server
+    import App
+
+    # One access-log line per request would drown the report.
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    server = make_server("127.0.0.1", 0, App.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}", server
+
+
+def print_level(row: dict) -> None:
+    latency = row["latency"]
+    print(
+        f"concurrency {row['concurrency']:>4}"
+        + (f" rate {row['rate']:>7.1f}/s" if row["rate"] else "")
+        + f": {row['requests']} requests in {row['seconds']:.1f}s, {row['throughput_rps']:.1f} req/s, "
+        f"p50 {latency.get('p50_ms', 0):.1f} ms, p95 {latency.get('p95_ms', 0):.1f} ms, "
+        f"p99 {latency.get('p99_ms', 0):.1f} ms, errors {row['error_rate']:.2%}"
+    )
+    for kind, summary in row["by_kind"].items():
+        print(
+            f"    {kind:<10} {summary['count']:>6} ok, p50 {summary.get('p50_ms', 0):.1f} ms, "
+            f"p99 {summary.get('p99_ms', 0):.1f} ms, {summary['errors']} errors"
+        )
+    if row["answer_paths"]:
+        print("    paths: " + ", ".join(f"{path}={count}" for path, count in row["answer_paths"].items()))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay query mixes against the policy QA API.")
+    parser.add_argument("--url", help="Base URL of a running server; default: start the app in-process.")
+    parser.add_argument("--data", default=DEFAULT_DATA, help="Knowledge base the queries are drawn from.")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"Query kind weights, e.g. {DEFAULT_MIX}.")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--rate", type=float, default=0.0,
+                        help="Poisson arrivals per second (open loop); 0 runs a closed loop.")
+    parser.add_argument("--requests", type=int, default=300, help="Requests per concurrency level.")
+    parser.add_argument("--duration", type=float, help="Seconds per concurrency level (overrides --requests).")
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--request-timeout", type=float, default=60.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Optional path for JSON results.")
+    server_options = parser.add_argument_group("in-process server")
+    server_options.add_argument("--backend", default="fake", help="QA_INFERENCE_BACKEND (torch, int8, onnx or fake).")
+    server_options.add_argument("--fake-latency", help="QA_FAKE_LATENCY as JSON, e.g. '{\"token_ms\": 5}'.")
+    server_options.add_argument("--retrieval-model")
+    server_options.add_argument("--gen-model")
+    server_options.add_argument("--batch-size", type=int, default=8, help="QA_MAX_BATCH_SIZE")
+    server_options.add_argument("--max-wait-ms", type=float, default=5.0, help="QA_MAX_WAIT_MS")
+    server_options.add_argument("--answer-cache", action="store_true", help="Keep the answer cache enabled.")
+    args = parser.parse_args(argv)
+    mix = parse_mix(args.mix)
+    pool = build_query_pool(args.data, args.seed)
+
+    server = None
+    with tempfile.TemporaryDirectory() as index_cache_dir:
+        args.index_cache_dir = index_cache_dir
+        base_url = args.url.rstrip("/") if args.url else None
+        if base_url is None:
+            base_url, server = start_server(args)
+        results = {"mix": mix, "url": args.url, "backend": None if args.url else args.backend, "levels": []}
+        try:
+            warmup = request_stream(pool, mix, 0.0, args.seed + 1)
+            for _ in range(args.warmup):
+                ask(f"{base_url}/api/ask", next(warmup)[2], args.request_timeout)
+            for concurrency in args.concurrency:
+                row = run_level(
+                    base_url, pool, mix, concurrency, args.rate, args.requests, args.duration,
+                    args.request_timeout, args.seed
+                )
+                print_level(row)
+                results["levels"].append(row)
+        finally:
+            if server is not None:
+                server.shutdown()
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Process memory helpers shared by the benchmarks (Linux ``/proc`` first, ``resource`` fallback).
+"""
+import os
+import resource
+import sys
+from typing import Dict, List, Optional
+
+
+def _proc_status(pid: Optional[int] = None) -> Dict[str, float]:
+    values = {}
+    try:
+        with open(f"/proc/{pid or 'self'}/status", "r") as f:
+            for line in f:
+                key, _, rest = line.partition(":")
+                if rest.strip().endswith("kB"):
+                    values[key] = float(rest.split()[0]) / 1024.0
+    except OSError:
+        pass
+    return values
+
+
+def rss_mb(pid: Optional[int] = None) -> float:
+    """
+    Current resident set size of a process (this one by default) in MB.
+    """
+    status = _proc_status(pid)
+    if "VmRSS" in status:
+        return status["VmRSS"]
+    return peak_rss_mb() if pid in (None, os.getpid()) else float("nan")
+
+
+def peak_rss_mb() -> float:
+    """
+    Peak resident set size of this process in MB.
+    """
+    status = _proc_status()
+    if "VmHWM" in status:
+        return status["VmHWM"]
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in bytes on macOS and in kB elsewhere.
+    return peak / 2 ** 20 if sys.platform == "darwin" else peak / 1024.0
+
+
+
+def smaps_rollup_mb(pid: Optional[int] = None) -> Dict[str, float]:
+    """
+    Memory breakdown of a process from ``/proc/<pid>/smaps_rollup`` in MB (Linux only).
+
+    ``Pss`` charges every shared page proportionally to the processes mapping it, so summing
+    Pss over workers gives their real combined footprint, while summing Rss counts shared
+    pages once per worker. ``Shared_*``/``Private_*`` split Rss by whether another process
+    maps the same page. Returns an empty dict when the file is unavailable.
+    """
+    values = {}
+    try:
+        with open(f"/proc/{pid or 'self'}/smaps_rollup", "r") as f:
+            for line in f:
+                key, _, rest = line.partition(":")
+                if rest.strip().endswith("kB"):
+                    values[key] = float(rest.split()[0]) / 1024.0
+    except OSError:
+        pass
+    return values
+
+
+def child_pids(pid: Optional[int] = None) -> List[int]:
+    """
+    Direct children of a process (Linux only; empty when ``/proc`` is unavailable).
+    """
+    pid = pid or os.getpid()
+    children = []
+    try:
+        for task in os.listdir(f"/proc/{pid}/task"):
+            with open(f"/proc/{pid}/task/{task}/children", "r") as f:
+                children.extend(int(child) for child in f.read().split())
+    except OSError:
+        pass
+    return sorted(set(children))
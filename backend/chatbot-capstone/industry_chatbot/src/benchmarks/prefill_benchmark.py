@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+CPU benchmark for the prompt prefix cache of the generative fallback (``inference.prefix_cache``).
+
+Fallback prompts are the fixed instruction preamble, the retrieved policy context and the
+query. For paraphrased knowledge-base questions with single-answer and packed multi-answer
+contexts, it times time-to-first-token (``generate`` with one new token, i.e. the prefill) and
+a full short generation under four cache states:
+
+* ``uncached``: prefix cache disabled, the whole prompt is prefilled;
+* ``preamble``: only the pinned instruction preamble is cached;
+* ``warm``: after ``PolicyQASystem.warm_prefix_cache`` (every single-answer context cached, so
+  packed contexts reuse their first answer);
+* ``hit``: the exact context was used before, only the query suffix is prefilled.
+
+It also checks that cached generations are token-for-token identical to uncached ones.
+
+By default it runs against the tiny offline models from ``benchmarks.tiny_models``, whose
+prefill is too cheap to matter; ``--full-size`` uses an offline random generator with the
+dimensions of gpt-neo-125M instead (or pass ``--gen-model`` for a real checkpoint).
+
+Usage (from the ``src`` directory):
+    python -m benchmarks.prefill_benchmark --full-size --output prefill.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+from typing import Dict, List, Tuple
+import numpy as np
+from benchmarks.e2e_benchmark import DEFAULT_DATA, load_queries
+
+CACHE_STATES = ("uncached", "preamble", "warm", "hit")
+
+
+def sample_contexts(qa_system, count: int, answers_per_context: int, seed: int) -> List[str]:
+    """
+    Pack ``answers_per_context`` distinct random answers into each of ``count`` contexts.
+    """
+    kb = qa_system.kb
+    rng = np.random.default_rng(seed)
+    first_entry = {}
+    for entry_id in kb.live_ids():
+        first_entry.setdefault(int(kb.answer_ids[entry_id]), int(entry_id))
+    entries = sorted(first_entry.values())
+    contexts = []
+    for _ in range(count):
+        picked = rng.choice(len(entries), size=min(answers_per_context, len(entries)), replace=False)
+        contexts.append(qa_system._pack_contexts(kb, [entries[i] for i in picked]))
+    return contexts
+
+
+def time_generation(qa_system, queries: List[str], contexts: List[str], max_new_tokens: int, state: str) -> Tuple[float, list]:
+    """
+    Seconds for one ``generate`` call over the batch, including the prefix cache lookup.
+    """
+    import torch
+    tokenizer, model = qa_system.tokenizer, qa_system.gen_model
+    inputs = tokenizer([qa_system._build_prompt(q, c) for q, c in zip(queries, contexts)],
+                       return_tensors="pt", padding=True)
+    start = time.perf_counter()
+    past_key_values, missing = (None, []) if state == "uncached" else qa_system._cached_prefix(contexts, inputs)
+    with torch.inference_mode():
+        output = model.generate(
+            **inputs,
+            past_key_values=past_key_values,
+            max_new_tokens=max_new_tokens,
+            do_sample=False,
+            no_repeat_ngram_size=2,
+            pad_token_id=tokenizer.pad_token_id,
+            return_dict_in_generate=True
+        )
+    qa_system._store_prefixes(missing, output.past_key_values)
+    return time.perf_counter() - start, output.sequences.tolist()
+
+
+def reset_cache(qa_system, warm: bool = False) -> None:
+    """
+    Replace the prefix cache by an empty one (only the preamble pinned), optionally warmed.
+    """
+    qa_system._init_prefix_cache(qa_system.tokenizer, qa_system.gen_model)
+    if warm:
+        qa_system.warm_prefix_cache()
+
+
+def run_scenario(qa_system, queries: List[str], contexts: List[str], args) -> Dict[str, dict]:
+    result = {}
+    reference = None
+    prompt_tokens = [len(qa_system.tokenizer(qa_system._build_prompt(q, c))["input_ids"])
+                     for q, c in zip(queries, contexts)]
+    for state in CACHE_STATES:
+        timings = {1: [], args.max_new_tokens: []}
+        outputs = []
+        reused = 0
+        for max_new_tokens in timings:
+            reset_cache(qa_system, warm=state == "warm")
+            for i in range(0, len(queries), args.batch_size):
+                batch = slice(i, i + args.batch_size)
+                if state == "preamble":
+                    reset_cache(qa_system)
+                elif state == "hit":
+                    time_generation(qa_system, queries[batch], contexts[batch], 1, state)
+                before = qa_system._prefix_cache.reused_tokens
+                seconds, output = time_generation(qa_system, queries[batch], contexts[batch], max_new_tokens, state)
+                timings[max_new_tokens].append(seconds)
+                if max_new_tokens == 1:
+                    reused += qa_system._prefix_cache.reused_tokens - before
+                else:
+                    outputs.extend(output)
+        ttft, generation = timings[1], timings[args.max_new_tokens]
+        if reference is None:
+            reference = outputs
+        result[state] = {
+            "ttft_ms_mean": round(float(np.mean(ttft)) * 1000.0, 3),
+            "generate_ms_mean": round(float(np.mean(generation)) * 1000.0, 3),
+            "reused_tokens_mean": round(reused / len(queries), 1),
+            "identical_to_uncached": outputs == reference
+        }
+    uncached = result["uncached"]["ttft_ms_mean"]
+    for state in CACHE_STATES[1:]:
+        result[state]["ttft_speedup"] = round(uncached / max(result[state]["ttft_ms_mean"], 1e-9), 2)
+    result["prompt_tokens_mean"] = round(float(np.mean(prompt_tokens)), 1)
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark prefill savings of the prompt prefix cache.")
+    parser.add_argument("--data", default=DEFAULT_DATA)
+    parser.add_argument("--retrieval-model", help="Defaults to the tiny offline encoder.")
+    parser.add_argument("--gen-model", help="Defaults to the tiny offline generator.")
+    parser.add_argument("--full-size", action="store_true",
+                        help="Use a random generator with gpt-neo-125M dimensions as the default generator.")
+    parser.add_argument("--model-dir", default=os.path.join(tempfile.gettempdir(), "policy_qa_tiny_models"))
+    parser.add_argument("--queries", type=int, default=16)
+    parser.add_argument("--batch-size", type=int, default=1)
+    parser.add_argument("--max-new-tokens", type=int, default=16)
+    parser.add_argument("--packed-answers", type=int, default=3, help="Answers per packed context.")
+    parser.add_argument("--threads", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Optional path for JSON results.")
+    args = parser.parse_args(argv)
+
+    import torch
+    torch.set_num_threads(args.threads)
+    if not args.retrieval_model or not args.gen_model:
+        from benchmarks.tiny_models import build_tiny_models
+        encoder, generator = build_tiny_models(args.model_dir, args.data, args.seed)
+        if args.full_size and not args.gen_model:
+            from benchmarks.tiny_models import build_full_size_generator
+            generator = build_full_size_generator(args.model_dir, args.data, args.seed)
+        args.retrieval_model = args.retrieval_model or encoder
+        args.gen_model = args.gen_model or generator
+
+    from inference.inference import PolicyQASystem
+    with tempfile.TemporaryDirectory() as index_cache_dir:
+        qa_system = PolicyQASystem(
+            args.data, args.retrieval_model, args.gen_model, index_cache_dir=index_cache_dir,
+            use_answer_cache=False, lazy_generator=False
+        )
+    queries = load_queries(args.data, args.queries, args.seed)
+    # One untimed generation so first-call initialization is not attributed to a cache state.
+    time_generation(qa_system, queries[:1], ["warm-up"], 2, "uncached")
+
+    results = {
+        "gen_model": args.gen_model,
+        "threads": args.threads,
+        "batch_size": args.batch_size,
+        "max_new_tokens": args.max_new_tokens
+    }
+    for name, answers in (("single", 1), ("packed", args.packed_answers)):
+        contexts = sample_contexts(qa_system, len(queries), answers, args.seed)
+        results[name] = run_scenario(qa_system, queries, contexts, args)
+        print(f"{name} (prompt ~{results[name]['prompt_tokens_mean']} tokens):")
+        for state in CACHE_STATES:
+            row = results[name][state]
+            print(f"  {state:>8}: ttft={row['ttft_ms_mean']:.2f}ms  generate={row['generate_ms_mean']:.2f}ms  "
+                  f"reused={row['reused_tokens_mean']} tokens  speedup={row.get('ttft_speedup', 1.0)}x  "
+                  f"identical={row['identical_to_uncached']}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Tiny, randomly initialized stand-ins for the production models, built entirely offline.
+
+The benchmarks use them to exercise the full PolicyQASystem pipeline (tokenization, encoding,
+FAISS search, batched generation) without downloading weights. A word-level vocabulary is
+built from the knowledge base so every question and answer tokenizes without unknown words;
+the encoder is a one-layer BERT with mean pooling and the generator a two-layer GPT-Neo.
+Latencies are therefore dominated by pipeline overhead rather than model size, which is what
+a regression benchmark should catch. Weights are seeded, so rebuilding gives identical models.
+
+``build_full_size_generator`` builds a random generator with the dimensions of gpt-neo-125M
+for benchmarks that measure model compute (e.g. prefill) rather than pipeline overhead.
+"""
+import os
+import re
+import json
+from typing import Tuple
+
+SPECIAL_TOKENS = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "<|endoftext|>"]
+
+
+def _build_vocab(data_path: str) -> dict:
+    with open(data_path, "r", encoding="utf-8") as f:
+        records = json.load(f)
+    words = set()
+    for record in records:
+        for text in (record["question"], record["answer"]):
+            words.update(re.findall(r"\w+|[^\w\s]", text.lower()))
+    vocab = {token: i for i, token in enumerate(SPECIAL_TOKENS)}
+    for word in sorted(words):
+        vocab.setdefault(word, len(vocab))
+    return vocab
+
+
+def _build_tokenizer(data_path: str):
+    from tokenizers import Tokenizer, decoders, models, normalizers, pre_tokenizers
+    vocab = _build_vocab(data_path)
+    tokenizer = Tokenizer(models.WordLevel(vocab, unk_token="[UNK]"))
+    tokenizer.normalizer = normalizers.Lowercase()
+    tokenizer.pre_tokenizer = pre_tokenizers.Whitespace()
+    tokenizer.decoder = decoders.WordPiece(prefix="##")
+    return vocab, tokenizer
+
+
+def _save_generator(generator_dir: str, vocab: dict, tokenizer, **dimensions) -> None:
+    from transformers import GPTNeoConfig, GPTNeoForCausalLM, PreTrainedTokenizerFast
+    PreTrainedTokenizerFast(
+        tokenizer_object=tokenizer,
+        model_input_names=["input_ids", "attention_mask"],
+        eos_token="<|endoftext|>",
+        bos_token="<|endoftext|>",
+        unk_token="[UNK]"
+    ).save_pretrained(generator_dir)
+    eos_id = vocab["<|endoftext|>"]
+    GPTNeoForCausalLM(GPTNeoConfig(
+        vocab_size=len(vocab),
+        max_position_embeddings=1024,
+        eos_token_id=eos_id,
+        bos_token_id=eos_id,
+        **dimensions
+    )).save_pretrained(generator_dir)
+
+
+def build_full_size_generator(output_dir: str, data_path: str, seed: int = 0) -> str:
+    """
+    Build (or reuse) a randomly initialized generator with gpt-neo-125M's layer count and
+    widths under ``output_dir``, and return its path.
+    """
+    generator_dir = os.path.join(output_dir, "generator_125m")
+    if os.path.exists(os.path.join(generator_dir, "config.json")):
+        return generator_dir
+
+    import torch
+    torch.manual_seed(seed)
+    vocab, tokenizer = _build_tokenizer(data_path)
+    _save_generator(
+        generator_dir, vocab, tokenizer,
+        hidden_size=768, num_layers=12, num_heads=12, attention_types=[[["global", "local"], 6]]
+    )
+    return generator_dir
+
+
+def build_tiny_models(output_dir: str, data_path: str, seed: int = 0) -> Tuple[str, str]:
+    """
+    Build (or reuse) the tiny encoder and generator under ``output_dir``.
+
+    Returns the (retrieval_model, gen_model) paths, which can be passed to PolicyQASystem
+    in place of Hugging Face model names.
+    """
+    encoder_dir = os.path.join(output_dir, "encoder")
+    generator_dir = os.path.join(output_dir, "generator")
+    if os.path.exists(os.path.join(encoder_dir, "modules.json")) and os.path.exists(
+        os.path.join(generator_dir, "config.json")
+    ):
+        return encoder_dir, generator_dir
+
+    import torch
+    from transformers import BertConfig, BertModel, PreTrainedTokenizerFast
+    from sentence_transformers import SentenceTransformer, models as st_models
+
+    torch.manual_seed(seed)
+    vocab, tokenizer = _build_tokenizer(data_path)
+    _save_generator(
+        generator_dir, vocab, tokenizer,
+        hidden_size=32, num_layers=2, num_heads=2, attention_types=[[["global", "local"], 1]]
+    )
+
+    transformer_dir = os.path.join(output_dir, "encoder_transformer")
+    PreTrainedTokenizerFast(
+        tokenizer_object=tokenizer, pad_token="[PAD]", unk_token="[UNK]", cls_token="[CLS]", sep_token="[SEP]"
+    ).save_pretrained(transformer_dir)
+    BertModel(BertConfig(
+        vocab_size=len(vocab), hidden_size=32, num_hidden_layers=1, num_attention_heads=2, intermediate_size=64
+    )).save_pretrained(transformer_dir)
+    pooling = st_models.Pooling(32, "mean")
+    SentenceTransformer(modules=[st_models.Transformer(transformer_dir), pooling]).save(encoder_dir)
+    return encoder_dir, generator_dir
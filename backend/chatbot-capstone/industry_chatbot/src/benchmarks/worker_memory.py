@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Per-worker memory report for pre-fork serving (``prefork.py`` or gunicorn with ``preload_app``).
+
+For the parent and each worker process it reads ``/proc/<pid>/smaps_rollup`` and reports:
+
+* ``rss_mb``: resident memory, counting shared pages in full in every process;
+* ``pss_mb``: proportional set size, each shared page divided by the number of sharers;
+* ``shared_mb`` / ``private_mb``: resident pages that are / are not mapped by another process.
+
+``total_pss_mb`` is the real footprint of the whole server. ``independent_estimate_mb`` is
+what the same workers would need without sharing (parent RSS per worker), so the difference
+shows how much copy-on-write and the memory-mapped index save.
+
+Attach to a running server:
+    python -m benchmarks.worker_memory --pid <parent pid>
+
+Or start ``prefork.py`` against the offline tiny models, send some traffic and report (from
+the ``src`` directory):
+    python -m benchmarks.worker_memory --workers 4 --requests 200 --output worker_memory.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+import tempfile
+import urllib.request
+from benchmarks.memory import child_pids, smaps_rollup_mb
+from benchmarks.e2e_benchmark import DEFAULT_DATA, load_queries
+
+
+def process_memory(pid: int) -> dict:
+    rollup = smaps_rollup_mb(pid)
+    return {
+        "pid": pid,
+        "rss_mb": round(rollup.get("Rss", 0.0), 1),
+        "pss_mb": round(rollup.get("Pss", 0.0), 1),
+        "shared_mb": round(rollup.get("Shared_Clean", 0.0) + rollup.get("Shared_Dirty", 0.0), 1),
+        "private_mb": round(rollup.get("Private_Clean", 0.0) + rollup.get("Private_Dirty", 0.0), 1)
+    }
+
+
+def report(parent_pid: int) -> dict:
+    parent = process_memory(parent_pid)
+    workers = [process_memory(pid) for pid in child_pids(parent_pid)]
+    return {
+        "parent": parent,
+        "workers": workers,
+        "total_rss_mb": round(parent["rss_mb"] + sum(w["rss_mb"] for w in workers), 1),
+        "total_pss_mb": round(parent["pss_mb"] + sum(w["pss_mb"] for w in workers), 1),
+        "independent_estimate_mb": round(parent["rss_mb"] * (len(workers) + 1), 1)
+    }
+
+
+def _post(url: str, query: str, timeout: float) -> None:
+    body = json.dumps({"query": query}).encode("utf-8")
+    request = urllib.request.Request(url, data=body, headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        response.read()
+
+
+def launch(args) -> subprocess.Popen:
+    """
+    Start prefork.py against the tiny offline models and wait until it answers requests.
+    """
+    from benchmarks.tiny_models import build_tiny_models
+    encoder, generator = build_tiny_models(args.model_dir, args.data)
+    env = dict(os.environ, QA_DATA_PATH=args.data, QA_RETRIEVAL_MODEL=encoder, QA_GEN_MODEL=generator,
+               QA_INDEX_CACHE_DIR=args.index_cache_dir)
+    command = [sys.executable, "prefork.py", "--port", str(args.port), "--workers", str(args.workers)]
+    if args.lazy_generator:
+        command.append("--lazy-generator")
+    server = subprocess.Popen(command, env=env, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    deadline = time.time() + args.startup_timeout
+    while time.time() < deadline:
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{args.port}/api/ready", timeout=5) as response:
+                if response.status == 200 and len(child_pids(server.pid)) >= args.workers:
+                    return server
+        except OSError:
+            pass
+        if server.poll() is not None:
+            raise RuntimeError(f"prefork.py exited with status {server.returncode}")
+        time.sleep(0.5)
+    server.terminate()
+    raise RuntimeError("prefork.py did not become ready in time")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Report per-worker RSS/PSS of a pre-fork server.")
+    parser.add_argument("--pid", type=int, help="Parent pid of a running server; omit to start prefork.py.")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--port", type=int, default=5055)
+    parser.add_argument("--requests", type=int, default=100, help="Requests sent before measuring.")
+    parser.add_argument("--lazy-generator", action="store_true")
+    parser.add_argument("--data", default=DEFAULT_DATA)
+    parser.add_argument("--model-dir", default=os.path.join(tempfile.gettempdir(), "policy_qa_tiny_models"))
+    parser.add_argument("--startup-timeout", type=float, default=300.0)
+    parser.add_argument("--output", help="Optional path for JSON results.")
+    args = parser.parse_args(argv)
+
+    server = None
+    if args.pid is None:
+        with tempfile.TemporaryDirectory() as index_cache_dir:
+            args.index_cache_dir = index_cache_dir
+            server = launch(args)
+            try:
+                url = f"http://127.0.0.1:{args.port}/api/ask"
+                for query in load_queries(args.data, args.requests, seed=0):
+                    _post(url, query, timeout=120)
+                result = report(server.pid)
+            finally:
+                server.terminate()
+                server.wait()
+    else:
+        result = report(args.pid)
+
+    for name, row in [("parent", result["parent"])] + [("worker", w) for w in result["workers"]]:
+        print(f"{name:>6} {row['pid']:>7}  rss={row['rss_mb']:.1f}MB  pss={row['pss_mb']:.1f}MB  "
+              f"shared={row['shared_mb']:.1f}MB  private={row['private_mb']:.1f}MB")
+    print(f"total: rss={result['total_rss_mb']:.1f}MB  pss={result['total_pss_mb']:.1f}MB  "
+          f"(without sharing ~{result['independent_estimate_mb']:.1f}MB)")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,8 +1,16 @@
+import os
 import json
 import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict
 import random
+import torch
 from transformers import AutoModelForCausalLM, AutoTokenizer
+from data_processing.qa_io import QARecordWriter, iter_qa_records
+
+# Token budget of one generated question (the old max_length=100 counted the prompt as well).
+MAX_NEW_TOKENS = 48
 
 class QADatasetEnhancer:
     def __init__(self, model_name="microsoft/DialoGPT-medium"):
@@ -12,60 +20,166 @@ class QADatasetEnhancer:
         try:
             self.tokenizer = AutoTokenizer.from_pretrained(model_name)
             self.model = AutoModelForCausalLM.from_pretrained(model_name)
+            self.model.eval()
+            # Batched generation needs a pad token and left padding for a decoder-only model.
+            if self.tokenizer.pad_token is None:
+                self.tokenizer.pad_token = self.tokenizer.eos_token
+            self.tokenizer.padding_side = "left"
         except Exception as e:
             self.logger.error(f"Model loading error: {e}")
             raise
     
     def generate_alternative_question(self, original_question: str) -> str:
         """Generate a single alternative question."""
-        input_ids = self.tokenizer.encode(
-            f"Rephrase this question: '{original_question}'", 
-            return_tensors='pt'
+        return self.generate_alternative_questions([original_question])[0]
+    
+    def generate_alternative_questions(self, original_questions: List[str]) -> List[str]:
+        """
+        Generate one alternative question per input in a single padded batch.
+
+        Only the sampled continuation is decoded, not the echoed prompt; an input whose
+        continuation is empty keeps its original question.
+        """
+        inputs = self.tokenizer(
+            [f"Rephrase this question: '{question}'" for question in original_questions],
+            return_tensors='pt',
+            padding=True
         )
         
-        output = self.model.generate(
-            input_ids, 
-            max_length=100, 
-            num_return_sequences=1,
-            temperature=0.7
-        )
+        with torch.inference_mode():
+            output = self.model.generate(
+                **inputs,
+                do_sample=True,
+                temperature=0.7,
+                max_new_tokens=MAX_NEW_TOKENS,
+                num_return_sequences=1,
+                pad_token_id=self.tokenizer.pad_token_id
+            )
+        
+        # With left padding every prompt ends at the same column.
+        continuations = self.tokenizer.batch_decode(output[:, inputs['input_ids'].shape[1]:], skip_special_tokens=True)
+        return [text.strip() or question for text, question in zip(continuations, original_questions)]
+    
+    def _augment_batch(self, entries: List[Dict], augmentation_factor: int) -> List[Dict]:
+        """Return each entry followed by its generated variations."""
+        prompts = [entry['question'] for entry in entries for _ in range(augmentation_factor)]
+        try:
+            alternatives = self.generate_alternative_questions(prompts) if prompts else []
+        except Exception as e:
+            # Keep the variation slots (with the original question) like the unbatched version did.
+            self.logger.warning(f"Question generation failed: {e}")
+            alternatives = prompts
         
-        return self.tokenizer.decode(output[0], skip_special_tokens=True)
+        rows = []
+        for i, entry in enumerate(entries):
+            # Keep original entry
+            rows.append(entry)
+            # Generated alternative variations
+            for alt_question in alternatives[i * augmentation_factor:(i + 1) * augmentation_factor]:
+                new_entry = entry.copy()
+                new_entry['question'] = alt_question
+                rows.append(new_entry)
+        return rows
+    
+    def _load_checkpoint(self, checkpoint_file: str, input_file: str, augmentation_factor: int, batch_size: int):
+        if not checkpoint_file or not os.path.exists(checkpoint_file):
+            return None
+        with open(checkpoint_file, 'r', encoding='utf-8') as f:
+            checkpoint = json.load(f)
+        expected = {"input_file": input_file, "augmentation_factor": augmentation_factor, "batch_size": batch_size}
+        if any(checkpoint.get(key) != value for key, value in expected.items()):
+            self.logger.warning("Checkpoint was written for different settings; starting from scratch.")
+            return None
+        return checkpoint
     
-    def augment_dataset(self, input_file: str, output_file: str, augmentation_factor: int = 2):
-        """Augment dataset by generating alternative questions."""
+    def _save_checkpoint(self, checkpoint_file: str, checkpoint: Dict):
+        tmp_file = f"{checkpoint_file}.tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(checkpoint, f)
+        os.replace(tmp_file, checkpoint_file)
+    
+    def augment_dataset(
+        self,
+        input_file: str,
+        output_file: str,
+        augmentation_factor: int = 2,
+        batch_size: int = 8,
+        num_workers: int = 1,
+        checkpoint_file: str = None,
+        shuffle: bool = False
+    ):
+        """
+        Augment dataset by generating alternative questions.
+        
+        Entries are processed in padded batches of ``batch_size`` (each batch generates
+        ``batch_size * augmentation_factor`` questions at once), ``num_workers`` batches run
+        concurrently, and rows are streamed to ``output_file`` in input order as batches
+        finish. After every batch the output position is recorded in ``checkpoint_file``
+        (default: ``<output_file>.ckpt``), so a rerun after a crash resumes at the first
+        unfinished batch. ``shuffle`` only shuffles rows within each batch; the full dataset is
+        never held in memory.
+        """
+        checkpoint_file = checkpoint_file or f"{output_file}.ckpt"
         try:
-            with open(input_file, 'r', encoding='utf-8') as f:
-                original_dataset = json.load(f)
+            checkpoint = self._load_checkpoint(checkpoint_file, input_file, augmentation_factor, batch_size)
+            completed = checkpoint["completed_batches"] if checkpoint else 0
+            writer = None
+            if checkpoint:
+                try:
+                    writer = QARecordWriter(output_file, checkpoint["output_offset"], checkpoint["rows_written"])
+                    self.logger.info(f"Resuming augmentation after {completed} completed batches.")
+                except FileNotFoundError as e:
+                    self.logger.warning(f"{e}; restarting augmentation from the first batch.")
+                    completed = 0
+            if writer is None:
+                writer = QARecordWriter(output_file)
             
-            augmented_dataset = []
+            def batches():
+                batch = []
+                for entry in iter_qa_records(input_file):
+                    batch.append(entry)
+                    if len(batch) == batch_size:
+                        yield batch
+                        batch = []
+                if batch:
+                    yield batch
             
-            for entry in original_dataset:
-                # Keep original entry
-                augmented_dataset.append(entry)
+            with writer, ThreadPoolExecutor(max_workers=num_workers) as executor:
+                in_flight = deque()
                 
-                # Generate alternative variations
-                for _ in range(augmentation_factor):
-                    new_entry = entry.copy()
-                    
-                    # Slight variations in question and answer
-                    try:
-                        alt_question = self.generate_alternative_question(entry['question'])
-                        new_entry['question'] = alt_question
-                    except Exception as e:
-                        self.logger.warning(f"Question generation failed: {e}")
-                    
-                    augmented_dataset.append(new_entry)
-            
-            # Shuffle to mix original and augmented entries
-            random.shuffle(augmented_dataset)
-            
-            # Save augmented dataset
-            with open(output_file, 'w', encoding='utf-8') as f:
-                json.dump(augmented_dataset, f, indent=2, ensure_ascii=False)
+                def finish_oldest():
+                    nonlocal completed
+                    rows = in_flight.popleft().result()
+                    if shuffle:
+                        random.shuffle(rows)
+                    for row in rows:
+                        writer.write(row)
+                    completed += 1
+                    self._save_checkpoint(checkpoint_file, {
+                        "input_file": input_file,
+                        "augmentation_factor": augmentation_factor,
+                        "batch_size": batch_size,
+                        "completed_batches": completed,
+                        "rows_written": writer.count,
+                        "output_offset": writer.offset()
+                    })
+                    self.logger.info(f"Augmented batch {completed} ({writer.count} rows written)")
+                
+                for batch_number, batch in enumerate(batches()):
+                    if batch_number < completed:
+                        continue
+                    in_flight.append(executor.submit(self._augment_batch, batch, augmentation_factor))
+                    if len(in_flight) >= 2 * num_workers:
+                        finish_oldest()
+                while in_flight:
+                    finish_oldest()
+                total_rows = writer.count
             
+            # No checkpoint is written when the input has no entries.
+            if os.path.exists(checkpoint_file):
+                os.remove(checkpoint_file)
             self.logger.info(f"Augmented dataset saved to {output_file}")
-            return len(augmented_dataset)
+            return total_rows
         
         except Exception as e:
             self.logger.error(f"Dataset augmentation failed: {e}")
@@ -76,8 +190,10 @@ def main():
     enhancer.augment_dataset(
         input_file=r'C:\Users\moksh\classroom\chatbot_deepseek\industry_chatbot\data\knowledge_base\qa_pairs.json', 
         output_file=r'C:\Users\moksh\classroom\chatbot_deepseek\industry_chatbot\data\knowledge_base\augmented_qa_pairs.json',
-        augmentation_factor=2  # Generate 2 alternative entries per original
+        augmentation_factor=2,  # Generate 2 alternative entries per original
+        batch_size=16,
+        num_workers=2
     )
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
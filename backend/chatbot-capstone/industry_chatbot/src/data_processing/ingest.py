@@ -0,0 +1,140 @@
+import os
+import argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import pdfplumber
+from data_processing.preprocess import SECTION_SPLIT_PATTERN, extract_page_text, iter_qa_pairs
+from data_processing.qa_io import QARecordWriter
+
+def count_pages(pdf_path):
+    with pdfplumber.open(pdf_path) as pdf:
+        return len(pdf.pages)
+
+def extract_page_range(pdf_path, start, end):
+    """
+    Extract the text of pages [start, end) of a PDF. Runs inside a worker process.
+    """
+    with pdfplumber.open(pdf_path) as pdf:
+        return [extract_page_text(pdf.pages[i]) for i in range(start, end)]
+
+def iter_page_texts(pdf_path, executor=None, pages_per_task=8):
+    """
+    Yield the text of every page in order.
+
+    With an executor, page ranges are extracted in parallel; at most two tasks per worker are
+    in flight so memory stays bounded no matter how long the document is.
+    """
+    num_pages = count_pages(pdf_path)
+    ranges = [(start, min(start + pages_per_task, num_pages)) for start in range(0, num_pages, pages_per_task)]
+
+    if executor is None:
+        for start, end in ranges:
+            yield from extract_page_range(pdf_path, start, end)
+        return
+
+    window = 2 * getattr(executor, "_max_workers", os.cpu_count() or 1)
+    in_flight = deque()
+    for start, end in ranges:
+        in_flight.append(executor.submit(extract_page_range, pdf_path, start, end))
+        if len(in_flight) >= window:
+            yield from in_flight.popleft().result()
+    while in_flight:
+        yield from in_flight.popleft().result()
+
+def iter_sections(page_texts):
+    """
+    Split a stream of page texts into policy sections without joining the whole document.
+
+    Pages are joined with newlines exactly like ``extract_text_from_pdf``. Only the last,
+    possibly unfinished, section is carried over to the next page, so the output matches
+    ``SECTION_SPLIT_PATTERN.split`` on the full text while memory is bounded by the largest section.
+    """
+    buffer = None
+    for text in page_texts:
+        buffer = text if buffer is None else buffer + "\n" + text
+        sections = SECTION_SPLIT_PATTERN.split(buffer)
+        buffer = sections.pop()
+        yield from sections
+    if buffer is not None:
+        yield buffer
+
+def ingest_pdf(pdf_path, out, executor=None, text_out=None, source="IT Policy Document", pages_per_task=8):
+    """
+    Stream one PDF through section splitting and question generation, writing each Q&A pair
+    to the ``QARecordWriter`` ``out``. Returns the number of pairs written.
+    """
+    def pages():
+        for text in iter_page_texts(pdf_path, executor, pages_per_task):
+            if text_out is not None:
+                text_out.write(text + "\n")
+            yield text
+
+    count = 0
+    for qa_pair in iter_qa_pairs(iter_sections(pages()), source=source):
+        out.write(qa_pair)
+        count += 1
+    return count
+
+def find_pdfs(input_path):
+    if os.path.isdir(input_path):
+        return sorted(
+            os.path.join(input_path, name) for name in os.listdir(input_path) if name.lower().endswith(".pdf")
+        )
+    return [input_path]
+
+def ingest(input_path, output_jsonl, processed_text_dir=None, workers=None, source=None, pages_per_task=8):
+    """
+    Ingest a PDF or every PDF in a directory into a JSONL file of Q&A pairs.
+
+    Args:
+        input_path: A PDF file or a directory of PDFs.
+        output_jsonl: Destination JSONL file (or JSON / binary ``.qakb``); pairs are written as
+            they are generated.
+        processed_text_dir: Optional directory for the extracted text of each PDF.
+        workers: Number of extraction processes (default: CPU count; 1 disables the pool).
+        source: Metadata source for every pair (default: the PDF file name).
+        pages_per_task: Pages extracted per worker task.
+    """
+    pdf_paths = find_pdfs(input_path)
+    workers = workers or os.cpu_count() or 1
+    os.makedirs(os.path.dirname(os.path.abspath(output_jsonl)), exist_ok=True)
+    if processed_text_dir:
+        os.makedirs(processed_text_dir, exist_ok=True)
+
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    total = 0
+    try:
+        with QARecordWriter(output_jsonl) as out:
+            for pdf_path in pdf_paths:
+                name = os.path.splitext(os.path.basename(pdf_path))[0]
+                text_out = None
+                if processed_text_dir:
+                    text_out = open(os.path.join(processed_text_dir, f"{name}.txt"), 'w', encoding='utf-8')
+                try:
+                    count = ingest_pdf(pdf_path, out, executor, text_out, source or name, pages_per_task)
+                finally:
+                    if text_out is not None:
+                        text_out.close()
+                out.offset()
+                total += count
+                print(f"✅ {pdf_path}: {count} Q&A pairs")
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    print(f"✅ Generated {total} Q&A pairs from {len(pdf_paths)} PDF(s). Saved to {output_jsonl}")
+    return total
+
+def main():
+    parser = argparse.ArgumentParser(description="Parallel, streaming PDF to Q&A pair ingestion.")
+    parser.add_argument("input", help="A PDF file or a directory containing PDFs.")
+    parser.add_argument("output", help="Output JSONL file of Q&A pairs (or .json / .qakb).")
+    parser.add_argument("--text-dir", help="Directory for the extracted text of each PDF.")
+    parser.add_argument("--workers", type=int, default=None, help="Extraction processes (default: CPU count).")
+    parser.add_argument("--source", help="Metadata source for every pair (default: the PDF file name).")
+    parser.add_argument("--pages-per-task", type=int, default=8)
+    args = parser.parse_args()
+    ingest(args.input, args.output, args.text_dir, args.workers, args.source, args.pages_per_task)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+"""
+Compact binary knowledge-base format (``.qakb``).
+
+One file holds the QA pairs as columns that are memory-mapped on load instead of parsed:
+
+* questions and answers as UTF-8 bytes plus int64 offsets (string ``i`` is
+  ``bytes[offsets[i]:offsets[i + 1]]``); every distinct answer is stored once;
+* ``answer_ids`` / ``metadata_ids`` (int32) pointing every row at its answer and at its
+  metadata record in an interned table kept in the header;
+* optionally the normalized float32 question embeddings and the name of the model that
+  produced them, so ``PolicyQASystem`` can build its index without encoding anything.
+
+Layout: ``b"QAKB"``, a uint32 format version, a uint64 header length, a JSON header (row count,
+metadata table, embedding model and the offset/dtype/shape of every column), then the columns,
+each aligned to 64 bytes. Files are written to a temporary name and renamed into place.
+
+``qa_io.iter_qa_records`` and ``qa_io.QARecordWriter`` read and write ``.qakb`` paths, so every
+pipeline stage accepts it wherever it accepts JSON or JSONL. Conversion (from the ``src``
+directory):
+    python -m data_processing.kb_store import cleaned_augmented_qa_pairs.json kb.qakb --embed sentence-transformers/all-MiniLM-L6-v2
+    python -m data_processing.kb_store export kb.qakb cleaned_augmented_qa_pairs.json
+"""
+import os
+import json
+import struct
+import argparse
+import numpy as np
+
+KB_SUFFIX = ".qakb"
+KB_MAGIC = b"QAKB"
+# Bump whenever the layout changes; readers reject other versions.
+KB_FORMAT_VERSION = 1
+_PREAMBLE = struct.Struct("<4sIQ")
+_ALIGNMENT = 64
+
+def is_qa_store(path):
+    return path.endswith(KB_SUFFIX)
+
+class StringColumn:
+    """
+    Read-only sequence of strings over memory-mapped UTF-8 bytes and offsets; a string is
+    only decoded when it is accessed.
+    """
+
+    def __init__(self, offsets, data):
+        self.offsets = offsets
+        self.data = data
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        return self.data[self.offsets[i]:self.offsets[i + 1]].tobytes().decode('utf-8')
+
+    def __iter__(self):
+        offsets = self.offsets.tolist()
+        data = self.data
+        for start, end in zip(offsets, offsets[1:]):
+            yield data[start:end].tobytes().decode('utf-8')
+
+def _encode_strings(strings):
+    encoded = [s.encode('utf-8') for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    return offsets, np.frombuffer(b''.join(encoded), dtype=np.uint8)
+
+class QAStore:
+    """
+    Reader for a ``.qakb`` file. Columns are views into one read-only memory map, so opening
+    a store costs a header parse regardless of its size.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            magic, version, header_length = _PREAMBLE.unpack(f.read(_PREAMBLE.size))
+            if magic != KB_MAGIC:
+                raise ValueError(f"{path} is not a QA knowledge-base store")
+            if version != KB_FORMAT_VERSION:
+                raise ValueError(f"{path} has format version {version}; expected {KB_FORMAT_VERSION}")
+            header = json.loads(f.read(header_length).decode('utf-8'))
+        self._map = np.memmap(path, dtype=np.uint8, mode='r')
+        self.count = header["count"]
+        self.metadata = header["metadata"]
+        self.embedding_model = header.get("embedding_model", "")
+        self.embedding_backend = header.get("embedding_backend", "")
+        columns = {name: self._column(spec) for name, spec in header["columns"].items()}
+        self.questions = StringColumn(columns["question_offsets"], columns["question_bytes"])
+        self.answers = StringColumn(columns["answer_offsets"], columns["answer_bytes"])
+        self.answer_ids = columns["answer_ids"]
+        self.metadata_ids = columns["metadata_ids"]
+        self.embeddings = columns.get("embeddings")
+
+    def _column(self, spec):
+        dtype = np.dtype(spec["dtype"])
+        size = int(np.prod(spec["shape"])) * dtype.itemsize
+        if size == 0:
+            return np.zeros(spec["shape"], dtype=dtype)
+        return self._map[spec["offset"]:spec["offset"] + size].view(dtype).reshape(spec["shape"])
+
+    def __len__(self):
+        return self.count
+
+    def records(self):
+        """
+        Yield the rows as QA dicts exactly as they were written.
+        """
+        answers = list(self.answers)
+        for question, answer_id, metadata_id in zip(self.questions, self.answer_ids.tolist(), self.metadata_ids.tolist()):
+            record = {"question": question, "answer": answers[answer_id]}
+            if metadata_id >= 0:
+                record["metadata"] = json.loads(json.dumps(self.metadata[metadata_id]))
+            yield record
+
+def write_qa_store(path, records, embeddings=None, embedding_model="", embedding_backend="torch"):
+    """
+    Write QA dicts (``question``, ``answer``, optional ``metadata``) to a ``.qakb`` file.
+
+    ``embeddings`` are the normalized question embeddings in row order, produced by
+    ``embedding_model``. Returns the number of rows written.
+    """
+    questions = []
+    answer_ids = []
+    metadata_ids = []
+    answer_index = {}
+    metadata_index = {}
+    for record in records:
+        questions.append(record["question"])
+        answer_ids.append(answer_index.setdefault(record["answer"], len(answer_index)))
+        if "metadata" in record:
+            key = json.dumps(record["metadata"], ensure_ascii=False)
+            metadata_ids.append(metadata_index.setdefault(key, len(metadata_index)))
+        else:
+            metadata_ids.append(-1)
+    answers = list(answer_index)
+
+    question_offsets, question_bytes = _encode_strings(questions)
+    answer_offsets, answer_bytes = _encode_strings(answers)
+    columns = {
+        "question_offsets": question_offsets,
+        "question_bytes": question_bytes,
+        "answer_offsets": answer_offsets,
+        "answer_bytes": answer_bytes,
+        "answer_ids": np.asarray(answer_ids, dtype=np.int32),
+        "metadata_ids": np.asarray(metadata_ids, dtype=np.int32)
+    }
+    header = {"count": len(questions), "metadata": [json.loads(key) for key in metadata_index], "columns": {}}
+    if embeddings is not None:
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        if len(embeddings) != len(questions):
+            raise ValueError(f"{len(embeddings)} embeddings for {len(questions)} questions")
+        columns["embeddings"] = embeddings
+        header["embedding_model"] = embedding_model
+        header["embedding_backend"] = embedding_backend
+
+    # Column offsets depend on the header length, which depends on the offsets: lay the columns
+    # out after the current header until the header stops growing, then pad it to that size.
+    for name, column in columns.items():
+        header["columns"][name] = {"offset": 0, "dtype": column.dtype.str, "shape": list(column.shape)}
+    header_length = 0
+    while True:
+        encoded_header = json.dumps(header).encode('utf-8')
+        if len(encoded_header) <= header_length:
+            break
+        header_length = len(encoded_header)
+        offset = _PREAMBLE.size + header_length
+        for name, column in columns.items():
+            offset = -(-offset // _ALIGNMENT) * _ALIGNMENT
+            header["columns"][name]["offset"] = offset
+            offset += column.nbytes
+    encoded_header += b' ' * (header_length - len(encoded_header))
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(_PREAMBLE.pack(KB_MAGIC, KB_FORMAT_VERSION, len(encoded_header)))
+        f.write(encoded_header)
+        for name, column in columns.items():
+            f.write(b'\0' * (header["columns"][name]["offset"] - f.tell()))
+            f.write(column.tobytes())
+    os.replace(tmp_path, path)
+    return len(questions)
+
+def import_json(json_path, store_path, embed_model=None, batch_size=64):
+    """
+    Convert a JSON or JSONL file of QA pairs to a ``.qakb`` store, optionally embedding the
+    questions with ``embed_model``.
+    """
+    from data_processing.qa_io import iter_qa_records
+    records = list(iter_qa_records(json_path))
+    embeddings = None
+    if embed_model:
+        from data_processing.post_process_qa_pairs import embed_questions
+        embeddings = embed_questions([r["question"] for r in records], embed_model, batch_size)
+    return write_qa_store(store_path, records, embeddings, embed_model or "")
+
+def export_json(store_path, json_path):
+    """
+    Convert a ``.qakb`` store back to a JSON array (or JSONL) file of QA pairs.
+    """
+    from data_processing.qa_io import QARecordWriter
+    with QARecordWriter(json_path) as writer:
+        for record in QAStore(store_path).records():
+            writer.write(record)
+        return writer.count
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert between JSON QA pairs and the binary .qakb format.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    to_store = commands.add_parser("import", help="JSON/JSONL -> .qakb")
+    to_store.add_argument("input")
+    to_store.add_argument("output")
+    to_store.add_argument("--embed", metavar="MODEL", help="Store question embeddings from this retrieval model.")
+    to_store.add_argument("--batch-size", type=int, default=64)
+    to_json = commands.add_parser("export", help=".qakb -> JSON/JSONL")
+    to_json.add_argument("input")
+    to_json.add_argument("output")
+    args = parser.parse_args()
+    if args.command == "import":
+        count = import_json(args.input, args.output, args.embed, args.batch_size)
+    else:
+        count = export_json(args.input, args.output)
+    print(f"✅ Wrote {count} Q&A pairs to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -1,30 +1,195 @@
-import json
 import re
+import json
+import argparse
+from collections import defaultdict
+import numpy as np
+from data_processing.kb_store import is_qa_store, write_qa_store
+from data_processing.qa_io import QARecordWriter, iter_qa_records
+
+REPHRASE_PREFIX = re.compile(r'^(Rephrase this question:|\s+)+')
+# The augmentation model echoes the quoted question back with a few stray characters after
+# the closing quote (e.g. "'What is the scope policy?'n." or "...policy'?"); keep the quoted part.
+QUOTED_QUESTION = re.compile(r'''^['"](?P<question>.+)['"][^'"\s]{0,4}$''')
+# Escape sequences that lost their backslash handling ("\n", "\r", "\s") and whitespace.
+TRAILING_ARTIFACTS = re.compile(r'(\\[nrs]|\s)+$')
+
+def clean_question(question):
+    """
+    Strip the augmentation prompt, the quotes around an echoed question and trailing escape
+    artifacts, without touching the letters of the question itself.
+    """
+    question = REPHRASE_PREFIX.sub('', question).strip()
+    match = QUOTED_QUESTION.match(question)
+    if match:
+        question = match.group('question')
+    return TRAILING_ARTIFACTS.sub('', question).strip()
+
+def embed_questions(questions, model_name="sentence-transformers/all-MiniLM-L6-v2", batch_size=64):
+    """
+    Encode questions in batches into L2-normalized float32 embeddings (dot product = cosine).
+    """
+    from sentence_transformers import SentenceTransformer
+    model = SentenceTransformer(model_name)
+    embeddings = model.encode(
+        questions, batch_size=batch_size, convert_to_numpy=True, normalize_embeddings=True, show_progress_bar=False
+    )
+    return embeddings.astype(np.float32)
+
+def cluster_near_duplicates(embeddings, threshold=0.9, block_size=1024):
+    """
+    Group rows whose cosine similarity reaches ``threshold``. Returns lists of row indices.
+
+    The similarity matrix is computed ``block_size`` rows at a time, so memory stays bounded
+    for large groups. Clustering is greedy in row order: the first unassigned row leads a
+    cluster of every unassigned row similar to it. Unlike connected components this never
+    chains paraphrases of paraphrases into one cluster, so every member is within the
+    threshold of its representative (the leader, listed first).
+    """
+    n = len(embeddings)
+    neighbors = []
+    for start in range(0, n, block_size):
+        similar = (embeddings[start:start + block_size] @ embeddings.T) >= threshold
+        rows, cols = np.nonzero(similar)
+        neighbors.extend(np.split(cols, np.searchsorted(rows, np.arange(1, len(similar)))))
+
+    assigned = np.zeros(n, dtype=bool)
+    clusters = []
+    for leader in range(n):
+        if assigned[leader]:
+            continue
+        members = [leader] + [int(j) for j in neighbors[leader] if j != leader and not assigned[j]]
+        assigned[members] = True
+        clusters.append(members)
+    return clusters
+
+def semantic_dedup(entries, threshold=0.9, model_name="sentence-transformers/all-MiniLM-L6-v2", batch_size=64,
+                   embeddings=None):
+    """
+    Drop near-duplicate questions within each answer group.
+
+    All questions are embedded in one batched pass (or ``embeddings`` can be given); each group
+    of entries sharing an answer is then clustered on its own similarity matrix and only the
+    first entry of every cluster is kept, in input order. Returns the kept entries and the
+    clusters as lists of indices into ``entries``.
+    """
+    if not entries:
+        return [], []
+    if embeddings is None:
+        embeddings = embed_questions([entry['question'] for entry in entries], model_name, batch_size)
 
-def clean_augmented_dataset(input_file=r'C:\Users\moksh\classroom\chatbot_deepseek\industry_chatbot\data\knowledge_base\augmented_qa_pairs.json', 
-                             output_file=r'C:\Users\moksh\classroom\chatbot_deepseek\industry_chatbot\data\knowledge_base\cleaned_augmented_qa_pairs.json'):
-    """Clean and deduplicate augmented QA dataset"""
-    with open(input_file, 'r', encoding='utf-8') as f:
-        augmented_data = json.load(f)
-    
+    groups = defaultdict(list)
+    for i, entry in enumerate(entries):
+        groups[entry['answer'].strip()].append(i)
+
+    clusters = []
+    for indices in groups.values():
+        members = np.asarray(indices)
+        clusters.extend(
+            [int(members[j]) for j in cluster] for cluster in cluster_near_duplicates(embeddings[members], threshold)
+        )
+    keep = sorted(cluster[0] for cluster in clusters)
+    return [entries[i] for i in keep], clusters
+
+def cluster_stats(entries, clusters):
+    """
+    Summary of a deduplication: cluster counts and sizes per answer group.
+    """
+    sizes = np.array([len(cluster) for cluster in clusters]) if clusters else np.zeros(0, dtype=int)
+    return {
+        "entries": len(entries),
+        "answer_groups": len({entries[cluster[0]]['answer'].strip() for cluster in clusters}),
+        "clusters": len(clusters),
+        "duplicates_removed": int(sizes.sum() - len(sizes)),
+        "duplicate_clusters": int((sizes > 1).sum()),
+        "largest_cluster": int(sizes.max()) if len(sizes) else 0,
+        "mean_cluster_size": round(float(sizes.mean()), 3) if len(sizes) else 0.0
+    }
+
+def clean_augmented_dataset(input_file=r'C:\Users\moksh\classroom\chatbot_deepseek\industry_chatbot\data\knowledge_base\augmented_qa_pairs.json',
+                             output_file=r'C:\Users\moksh\classroom\chatbot_deepseek\industry_chatbot\data\knowledge_base\cleaned_augmented_qa_pairs.json',
+                             semantic_threshold=0.9,
+                             model_name="sentence-transformers/all-MiniLM-L6-v2",
+                             batch_size=64,
+                             report_file=None):
+    """
+    Clean and deduplicate augmented QA dataset.
+
+    Questions are cleaned and exact duplicates dropped; then, unless ``semantic_threshold`` is
+    None, near-duplicate paraphrases of the same answer are collapsed to one representative
+    (see ``semantic_dedup``). ``report_file`` receives the cluster stats and every cluster that
+    lost members, as JSON. A ``.qakb`` ``output_file`` also stores the embeddings computed for
+    deduplication, so the inference index is built without re-encoding. Returns the stats.
+    """
     cleaned_data = []
     seen_questions = set()
-    
-    for entry in augmented_data:
-        # Clean question
-        question = re.sub(r'^(Rephrase this question:|\s+)', '', entry['question']).strip()
-        question = re.sub(r'[.nrs]+$', '', question).strip()
-        
+    total = 0
+
+    for entry in iter_qa_records(input_file):
+        total += 1
+        question = clean_question(entry['question'])
+
         # Skip empty or duplicate questions
         if question and question not in seen_questions:
             entry['question'] = question
             cleaned_data.append(entry)
             seen_questions.add(question)
-    
-    with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(cleaned_data, f, indent=2, ensure_ascii=False)
-    
-    print(f"Cleaned dataset: {len(augmented_data)} → {len(cleaned_data)} entries")
+    print(f"Cleaned dataset: {total} → {len(cleaned_data)} entries")
+
+    clusters = [[i] for i in range(len(cleaned_data))]
+    embeddings = None
+    if semantic_threshold is not None and cleaned_data:
+        embeddings = embed_questions([entry['question'] for entry in cleaned_data], model_name, batch_size)
+        deduplicated, clusters = semantic_dedup(cleaned_data, semantic_threshold, embeddings=embeddings)
+    else:
+        deduplicated = cleaned_data
+    stats = cluster_stats(cleaned_data, clusters)
+    stats["input_entries"] = total
+    stats["threshold"] = semantic_threshold
+
+    if is_qa_store(output_file) and embeddings is not None:
+        keep = sorted(cluster[0] for cluster in clusters)
+        write_qa_store(output_file, deduplicated, embeddings[keep], model_name)
+    else:
+        with QARecordWriter(output_file) as writer:
+            for entry in deduplicated:
+                writer.write(entry)
+
+    if semantic_threshold is not None:
+        print(f"Semantic dedup (threshold {semantic_threshold}): {len(cleaned_data)} → {len(deduplicated)} entries "
+              f"in {stats['answer_groups']} answer groups; {stats['duplicate_clusters']} clusters had duplicates "
+              f"(largest {stats['largest_cluster']}, mean size {stats['mean_cluster_size']})")
+    if report_file:
+        report = dict(stats, duplicate_clusters_detail=[
+            {
+                "answer": cleaned_data[cluster[0]]['answer'][:120],
+                "kept": cleaned_data[cluster[0]]['question'],
+                "removed": [cleaned_data[i]['question'] for i in cluster[1:]]
+            }
+            for cluster in clusters if len(cluster) > 1
+        ])
+        with open(report_file, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+    return stats
+
+def main():
+    parser = argparse.ArgumentParser(description="Clean augmented Q&A pairs and remove near-duplicate questions.")
+    parser.add_argument("--input", default=None, help="Augmented Q&A pairs (JSON array or JSONL).")
+    parser.add_argument("--output", default=None, help="Cleaned Q&A pairs (JSON array or JSONL).")
+    parser.add_argument("--threshold", type=float, default=0.9,
+                        help="Cosine similarity at which questions with the same answer are duplicates.")
+    parser.add_argument("--no-semantic", action="store_true", help="Only remove exact duplicates.")
+    parser.add_argument("--model", default="sentence-transformers/all-MiniLM-L6-v2")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--report", help="JSON file for cluster stats and the removed questions.")
+    args = parser.parse_args()
+    paths = {key: value for key, value in (("input_file", args.input), ("output_file", args.output)) if value}
+    clean_augmented_dataset(
+        **paths,
+        semantic_threshold=None if args.no_semantic else args.threshold,
+        model_name=args.model,
+        batch_size=args.batch_size,
+        report_file=args.report
+    )
 
 if __name__ == "__main__":
-    clean_augmented_dataset()
\ No newline at end of file
+    main()
@@ -1,8 +1,14 @@
 import pdfplumber
 import re
-import json
 import os
 from data_processing.question_generator import clean_heading, clean_content, generate_questions
+from data_processing.qa_io import QARecordWriter
+
+def extract_page_text(page):
+    """
+    Extract the text of a single pdfplumber page ("" for empty pages).
+    """
+    return page.extract_text(x_tolerance=2, y_tolerance=2) or ""
 
 def extract_text_from_pdf(pdf_path):
     """
@@ -11,21 +17,18 @@ def extract_text_from_pdf(pdf_path):
     full_text = []
     with pdfplumber.open(pdf_path) as pdf:
         for page in pdf.pages:
-            text = page.extract_text(x_tolerance=2, y_tolerance=2) or ""
-            full_text.append(text)
+            full_text.append(extract_page_text(page))
     return "\n".join(full_text)
 
-def generate_qa_pairs(text):
+# Split before headings (two or more words starting with a capital letter)
+SECTION_SPLIT_PATTERN = re.compile(r'\n(?=(?:[A-Z][A-Za-z0-9&\-/]+(?:\s+|$)){2,})')
+
+def iter_qa_pairs(sections, source="IT Policy Document"):
     """
-    Generate Q&A pairs by detecting policy sections and extracting their content.
+    Yield Q&A pairs for an iterable of raw section texts (heading line followed by content).
     """
-    qa_pairs = []
     unique_sections = set()
 
-    # Regex to split before headings (two or more words starting with a capital letter)
-    section_split_pattern = r'\n(?=(?:[A-Z][A-Za-z0-9&\-/]+(?:\s+|$)){2,})'
-    sections = re.split(section_split_pattern, text)
-
     for section in sections:
         section = section.strip()
         if not section:
@@ -48,20 +51,25 @@ def generate_qa_pairs(text):
         questions = generate_questions(heading)
 
         for q in questions:
-            qa_pairs.append({
+            yield {
                 "question": q,
                 "answer": content,
                 "metadata": {
                     "section": heading,
-                    "source": "IT Policy Document"
+                    "source": source
                 }
-            })
+            }
 
-    return qa_pairs
+def generate_qa_pairs(text):
+    """
+    Generate Q&A pairs by detecting policy sections and extracting their content.
+    """
+    return list(iter_qa_pairs(SECTION_SPLIT_PATTERN.split(text)))
 
 def process_pdf(pdf_path, processed_text_file, output_json_file):
     """
-    Process the PDF, save cleaned text, generate Q&A pairs, and save them as a JSON file.
+    Process the PDF, save cleaned text, generate Q&A pairs, and save them as a JSON file
+    (JSONL or a binary ``.qakb`` store, depending on the extension of ``output_json_file``).
     """
     text = extract_text_from_pdf(pdf_path)
 
@@ -71,14 +79,12 @@ def process_pdf(pdf_path, processed_text_file, output_json_file):
 
     print(f"✅ Extracted text saved to {processed_text_file}")
 
-    # Generate Q&A pairs
-    qa_pairs = generate_qa_pairs(text)
-
-    # Save Q&A pairs as JSON
-    with open(output_json_file, 'w', encoding='utf-8') as f:
-        json.dump(qa_pairs, f, indent=2, ensure_ascii=False)
+    # Generate Q&A pairs and save them as they are produced
+    with QARecordWriter(output_json_file) as writer:
+        for qa_pair in iter_qa_pairs(SECTION_SPLIT_PATTERN.split(text)):
+            writer.write(qa_pair)
 
-    print(f"✅ Generated {len(qa_pairs)} Q&A pairs. Saved to {output_json_file}")
+    print(f"✅ Generated {writer.count} Q&A pairs. Saved to {output_json_file}")
 
 # Example usage: Adjust file paths as needed.
 if __name__ == "__main__":
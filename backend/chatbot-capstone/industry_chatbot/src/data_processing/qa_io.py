@@ -0,0 +1,86 @@
+import os
+import json
+from data_processing.kb_store import QAStore, is_qa_store, write_qa_store
+
+def iter_qa_records(path):
+    """
+    Yield Q&A records from a JSON array file, a JSONL file (one record per line) or a binary
+    ``.qakb`` knowledge-base store.
+    """
+    if is_qa_store(path):
+        yield from QAStore(path).records()
+        return
+    with open(path, 'r', encoding='utf-8') as f:
+        if path.endswith('.jsonl'):
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            yield from json.load(f)
+
+class QARecordWriter:
+    """
+    Stream Q&A records to disk one at a time.
+
+    ``.jsonl`` paths get one compact record per line; any other path gets a JSON array laid out
+    exactly like ``json.dump(records, f, indent=2, ensure_ascii=False)``. ``offset()`` returns a
+    position that ``resume_offset`` can later truncate back to, so an interrupted run can be
+    continued without duplicating or corrupting records.
+
+    ``.qakb`` paths are streamed to a ``<path>.rows.jsonl`` spill file (which offsets and
+    resuming refer to) and converted to the binary store on ``close()``. When the ``with``
+    block raises, the spill file is kept instead, so a resumed run can append to it.
+    """
+
+    def __init__(self, path, resume_offset=None, resume_count=0):
+        self.store_path = path if is_qa_store(path) else None
+        if self.store_path:
+            path = f"{path}.rows.jsonl"
+        self.path = path
+        self.jsonl = path.endswith('.jsonl')
+        if resume_offset is not None:
+            if not os.path.exists(path):
+                raise FileNotFoundError(f"Cannot resume writing {path}: the partial output is missing")
+            self._file = open(path, 'r+', encoding='utf-8', newline='')
+            self._file.seek(resume_offset)
+            self._file.truncate()
+            self.count = resume_count
+        else:
+            self._file = open(path, 'w', encoding='utf-8', newline='')
+            self.count = 0
+            if not self.jsonl:
+                self._file.write('[')
+
+    def write(self, record):
+        if self.jsonl:
+            self._file.write(json.dumps(record, ensure_ascii=False) + '\n')
+        else:
+            body = json.dumps(record, indent=2, ensure_ascii=False).replace('\n', '\n  ')
+            self._file.write((',\n  ' if self.count else '\n  ') + body)
+        self.count += 1
+
+    def offset(self):
+        """
+        Flush buffered records to disk and return the current end position.
+        """
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        return self._file.tell()
+
+    def close(self, finalize=True):
+        """
+        Close the output. With ``finalize`` False a ``.qakb`` spill file is left in place
+        (unconverted) for a later resume.
+        """
+        if not self.jsonl:
+            self._file.write('\n]' if self.count else ']')
+        self._file.close()
+        if self.store_path and finalize:
+            write_qa_store(self.store_path, iter_qa_records(self.path))
+            os.remove(self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close(finalize=exc_type is None)
@@ -0,0 +1,25 @@
+"""
+gunicorn configuration for pre-fork serving (see ``prefork.py`` for the design).
+
+    gunicorn -c gunicorn.conf.py App:app
+
+``preload_app`` loads App (models, knowledge base, index) once in the master; workers are
+forked from it and share the read-only pages copy-on-write.
+"""
+import os
+from prefork import WORKERS, configure_worker, worker_threads
+
+bind = os.environ.get('QA_BIND', '127.0.0.1:5000')
+workers = WORKERS
+worker_class = 'gthread'
+threads = int(os.environ.get('QA_WORKER_THREADS', 4))
+preload_app = True
+
+
+def when_ready(server):
+    from qa_service import qa_system
+    qa_system.prepare_for_fork()
+
+
+def post_fork(server, worker):
+    configure_worker(worker_threads(workers))
@@ -1,33 +1,64 @@
-from transformers import AutoTokenizer, AutoModelForCausalLM
-
-model_path = "./fine_tuned_model"  # Path to your fine-tuned model
-
-# Load the fine-tuned model
-tokenizer = AutoTokenizer.from_pretrained(model_path)
-model = AutoModelForCausalLM.from_pretrained(model_path).to("cuda")
-
-# Ensure the tokenizer has a padding token
-tokenizer.pad_token = tokenizer.eos_token
-
-# Generate response from a test question
-input_text = "Question: Explain server monitoring policy according to the IT policy?"
-inputs = tokenizer(
-    input_text, return_tensors="pt", padding=True, truncation=True
-).to("cuda")  # Move inputs to GPU
-
-# Generate output with controlled randomness
-output = model.generate(
-    inputs["input_ids"],
-    attention_mask=inputs["attention_mask"],  # ✅ Explicitly passing attention mask
-    max_length=100,
-    do_sample=True,  # Enable sampling instead of greedy search
-    top_k=50,  # Keep top 50 most likely words
-    top_p=0.9,  # Use nucleus sampling
-    temperature=0.7,  # Lower values = more deterministic responses
-    repetition_penalty=1.2,  # ✅ Reduces repetitive text
-    pad_token_id=tokenizer.eos_token_id,  # ✅ Explicitly set padding token
+"""
+Serve the fine-tuned checkpoint written by ``Model_finetuning.train_model``.
+
+The model runs through ``PolicyQASystem`` with the "fine-tuned" generator profile, so it shares
+the batched, prefix-cached generation path, device auto-selection (CUDA when available, CPU
+otherwise) and the retrieval shortcut for confident matches with the base model. ``--generate``
+skips retrieval and always answers with the model.
+
+Usage (from the ``src`` directory):
+    python -m inference.Custom_model_inference "Explain server monitoring policy according to the IT policy?"
+    python -m inference.Custom_model_inference --generate --temperature 0.7 --top-p 0.9 "What is our leave policy?"
+"""
+import os
+import sys
+import logging
+import argparse
+from inference.inference import PolicyQASystem
+
+DEFAULT_DATA = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "..", "data", "knowledge_base", "cleaned_augmented_qa_pairs.json"
 )
 
-# Decode and print the response
-response = tokenizer.decode(output[0], skip_special_tokens=True)
-print(response)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Answer questions with the fine-tuned model.")
+    parser.add_argument("queries", nargs="*", default=["Explain server monitoring policy according to the IT policy?"])
+    parser.add_argument("--model", default="./fine_tuned_model", help="Path to your fine-tuned model.")
+    parser.add_argument("--data", default=DEFAULT_DATA)
+    parser.add_argument("--retrieval-model", default="sentence-transformers/all-MiniLM-L6-v2")
+    parser.add_argument("--device", default="auto", help='"auto", "cpu" or "cuda".')
+    parser.add_argument("--threshold", type=float, default=0.7, help="Retrieval confidence needed to skip generation.")
+    parser.add_argument("--generate", action="store_true", help="Always generate, without retrieval.")
+    parser.add_argument("--max-new-tokens", type=int, default=80)
+    parser.add_argument("--temperature", type=float, default=0.7)  # Lower values = more deterministic responses
+    parser.add_argument("--top-p", type=float, default=0.9)
+    parser.add_argument("--greedy", action="store_true", help="Disable sampling.")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    sampling = {"max_new_tokens": args.max_new_tokens}
+    if args.greedy:
+        sampling.update(do_sample=False, temperature=None, top_p=None, top_k=None)
+    else:
+        sampling.update(temperature=args.temperature, top_p=args.top_p)
+    qa_system = PolicyQASystem(
+        data_path=args.data,
+        retrieval_model=args.retrieval_model,
+        gen_model=args.model,
+        generator="fine-tuned",
+        device=args.device,
+        sampling=sampling,
+        lazy_generator=not args.generate
+    )
+    if args.generate:
+        responses = qa_system.generate(args.queries)
+    else:
+        responses = qa_system.get_answers(args.queries, args.threshold)
+    for query, response in zip(args.queries, responses):
+        print(f"Query: {query}\nResponse: {response}\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+import logging
+from typing import TYPE_CHECKING, Dict, Optional, Tuple
+
+# torch, transformers and sentence-transformers take seconds to import; they are only imported
+# when a model is actually loaded.
+if TYPE_CHECKING:
+    import torch
+    from sentence_transformers import SentenceTransformer
+    from transformers import AutoTokenizer
+
+# "torch": full-precision eager PyTorch (reference).
+# "int8": dynamic int8 quantization of every nn.Linear (weights int8, activations quantized on the fly).
+# "onnx": ONNX Runtime export of both models (requires ``optimum[onnxruntime]``).
+# "fake": deterministic fixed-latency stand-ins for load testing (``inference.fake_models``).
+INFERENCE_BACKENDS = ("torch", "int8", "onnx", "fake")
+
+
+def _check_backend(backend: str) -> None:
+    if backend not in INFERENCE_BACKENDS:
+        raise ValueError(f"Unknown inference backend '{backend}'; expected one of {INFERENCE_BACKENDS}")
+
+
+def quantize_int8(model: torch.nn.Module) -> torch.nn.Module:
+    """
+    Apply dynamic int8 quantization to the linear layers of a model for CPU inference.
+    """
+    import torch
+    model.eval()
+    return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def resolve_device(device: str = "auto", backend: str = "torch") -> str:
+    """
+    Pick the device for the generator: CUDA when requested or (for "auto") available, the CPU
+    otherwise. The int8, onnx and fake backends only run on the CPU.
+    """
+    if backend != "torch" or device == "cpu":
+        return "cpu"
+    import torch
+    if device == "auto":
+        return "cuda" if torch.cuda.is_available() else "cpu"
+    return device
+
+
+def load_retrieval_model(
+    model_name: str,
+    backend: str = "torch",
+    logger: Optional[logging.Logger] = None,
+    fake_latency: Optional[Dict[str, float]] = None
+) -> SentenceTransformer:
+    """
+    Load the sentence transformer used for semantic search with the requested backend.
+    """
+    _check_backend(backend)
+    logger = logger or logging.getLogger(__name__)
+    if backend == "fake":
+        from inference.fake_models import FakeEncoder
+        logger.info(f"Using the fake retrieval model instead of {model_name}.")
+        return FakeEncoder(latency=fake_latency)
+    from sentence_transformers import SentenceTransformer
+    if backend == "onnx":
+        # sentence-transformers exports the encoder through optimum on first use.
+        model = SentenceTransformer(model_name, device="cpu", backend="onnx")
+    else:
+        model = SentenceTransformer(model_name)
+        if backend == "int8":
+            model = quantize_int8(model.to("cpu"))
+    logger.info(f"Loaded retrieval model {model_name} with {backend} backend.")
+    return model
+
+
+def load_generator(
+    model_name: str,
+    backend: str = "torch",
+    logger: Optional[logging.Logger] = None,
+    device: str = "cpu",
+    fake_latency: Optional[Dict[str, float]] = None
+) -> Tuple[AutoTokenizer, torch.nn.Module]:
+    """
+    Load the tokenizer and causal language model used for the generative fallback.
+
+    ``device`` is passed through ``resolve_device``; if the model cannot be moved to a GPU
+    (e.g. out of memory) it stays on the CPU.
+    """
+    _check_backend(backend)
+    logger = logger or logging.getLogger(__name__)
+    if backend == "fake":
+        from inference.fake_models import FakeGenerator, FakeTokenizer
+        logger.info(f"Using the fake generator instead of {model_name}.")
+        tokenizer = FakeTokenizer()
+        return tokenizer, FakeGenerator(tokenizer, fake_latency)
+    from transformers import AutoModelForCausalLM, AutoTokenizer
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    if backend == "onnx":
+        try:
+            from optimum.onnxruntime import ORTModelForCausalLM
+        except ImportError as e:
+            raise ImportError("The onnx backend requires `pip install optimum[onnxruntime]`") from e
+        model = ORTModelForCausalLM.from_pretrained(model_name, export=True)
+    else:
+        model = AutoModelForCausalLM.from_pretrained(model_name)
+        model.eval()
+        if backend == "int8":
+            model = quantize_int8(model)
+        device = resolve_device(device, backend)
+        if device != "cpu":
+            try:
+                model = model.to(device)
+            except RuntimeError as e:
+                logger.warning(f"Could not move generator to {device}; using the CPU: {e}")
+                model = model.to("cpu")
+    logger.info(f"Loaded generator {model_name} with {backend} backend on {model.device}.")
+    return tokenizer, model
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+import os
+import time
+import queue
+import logging
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, List, Optional
+
+
+class MicroBatcher:
+    """
+    Collects concurrently submitted items for a short window and hands them to a batch
+    handler together.
+
+    Request threads call ``submit`` and block on the returned future; a single background
+    worker drains the queue, waiting at most ``max_wait_ms`` after the first item for more
+    items to arrive (up to ``max_batch_size``), then calls ``handler`` once for the batch.
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[List[Any]], List[Any]],
+        max_batch_size: int = 8,
+        max_wait_ms: float = 5.0,
+        logger: Optional[logging.Logger] = None
+    ):
+        """
+        Initialize the batcher.
+
+        Args:
+            handler (Callable): Function mapping a list of items to a list of results of the same length.
+            max_batch_size (int): Maximum number of items passed to one handler call.
+            max_wait_ms (float): Maximum time to wait for a batch to fill after its first item arrives.
+            logger (Optional[logging.Logger]): Custom logger for tracking operations.
+        """
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be at least 1")
+        self.handler = handler
+        self.max_batch_size = max_batch_size
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self.logger = logger or logging.getLogger(__name__)
+        self._queue: "queue.Queue" = queue.Queue()
+        self._lock = threading.Lock()
+        self._worker: Optional[threading.Thread] = None
+        self._worker_pid: Optional[int] = None
+        self._closed = False
+
+    def _ensure_worker(self) -> None:
+        # The worker is started lazily (and restarted after a fork) so the batcher can be
+        # created at import time in a pre-forking server.
+        if self._worker is not None and self._worker_pid == os.getpid() and self._worker.is_alive():
+            return
+        with self._lock:
+            if self._worker is not None and self._worker_pid == os.getpid() and self._worker.is_alive():
+                return
+            if self._worker_pid != os.getpid():
+                self._queue = queue.Queue()
+            self._worker = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+            self._worker_pid = os.getpid()
+            self._worker.start()
+
+    def submit(self, item: Any) -> Future:
+        """
+        Queue an item for batched processing and return a future for its result.
+        """
+        if self._closed:
+            raise RuntimeError("MicroBatcher is closed")
+        self._ensure_worker()
+        future: Future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def __call__(self, item: Any, timeout: Optional[float] = None) -> Any:
+        """
+        Submit an item and block until its result is available.
+        """
+        return self.submit(item).result(timeout=timeout)
+
+    def close(self) -> None:
+        """
+        Stop the worker after the items already queued have been processed.
+        """
+        self._closed = True
+        if self._worker is not None and self._worker.is_alive():
+            self._queue.put(None)
+            self._worker.join()
+
+    def _collect(self) -> List:
+        first = self._queue.get()
+        if first is None:
+            return []
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                # Re-queue the shutdown marker so the loop exits after this batch.
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._collect()
+            if not batch:
+                return
+            items = [item for item, _ in batch]
+            try:
+                results = self.handler(items)
+                if len(results) != len(items):
+                    raise RuntimeError(f"Batch handler returned {len(results)} results for {len(items)} items")
+            except Exception as e:
+                self.logger.error(f"Batch processing failed: {e}")
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+import re
+import time
+import threading
+import numpy as np
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+_MISSING = object()
+
+
+class LRUTTLCache:
+    """
+    A thread-safe, size-bounded LRU cache whose entries also expire after a fixed TTL.
+    """
+
+    def __init__(self, max_size: int = 1024, ttl_seconds: Optional[float] = 3600.0):
+        """
+        Initialize the cache.
+
+        Args:
+            max_size (int): Maximum number of entries; the least recently used entry is evicted first.
+            ttl_seconds (Optional[float]): Lifetime of an entry in seconds, or None for no expiry.
+        """
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _expired(self, stored_at: float, now: float) -> bool:
+        return self.ttl_seconds is not None and now - stored_at > self.ttl_seconds
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """
+        Return the cached value for ``key`` (marking it most recently used), or ``default``.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key, _MISSING)
+            if entry is not _MISSING and self._expired(entry[0], now):
+                del self._entries[key]
+                entry = _MISSING
+            if entry is _MISSING:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: Hashable, value: Any) -> None:
+        """
+        Store ``value`` under ``key``, evicting the least recently used entries if needed.
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._entries[key] = (now, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def snapshot(self) -> Dict[Hashable, Any]:
+        """
+        Return the live (non-expired) entries, dropping expired ones along the way.
+        """
+        now = time.monotonic()
+        with self._lock:
+            for key in [k for k, (stored_at, _) in self._entries.items() if self._expired(stored_at, now)]:
+                del self._entries[key]
+            return {key: value for key, (_, value) in self._entries.items()}
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions
+        }
+
+
+class AnswerCache:
+    """
+    Three-tier answer cache placed in front of PolicyQASystem retrieval and generation.
+
+    1. Exact: normalized query text -> final answer, checked before the encoder runs.
+    2. Semantic: cached query embeddings -> final answer, hit when a new query's embedding
+       has cosine similarity of at least ``semantic_threshold`` with a cached one.
+    3. Generation: (best_match index, normalized query) -> generated response, so the
+       generative fallback is never paid twice for the same query and context.
+
+    ``invalidate`` clears every tier and bumps a version number; answers computed against
+    an older knowledge base version are dropped instead of being stored.
+    """
+
+    def __init__(
+        self,
+        max_size: int = 1024,
+        ttl_seconds: Optional[float] = 3600.0,
+        semantic_threshold: float = 0.95,
+        semantic_max_size: int = 512,
+        generation_max_size: int = 256,
+        generation_ttl_seconds: Optional[float] = 6 * 3600.0
+    ):
+        """
+        Initialize the cache tiers.
+
+        Args:
+            max_size (int): Maximum number of exact-match entries.
+            ttl_seconds (Optional[float]): Lifetime of exact and semantic entries.
+            semantic_threshold (float): Minimum cosine similarity for a semantic hit.
+            semantic_max_size (int): Maximum number of cached query embeddings.
+            generation_max_size (int): Maximum number of cached generated responses.
+            generation_ttl_seconds (Optional[float]): Lifetime of generated responses.
+        """
+        self.semantic_threshold = semantic_threshold
+        self.exact = LRUTTLCache(max_size, ttl_seconds)
+        self.semantic = LRUTTLCache(semantic_max_size, ttl_seconds)
+        self.generation = LRUTTLCache(generation_max_size, generation_ttl_seconds)
+        self.semantic_hits = 0
+        self.semantic_misses = 0
+        self.version = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def normalize(query: str) -> str:
+        """
+        Normalize a query for exact matching: lowercase, collapse whitespace and drop
+        trailing punctuation.
+        """
+        return re.sub(r'\s+', ' ', query.lower()).strip().rstrip('?!. ')
+
+    def get_exact(self, query: str) -> Optional[str]:
+        return self.exact.get(self.normalize(query))
+
+    def get_semantic(self, embedding: np.ndarray) -> Optional[str]:
+        """
+        Return the answer of the most similar cached query if it clears the threshold.
+
+        ``embedding`` must be L2-normalized, like the vectors stored by ``put``.
+        """
+        entries = self.semantic.snapshot()
+        if entries:
+            keys = list(entries)
+            matrix = np.stack([entries[key][0] for key in keys])
+            scores = matrix @ np.asarray(embedding, dtype=np.float32).reshape(-1)
+            best = int(np.argmax(scores))
+            if scores[best] >= self.semantic_threshold:
+                entry = self.semantic.get(keys[best])
+                if entry is not None:
+                    with self._lock:
+                        self.semantic_hits += 1
+                    return entry[1]
+        with self._lock:
+            self.semantic_misses += 1
+        return None
+
+    def get_generated(self, best_match: int, query: str) -> Optional[str]:
+        return self.generation.get((int(best_match), self.normalize(query)))
+
+    def put(self, query: str, embedding: Optional[np.ndarray], answer: str, version: int) -> None:
+        """
+        Cache a final answer in the exact tier and, when an embedding is given, the semantic tier.
+        """
+        if version != self.version:
+            return
+        key = self.normalize(query)
+        self.exact.set(key, answer)
+        if embedding is not None:
+            self.semantic.set(key, (np.array(embedding, dtype=np.float32).reshape(-1), answer))
+
+    def put_generated(self, best_match: int, query: str, response: str, version: int) -> None:
+        if version != self.version:
+            return
+        self.generation.set((int(best_match), self.normalize(query)), response)
+
+    def invalidate(self) -> None:
+        """
+        Drop every cached entry, e.g. after the knowledge base has been reloaded.
+        """
+        with self._lock:
+            self.version += 1
+        self.exact.clear()
+        self.semantic.clear()
+        self.generation.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        semantic = self.semantic.stats()
+        semantic["hits"] = self.semantic_hits
+        semantic["misses"] = self.semantic_misses
+        return {
+            "version": self.version,
+            "exact": self.exact.stats(),
+            "semantic": semantic,
+            "generation": self.generation.stats()
+        }
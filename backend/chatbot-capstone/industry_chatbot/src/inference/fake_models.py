@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""
+Deterministic stand-ins for the retrieval model and the generator (``inference_backend="fake"``).
+
+They need no checkpoint or download and take a fixed, configurable time per call, so the
+serving stack (micro-batching, workers, caches) can be load-tested hermetically with model
+latencies of a chosen size:
+
+* ``FakeEncoder`` embeds text as a signed hashed bag of words, so a knowledge-base question is
+  still most similar to itself and its paraphrases and retrieval paths behave realistically;
+* ``FakeTokenizer`` / ``FakeGenerator`` implement the parts of the Hugging Face tokenizer and
+  ``generate`` API that PolicyQASystem uses (padding, decoding, streamers, stopping criteria).
+  The generated text is taken from the prompt's context, one word per token.
+
+Select it with ``PolicyQASystem(..., inference_backend="fake", fake_latency={...})`` (servers:
+``QA_INFERENCE_BACKEND=fake`` and ``QA_FAKE_LATENCY``); model names are ignored.
+
+Each model serializes its calls like a single accelerator would: concurrent requests queue
+behind each other, and batching amortizes the per-call latency.
+"""
+import re
+import time
+import zlib
+import threading
+from typing import Dict, List, Optional, Union
+import numpy as np
+
+# Milliseconds per call ("encode_ms", "prefill_ms"), per encoded text ("encode_per_text_ms")
+# and per decoding step of a generate batch ("token_ms"); "response_tokens" is the length at
+# which every fake response ends, like an end-of-sequence token.
+DEFAULT_FAKE_LATENCY = {
+    "encode_ms": 4.0,
+    "encode_per_text_ms": 0.5,
+    "prefill_ms": 30.0,
+    "token_ms": 15.0,
+    "response_tokens": 32
+}
+
+_WORD = re.compile(r"\w+")
+
+
+def fake_latency(overrides: Optional[Dict[str, float]] = None) -> Dict[str, float]:
+    """
+    ``DEFAULT_FAKE_LATENCY`` updated with ``overrides``.
+    """
+    overrides = dict(overrides or {})
+    unknown = sorted(set(overrides) - set(DEFAULT_FAKE_LATENCY))
+    if unknown:
+        raise ValueError(f"Unknown fake latency settings {unknown}; expected any of {tuple(DEFAULT_FAKE_LATENCY)}")
+    return dict(DEFAULT_FAKE_LATENCY, **overrides)
+
+
+class FakeEncoder:
+    """
+    Sentence encoder with the ``encode`` signature of ``SentenceTransformer``.
+    """
+
+    def __init__(self, dim: int = 384, latency: Optional[Dict[str, float]] = None):
+        self.dim = dim
+        self.latency = fake_latency(latency)
+        self._lock = threading.Lock()
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.dim
+
+    def _embed(self, text: str) -> np.ndarray:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for word in _WORD.findall(text.lower()):
+            digest = zlib.crc32(word.encode("utf-8"))
+            vector[digest % self.dim] += 1.0 if digest & (1 << 31) else -1.0
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def encode(self, sentences: Union[str, List[str]], convert_to_numpy: bool = True, **kwargs) -> np.ndarray:
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        with self._lock:
+            time.sleep((self.latency["encode_ms"] + self.latency["encode_per_text_ms"] * len(texts)) / 1000.0)
+        embeddings = np.stack([self._embed(text) for text in texts]) if texts else np.zeros((0, self.dim), np.float32)
+        return embeddings[0] if single else embeddings
+
+
+class FakeTokenizer:
+    """
+    Word-level tokenizer with a vocabulary that grows as text is seen (ids 0 and 1 are the
+    pad and end-of-sequence tokens).
+    """
+
+    pad_token = "<pad>"
+    eos_token = "<eos>"
+    pad_token_id = 0
+    eos_token_id = 1
+
+    def __init__(self):
+        self.padding_side = "left"
+        self._ids: Dict[str, int] = {self.pad_token: 0, self.eos_token: 1}
+        self._words: List[str] = [self.pad_token, self.eos_token]
+        self._lock = threading.Lock()
+
+    def _encode(self, text: str) -> List[int]:
+        ids = []
+        for word in text.split():
+            token_id = self._ids.get(word)
+            if token_id is None:
+                with self._lock:
+                    token_id = self._ids.setdefault(word, len(self._words))
+                    if token_id == len(self._words):
+                        self._words.append(word)
+            ids.append(token_id)
+        return ids
+
+    def __call__(self, text: Union[str, List[str]], return_tensors: Optional[str] = None, padding: bool = False,
+                 add_special_tokens: bool = True, **kwargs):
+        from transformers import BatchEncoding
+        rows = [self._encode(t) for t in ([text] if isinstance(text, str) else text)]
+        if return_tensors is None:
+            if isinstance(text, str):
+                return BatchEncoding({"input_ids": rows[0], "attention_mask": [1] * len(rows[0])})
+            return BatchEncoding({"input_ids": rows, "attention_mask": [[1] * len(row) for row in rows]})
+        import torch
+        width = max((len(row) for row in rows), default=0)
+        input_ids = torch.full((len(rows), width), self.pad_token_id, dtype=torch.long)
+        attention_mask = torch.zeros((len(rows), width), dtype=torch.long)
+        for i, row in enumerate(rows):
+            if row:
+                input_ids[i, width - len(row):] = torch.tensor(row)
+                attention_mask[i, width - len(row):] = 1
+        return BatchEncoding({"input_ids": input_ids, "attention_mask": attention_mask})
+
+    def decode(self, token_ids, skip_special_tokens: bool = False, **kwargs) -> str:
+        ids = token_ids.tolist() if hasattr(token_ids, "tolist") else list(token_ids)
+        if isinstance(ids, int):
+            ids = [ids]
+        words = [self._words[i] for i in ids if not (skip_special_tokens and i in (self.pad_token_id, self.eos_token_id))]
+        return " ".join(words) + (" " if words else "")
+
+    def batch_decode(self, sequences, **kwargs) -> List[str]:
+        return [self.decode(row, **kwargs) for row in sequences]
+
+
+class _FakeConfig:
+    pad_token_id = FakeTokenizer.pad_token_id
+
+
+class FakeGenerateOutput:
+    def __init__(self, sequences):
+        self.sequences = sequences
+        self.past_key_values = None
+
+
+class FakeGenerator:
+    """
+    Causal LM with the ``generate`` signature used by PolicyQASystem. Every row continues with
+    the words of its prompt after the last "Context:" (or the whole prompt), one per decoding
+    step (up to the following "Query:"), until ``response_tokens``, the length limit or a
+    stopping criterion ends it.
+    """
+
+    def __init__(self, tokenizer: FakeTokenizer, latency: Optional[Dict[str, float]] = None):
+        import torch
+        self.tokenizer = tokenizer
+        self.latency = fake_latency(latency)
+        self.device = torch.device("cpu")
+        self.config = _FakeConfig()
+        self._lock = threading.Lock()
+        self._context_marker = tokenizer._encode("Context:")
+        self._query_marker = tokenizer._encode("Query:")
+
+    def _continuation(self, prompt: List[int]) -> List[int]:
+        start, end = 0, len(prompt)
+        if self._context_marker[0] in prompt:
+            start = len(prompt) - prompt[::-1].index(self._context_marker[0])
+        if self._query_marker[0] in prompt[start:]:
+            end = start + prompt[start:].index(self._query_marker[0])
+        source = prompt[start:end] or prompt or [self.tokenizer.eos_token_id]
+        return [source[i % len(source)] for i in range(int(self.latency["response_tokens"]))]
+
+    def generate(self, input_ids=None, attention_mask=None, max_new_tokens: Optional[int] = None,
+                 max_length: Optional[int] = None, streamer=None, stopping_criteria=None,
+                 return_dict_in_generate: bool = False, **kwargs):
+        import torch
+        prompt_length = input_ids.shape[1]
+        limit = max_new_tokens if max_new_tokens is not None else max(0, (max_length or prompt_length) - prompt_length)
+        masks = attention_mask if attention_mask is not None else torch.ones_like(input_ids)
+        continuations = [
+            self._continuation(row[mask.bool()].tolist()) + [self.tokenizer.eos_token_id]
+            for row, mask in zip(input_ids, masks)
+        ]
+        sequences = input_ids
+        finished = torch.zeros(len(input_ids), dtype=torch.bool)
+        with self._lock:
+            time.sleep(self.latency["prefill_ms"] / 1000.0)
+            if streamer is not None:
+                streamer.put(input_ids)
+            for step in range(limit):
+                if bool(finished.all()):
+                    break
+                time.sleep(self.latency["token_ms"] / 1000.0)
+                next_tokens = torch.tensor([
+                    self.tokenizer.pad_token_id if done else continuation[min(step, len(continuation) - 1)]
+                    for done, continuation in zip(finished.tolist(), continuations)
+                ])
+                sequences = torch.cat([sequences, next_tokens[:, None]], dim=1)
+                if streamer is not None:
+                    streamer.put(next_tokens)
+                finished |= next_tokens == self.tokenizer.eos_token_id
+                for criteria in stopping_criteria or []:
+                    finished |= criteria(sequences, None)
+        if streamer is not None:
+            streamer.end()
+        return FakeGenerateOutput(sequences) if return_dict_in_generate else sequences
+
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+POLICY_PROMPT_PREFIX = (
+    "You are an organizational policy assistant. "
+    "Use the following policy context to answer the query. Do not add any information not present in the context.\n\n"
+)
+
+# "policy": a base causal LM (GPT-Neo) prompted with instructions and the retrieved context.
+# "fine-tuned": a checkpoint trained by ``Model_finetuning.train_model`` on "Question: ...
+# Answer: ..." pairs; it answers from what it learned and is prompted with the query only.
+GENERATORS = ("policy", "fine-tuned")
+
+# ``generate`` arguments that may be set through ``sampling``.
+SAMPLING_KEYS = (
+    "max_length", "max_new_tokens", "do_sample", "temperature", "top_k", "top_p",
+    "repetition_penalty", "no_repeat_ngram_size", "num_beams", "early_stopping"
+)
+
+
+def policy_prompt_head(context: str) -> str:
+    """
+    The query-independent start of the generative prompt: instructions and policy context.
+    """
+    return POLICY_PROMPT_PREFIX + f"Policy Context: {context}"
+
+
+def build_policy_prompt(query: str, context: str) -> str:
+    """
+    Build the generative prompt that anchors the answer in the retrieved policy context.
+    """
+    return policy_prompt_head(context) + f"\n\nQuery: {query}\n\nAnswer:"
+
+
+class GeneratorProfile(ABC):
+    """
+    How one kind of generator is prompted, its default checkpoint and its default sampling.
+
+    PolicyQASystem runs every profile through the same batched, prefix-cached generation path;
+    a profile only decides the prompt text, which parts of it are reusable across queries and
+    how the decoded continuation is cleaned up.
+    """
+
+    name = ""
+    default_model = ""
+    uses_context = True
+    default_sampling: Dict[str, Any] = {}
+    # Text that ends an answer; generation stops once it is produced.
+    stop_strings: Tuple[str, ...] = ()
+
+    @abstractmethod
+    def build_prompt(self, query: str, context: str) -> str:
+        """
+        The full generation prompt for a query and its retrieved context.
+        """
+
+    def prompt_heads(self, context: str) -> List[str]:
+        """
+        Query-independent prompt prefixes worth caching for ``context``, longest first.
+        """
+        return []
+
+    def clean_response(self, text: str) -> str:
+        return text.strip()
+
+    def sampling(self, overrides: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        ``generate`` arguments: the profile defaults updated with ``overrides``.
+        """
+        overrides = dict(overrides or {})
+        unknown = sorted(set(overrides) - set(SAMPLING_KEYS))
+        if unknown:
+            raise ValueError(f"Unknown sampling settings {unknown}; expected any of {SAMPLING_KEYS}")
+        settings = dict(self.default_sampling)
+        # A length limit in the overrides replaces the default one.
+        if "max_length" in overrides or "max_new_tokens" in overrides:
+            settings.pop("max_length", None)
+            settings.pop("max_new_tokens", None)
+        settings.update(overrides)
+        return settings
+
+
+class PolicyPromptProfile(GeneratorProfile):
+    """
+    Base model prompted with the instruction preamble, the retrieved policy context and the query.
+    """
+
+    name = "policy"
+    default_model = "EleutherAI/gpt-neo-125M"
+    default_sampling = {"max_length": 550, "no_repeat_ngram_size": 2, "early_stopping": True}
+
+    def build_prompt(self, query: str, context: str) -> str:
+        return build_policy_prompt(query, context)
+
+    def prompt_heads(self, context: str) -> List[str]:
+        # Packed contexts are answers joined by blank lines; each shorter run is a prefix too.
+        parts = context.split("\n\n")
+        return [policy_prompt_head("\n\n".join(parts[:count])) for count in range(len(parts), 0, -1)]
+
+
+class FineTunedProfile(GeneratorProfile):
+    """
+    Checkpoint fine-tuned on the knowledge base, prompted in its training format.
+    """
+
+    name = "fine-tuned"
+    default_model = "./fine_tuned_model"
+    uses_context = False
+    # The model continues with the next training example after its answer.
+    stop_strings = ("\nQuestion:",)
+    default_sampling = {
+        "max_new_tokens": 80,
+        "do_sample": True,  # Enable sampling instead of greedy search
+        "top_k": 50,
+        "top_p": 0.9,
+        "temperature": 0.7,
+        "repetition_penalty": 1.2
+    }
+
+    def build_prompt(self, query: str, context: str) -> str:
+        return f"Question: {query}\nAnswer:"
+
+    def clean_response(self, text: str) -> str:
+        return text.split(self.stop_strings[0], 1)[0].strip()
+
+
+def stop_on_text(tokenizer, stops: Tuple[str, ...], prompt_length: int, window: int = 8):
+    """
+    A ``StoppingCriteria`` that ends each row once its decoded continuation contains one of
+    ``stops``. Only the last ``window`` tokens are decoded per step, so it works with any
+    tokenizer (``generate(stop_strings=...)`` needs a byte-level BPE vocabulary).
+    """
+    import torch
+    from transformers import StoppingCriteria
+
+    class StopOnText(StoppingCriteria):
+        def __call__(self, input_ids, scores, **kwargs):
+            tails = tokenizer.batch_decode(input_ids[:, max(prompt_length, input_ids.shape[1] - window):])
+            return torch.tensor(
+                [any(stop in tail for stop in stops) for tail in tails], dtype=torch.bool, device=input_ids.device
+            )
+
+    return StopOnText()
+
+
+def load_generator_profile(generator: Union[str, GeneratorProfile]) -> GeneratorProfile:
+    """
+    Resolve a generator name from ``GENERATORS`` (or pass through a profile instance).
+    """
+    if isinstance(generator, GeneratorProfile):
+        return generator
+    if generator == "policy":
+        return PolicyPromptProfile()
+    if generator == "fine-tuned":
+        return FineTunedProfile()
+    raise ValueError(f"Unknown generator '{generator}'; expected one of {GENERATORS}")
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+import os
+import json
+import shutil
+import hashlib
+import logging
+import tempfile
+import numpy as np
+from typing import TYPE_CHECKING, Optional, Tuple
+
+if TYPE_CHECKING:
+    import faiss
+
+# Bump whenever the on-disk layout changes so stale caches are ignored.
+INDEX_STORE_VERSION = 2
+
+
+class EmbeddingIndexStore:
+    """
+    On-disk store for the normalized question embeddings and the FAISS index built from them.
+
+    Each entry lives in its own directory named after a content key, so a change to the
+    knowledge base file or to the retrieval model yields a new key and forces a rebuild,
+    while unchanged data is loaded straight from disk (memory-mapped where possible).
+    """
+
+    EMBEDDINGS_FILE = "embeddings.npy"
+    INDEX_FILE = "index.faiss"
+    META_FILE = "meta.json"
+
+    def __init__(self, cache_dir: str, logger: Optional[logging.Logger] = None):
+        """
+        Initialize the store.
+
+        Args:
+            cache_dir (str): Directory in which index entries are stored.
+            logger (Optional[logging.Logger]): Custom logger for tracking operations.
+        """
+        self.cache_dir = cache_dir
+        self.logger = logger or logging.getLogger(__name__)
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @staticmethod
+    def compute_key(data_path: str, model_name: str, *extra: str) -> str:
+        """
+        Compute a cache key from the content of the data file, the retrieval model name
+        and any extra parameters that affect the index layout.
+        """
+        digest = hashlib.sha256()
+        digest.update(f"v{INDEX_STORE_VERSION}\0{model_name}\0".encode("utf-8"))
+        for part in extra:
+            digest.update(f"{part}\0".encode("utf-8"))
+        with open(data_path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def _entry_dir(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key)
+
+    def load(self, key: str, mmap: bool = True) -> Optional[Tuple[np.ndarray, faiss.Index]]:
+        """
+        Load the embeddings and index stored under ``key``.
+
+        Returns None when no complete entry exists, when it was written by another store
+        version or when it cannot be read, in which case the caller is expected to rebuild and
+        save a fresh entry.
+        """
+        import faiss
+        entry_dir = self._entry_dir(key)
+        meta_path = os.path.join(entry_dir, self.META_FILE)
+        if not os.path.isfile(meta_path):
+            return None
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                version = json.load(f).get("version")
+        except (OSError, ValueError) as e:
+            self.logger.warning(f"Discarding index cache entry {key} with unreadable metadata: {e}")
+            return None
+        if version != INDEX_STORE_VERSION:
+            self.logger.warning(
+                f"Index cache entry {key} has store version {version}, expected {INDEX_STORE_VERSION}; rebuilding."
+            )
+            return None
+        try:
+            embeddings = np.load(
+                os.path.join(entry_dir, self.EMBEDDINGS_FILE),
+                mmap_mode="r" if mmap else None
+            )
+            io_flags = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY if mmap else 0
+            index = faiss.read_index(os.path.join(entry_dir, self.INDEX_FILE), io_flags)
+        except Exception as e:
+            self.logger.warning(f"Discarding unreadable index cache entry {key}: {e}")
+            return None
+        if index.ntotal != embeddings.shape[0]:
+            self.logger.warning(f"Index cache entry {key} is inconsistent; rebuilding.")
+            return None
+        return embeddings, index
+
+    def save(self, key: str, embeddings: np.ndarray, index: faiss.Index, model_name: str = "") -> None:
+        """
+        Persist the embeddings and index under ``key``.
+
+        Files are written to a temporary directory first and moved into place, so concurrent
+        workers never observe a half-written entry.
+        """
+        import faiss
+        entry_dir = self._entry_dir(key)
+        tmp_dir = tempfile.mkdtemp(prefix=f".{key[:12]}-", dir=self.cache_dir)
+        try:
+            np.save(os.path.join(tmp_dir, self.EMBEDDINGS_FILE), np.ascontiguousarray(embeddings))
+            faiss.write_index(index, os.path.join(tmp_dir, self.INDEX_FILE))
+            with open(os.path.join(tmp_dir, self.META_FILE), "w", encoding="utf-8") as f:
+                json.dump({
+                    "version": INDEX_STORE_VERSION,
+                    "model": model_name,
+                    "count": int(embeddings.shape[0]),
+                    "dim": int(embeddings.shape[1])
+                }, f)
+            try:
+                os.replace(tmp_dir, entry_dir)
+            except OSError:
+                # Another worker saved the same entry first; keep theirs.
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+        except Exception:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
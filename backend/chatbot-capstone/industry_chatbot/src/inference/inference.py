@@ -1,11 +1,170 @@
 #!/usr/bin/env python3
+from __future__ import annotations
+import os
 import json
+import time
 import numpy as np
-import faiss
 import logging
-from typing import Optional
-from sentence_transformers import SentenceTransformer
-from transformers import AutoModelForCausalLM, AutoTokenizer
+import threading
+from threading import Thread
+from typing import TYPE_CHECKING, Any, Dict, Iterator, List, Optional, Tuple, Union
+from inference.backends import INFERENCE_BACKENDS, load_generator, load_retrieval_model
+from inference.index_store import EmbeddingIndexStore
+from inference.cache import AnswerCache
+from inference.knowledge_base import KnowledgeBase
+from inference.metrics import PipelineMetrics, RequestTrace
+from inference.lexical_index import LexicalIndex
+from inference.reranking import content_tokens, load_reranker
+from inference.prefix_cache import PromptPrefixCache, stack_prefixes
+from inference.router import QueryRouter
+from inference.generators import (
+    POLICY_PROMPT_PREFIX, GeneratorProfile, build_policy_prompt, load_generator_profile, policy_prompt_head,  # noqa: F401
+    stop_on_text
+)
+
+# faiss, torch and transformers are imported where they are used, so importing this module (or
+# App.py) stays cheap and the generator stack is only imported when it is first needed.
+if TYPE_CHECKING:
+    import faiss
+    import torch
+
+GENERATION_ERROR_MESSAGE = "I encountered an error while generating a response."
+
+INDEX_TYPES = ("flat", "ivf", "hnsw", "pq", "ivfpq")
+
+
+def configure_index_search(index: faiss.Index, index_params: Optional[Dict[str, Any]] = None) -> faiss.Index:
+    """
+    Apply query-time parameters (``nprobe`` for IVF indexes, ``ef_search`` for HNSW).
+    """
+    import faiss
+    params = index_params or {}
+    if isinstance(index, faiss.IndexIDMap):
+        configure_index_search(faiss.downcast_index(index.index), params)
+        return index
+    if isinstance(index, faiss.IndexIVF):
+        index.nprobe = min(int(params.get("nprobe", 8)), index.nlist)
+    elif isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efSearch = int(params.get("ef_search", 64))
+    return index
+
+
+def build_faiss_index(
+    embeddings: np.ndarray,
+    index_type: str = "flat",
+    index_params: Optional[Dict[str, Any]] = None,
+    ids: Optional[np.ndarray] = None
+) -> faiss.Index:
+    """
+    Build an inner-product FAISS index over L2-normalized embeddings.
+
+    Args:
+        embeddings (np.ndarray): float32 matrix of shape (n, dim), already normalized.
+        index_type (str): One of "flat" (exact brute force), "ivf" (inverted file with
+            ``nlist`` clusters), "hnsw" (graph with ``m`` links per node), "pq" (product
+            quantization with ``m`` sub-quantizers of ``nbits``) or "ivfpq" (both).
+        index_params (Optional[Dict[str, Any]]): Build and search parameters for the chosen type.
+        ids (Optional[np.ndarray]): int64 ids for the rows. When given, the index is wrapped in
+            an ``IndexIDMap2`` so searches return these ids and entries can be removed by id.
+
+    IVF and PQ variants are trained on the embeddings themselves; ``nlist`` and ``nbits`` are
+    clamped so small knowledge bases still have enough training points per centroid.
+    """
+    import faiss
+    params = index_params or {}
+    n, dim = embeddings.shape
+    metric = faiss.METRIC_INNER_PRODUCT
+
+    if index_type == "flat":
+        index = faiss.IndexFlatIP(dim)
+    elif index_type in ("ivf", "ivfpq"):
+        nlist = max(1, min(int(params.get("nlist", 100)), n // 39))
+        quantizer = faiss.IndexFlatIP(dim)
+        if index_type == "ivf":
+            index = faiss.IndexIVFFlat(quantizer, dim, nlist, metric)
+        else:
+            m = int(params.get("m", 16))
+            nbits = max(1, min(int(params.get("nbits", 8)), int(np.log2(max(n // 39, 2)))))
+            index = faiss.IndexIVFPQ(quantizer, dim, nlist, m, nbits, metric)
+    elif index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, int(params.get("m", 32)), metric)
+        index.hnsw.efConstruction = int(params.get("ef_construction", 80))
+    elif index_type == "pq":
+        m = int(params.get("m", 16))
+        nbits = max(1, min(int(params.get("nbits", 8)), int(np.log2(max(n // 39, 2)))))
+        index = faiss.IndexPQ(dim, m, nbits, metric)
+    else:
+        raise ValueError(f"Unknown index type '{index_type}'; expected one of {INDEX_TYPES}")
+
+    if not index.is_trained:
+        index.train(embeddings)
+    if ids is not None:
+        index = faiss.IndexIDMap2(index)
+        index.add_with_ids(embeddings, np.asarray(ids, dtype=np.int64))
+    else:
+        index.add(embeddings)
+    return configure_index_search(index, params)
+
+def clone_faiss_index(index: faiss.Index) -> faiss.Index:
+    """
+    Return an in-memory copy of an index that can be mutated while the original keeps serving.
+
+    ``faiss.clone_index`` cannot copy the on-disk inverted lists of an IVF index memory-mapped
+    from the index cache, so those are copied list by list into ``ArrayInvertedLists``.
+    """
+    import faiss
+    try:
+        return faiss.clone_index(index)
+    except RuntimeError:
+        source = index
+        if isinstance(source, faiss.IndexIDMap):
+            source = faiss.downcast_index(source.index)
+        if not isinstance(source, faiss.IndexIVF):
+            raise
+
+    # Everything but the inverted lists is copied through a serialized round trip.
+    reader = faiss.VectorIOReader()
+    faiss.copy_array_to_vector(faiss.serialize_index(index), reader.data)
+    copy = faiss.read_index(reader, faiss.IO_FLAG_SKIP_IVF_DATA)
+    target = faiss.downcast_index(copy.index) if isinstance(copy, faiss.IndexIDMap) else copy
+
+    lists = faiss.ArrayInvertedLists(source.nlist, source.code_size)
+    invlists = source.invlists
+    for list_no in range(source.nlist):
+        size = invlists.list_size(list_no)
+        if size:
+            lists.add_entries(list_no, size, invlists.get_ids(list_no), invlists.get_codes(list_no))
+    target.replace_invlists(lists, True)
+    lists.this.disown()
+    target.ntotal = source.ntotal
+    return copy
+
+
+class RetrievalState:
+    """
+    One version of the knowledge base together with the embeddings and index built over it.
+
+    PolicyQASystem never mutates a published state; updates build a new one and swap the
+    reference, so a request that grabbed a state keeps a consistent view until it finishes.
+    ``embeddings`` row ``i`` (and index id ``i``) belongs to knowledge-base entry ``i``, as
+    does entry ``i`` of the optional lexical index.
+    """
+    __slots__ = ("kb", "embeddings", "index", "version", "lexical")
+
+    def __init__(
+        self,
+        kb: KnowledgeBase,
+        embeddings: np.ndarray,
+        index: faiss.Index,
+        version: int,
+        lexical: Optional[LexicalIndex] = None
+    ):
+        self.kb = kb
+        self.embeddings = embeddings
+        self.index = index
+        self.version = version
+        self.lexical = lexical
+
 
 class PolicyQASystem:
     """
@@ -19,8 +178,34 @@ class PolicyQASystem:
         self, 
         data_path: str, 
         retrieval_model: str = "sentence-transformers/all-MiniLM-L6-v2",
-        gen_model: str = "EleutherAI/gpt-neo-125M",
-        logger: Optional[logging.Logger] = None
+        gen_model: Optional[str] = None,
+        logger: Optional[logging.Logger] = None,
+        index_cache_dir: Optional[str] = None,
+        use_index_cache: bool = True,
+        index_type: str = "flat",
+        index_params: Optional[Dict[str, Any]] = None,
+        inference_backend: str = "torch",
+        answer_cache: Optional[AnswerCache] = None,
+        use_answer_cache: bool = True,
+        metrics: Optional[PipelineMetrics] = None,
+        lazy_generator: bool = True,
+        warmup_generator: bool = False,
+        top_k: int = 5,
+        reranker: Union[str, Any, None] = None,
+        rerank_threshold: float = 0.8,
+        context_token_budget: int = 384,
+        max_contexts: int = 3,
+        hybrid_retrieval: bool = True,
+        lexical_weight: float = 0.15,
+        lexical_margin: float = 1.5,
+        lexical_min_terms: int = 2,
+        prefix_cache: bool = True,
+        prefix_cache_tokens: int = 4096,
+        generator: Union[str, GeneratorProfile] = "policy",
+        device: str = "auto",
+        sampling: Optional[Dict[str, Any]] = None,
+        query_cache_size: int = 4096,
+        fake_latency: Optional[Dict[str, float]] = None
     ):
         """
         Initialize the PolicyQASystem with data, models, and optional logging.
@@ -28,39 +213,132 @@ class PolicyQASystem:
         Args:
             data_path (str): Path to the JSON file containing QA pairs.
             retrieval_model (str): Sentence transformer model for semantic search.
-            gen_model (str): Language model for answer generation.
+            gen_model (Optional[str]): Language model for answer generation (a Hugging Face name or
+                a local checkpoint). Defaults to the generator profile's model.
             logger (Optional[logging.Logger]): Custom logger for tracking operations.
+            index_cache_dir (Optional[str]): Directory for the persisted embedding index.
+                Defaults to an ``index_cache`` directory next to the data file.
+            use_index_cache (bool): Load/save the embedding index from/to disk instead of
+                re-encoding the knowledge base on every start.
+            index_type (str): FAISS index backend: "flat", "ivf", "hnsw", "pq" or "ivfpq".
+                See ``build_faiss_index``; flat is exact, the others trade recall for speed
+                on large knowledge bases.
+            index_params (Optional[Dict[str, Any]]): Build/search parameters for the index type.
+            inference_backend (str): "torch" (full precision), "int8" (dynamic int8 quantization)
+                or "onnx" (ONNX Runtime export) for both the encoder and the generator, or "fake"
+                for deterministic fixed-latency stand-ins that need no model (load testing).
+            answer_cache (Optional[AnswerCache]): Answer cache to use in front of retrieval and
+                generation. A default-sized cache is created when omitted.
+            use_answer_cache (bool): Disable to always recompute answers.
+            metrics (Optional[PipelineMetrics]): Collector for per-stage latencies, answer paths,
+                similarities and generated token counts. A private collector is created when omitted.
+            lazy_generator (bool): Defer loading the generative model and its tokenizer until the
+                first low-confidence query. Greetings, cached answers and confident retrievals
+                never need them, so retrieval-only replicas start faster and use less memory.
+            warmup_generator (bool): Load the generator on a background thread right after
+                startup (see ``start_warmup``) instead of on the first fallback.
+            top_k (int): Candidates fetched per query in the same FAISS search. Hits that share
+                an answer are collapsed to the best-scoring one.
+            reranker (Union[str, Any, None]): "lexical", "cross-encoder" (see
+                ``inference.reranking``) or a reranker instance to reorder the distinct
+                candidates; None keeps the similarity order.
+            rerank_threshold (float): Reranker score from which the top candidate is answered
+                directly even when its similarity is below the confidence threshold.
+            context_token_budget (int): Generator tokens available for retrieved contexts in the
+                fallback prompt.
+            max_contexts (int): Maximum number of distinct answers packed into that prompt.
+            hybrid_retrieval (bool): Build a BM25 index over questions, answers and section names
+                (``inference.lexical_index``) next to the FAISS index and use it to answer
+                clear exact-term queries without running the encoder, and to add lexical
+                candidates and scores to the dense search for the others.
+            lexical_weight (float): Weight of an entry's query-term coverage (0-1, over its
+                question and section) added to its cosine similarity when fusing scores; the sum
+                is divided by ``1 + lexical_weight`` so confidence stays at most 1.
+            lexical_margin (float): A query is answered lexically only if its top entry covers
+                every query term and out-scores the best entry with a different answer by this
+                factor.
+            lexical_min_terms (int): Minimum number of content terms for a lexical answer.
+            prefix_cache (bool): Reuse the attention keys/values of the instruction preamble
+                and of retrieved contexts across fallback generations
+                (``inference.prefix_cache``), so generation only runs the model over the
+                query-specific end of each prompt. Not available with the "onnx" backend.
+            prefix_cache_tokens (int): Budget of cached context tokens (about 72KB each for
+                gpt-neo-125M); least recently used contexts are evicted beyond it.
+            generator (Union[str, GeneratorProfile]): "policy" (base GPT-Neo prompted with the
+                retrieved context) or "fine-tuned" (the checkpoint from
+                ``Model_finetuning.train_model``, prompted in its training format); see
+                ``inference.generators``. Both use the same batched, prefix-cached path.
+            device (str): "auto" (CUDA when available, else the CPU), "cpu" or "cuda[:n]" for the
+                generator.
+            sampling (Optional[Dict[str, Any]]): ``generate`` settings (``do_sample``,
+                ``temperature``, ``top_p``, ``max_new_tokens``, ...) overriding the profile's.
+            query_cache_size (int): Query embeddings kept by the router (0 disables), keyed by
+                normalized query text; see ``inference.router``.
+            fake_latency (Optional[Dict[str, float]]): Latency settings of the "fake" backend
+                (see ``inference.fake_models.DEFAULT_FAKE_LATENCY``).
         """
         self.logger = logger or logging.getLogger(__name__)
+        self.data_path = data_path
+        self.retrieval_model_name = retrieval_model
+        if index_type not in INDEX_TYPES:
+            raise ValueError(f"Unknown index type '{index_type}'; expected one of {INDEX_TYPES}")
+        self.index_type = index_type
+        self.generator = load_generator_profile(generator)
+        self.gen_model_name = gen_model or self.generator.default_model
+        self.sampling = self.generator.sampling(sampling)
+        self.device = device
+        if inference_backend not in INFERENCE_BACKENDS:
+            raise ValueError(f"Unknown inference backend '{inference_backend}'; expected one of {INFERENCE_BACKENDS}")
+        self.inference_backend = inference_backend
+        self.fake_latency = fake_latency
+        self.index_params = dict(index_params or {})
+        self.index_store = None
+        if use_index_cache:
+            self.index_store = EmbeddingIndexStore(
+                index_cache_dir or os.path.join(os.path.dirname(os.path.abspath(data_path)), "index_cache"),
+                logger=self.logger
+            )
+        self.answer_cache = None
+        if use_answer_cache:
+            self.answer_cache = answer_cache or AnswerCache()
+        self.metrics = metrics or PipelineMetrics()
+        self.top_k = max(1, top_k)
+        self.reranker = load_reranker(reranker, self.logger)
+        self.rerank_threshold = rerank_threshold
+        self.context_token_budget = context_token_budget
+        self.max_contexts = max(1, max_contexts)
+        self.hybrid_retrieval = hybrid_retrieval
+        self.lexical_weight = lexical_weight
+        self.lexical_margin = lexical_margin
+        self.lexical_min_terms = lexical_min_terms
+        self.prefix_cache_tokens = (
+            prefix_cache_tokens if prefix_cache and inference_backend not in ("onnx", "fake") else None
+        )
         
-        # Load QA data
-        try:
-            with open(data_path, "r", encoding="utf-8") as f:
-                self.data = json.load(f)
-        except Exception as e:
-            self.logger.error(f"Error loading data: {e}")
-            raise
-        
-        # Prepare QA data: extract questions and answers.
-        self.questions = [item["question"] for item in self.data]
-        self.answers = {item["question"]: item["answer"] for item in self.data}
+        self._update_lock = threading.RLock()
+        kb = self._load_data(data_path)
         
-        # Initialize models.
+        # Initialize models. The generator is loaded by ``_load_generator`` on first use.
+        self._tokenizer = None
+        self._gen_model = None
+        self._generator_lock = threading.Lock()
+        self._generator_error: Optional[str] = None
+        self._prefix_cache: Optional[PromptPrefixCache] = None
+        self._prompt_prefix_ids: List[int] = []
+        self._warmup_thread: Optional[Thread] = None
         try:
-            self.retrieval_model = SentenceTransformer(retrieval_model)
-            self.tokenizer = AutoTokenizer.from_pretrained(gen_model)
-            self.gen_model = AutoModelForCausalLM.from_pretrained(gen_model)
-            
-            # Ensure tokenizer has a pad token.
-            if self.tokenizer.pad_token is None:
-                self.tokenizer.pad_token = self.tokenizer.eos_token
-                self.gen_model.config.pad_token_id = self.tokenizer.eos_token_id
+            self.retrieval_model = load_retrieval_model(
+                retrieval_model, inference_backend, self.logger, fake_latency=fake_latency
+            )
         except Exception as e:
             self.logger.error(f"Model initialization error: {e}")
             raise
+        if not lazy_generator:
+            self._load_generator()
         
         # Build a semantic search index using FAISS.
-        self._build_index()
+        embeddings, index = self._build_index(kb, data_path)
+        self._state = RetrievalState(kb, embeddings, index, version=0, lexical=self._build_lexical_index(kb))
         
         # Define some templates for direct retrieval formatting.
         self.templates = {
@@ -86,121 +364,966 @@ class PolicyQASystem:
             ]
         }
         
-        # Simple greetings for quick response.
-        self.greeting_words = {"hi", "hello", "hey", "greetings"}
+        # Greetings, thanks and help requests, cached query embeddings and preformatted answers.
+        self.router = QueryRouter(self.templates, embedding_cache_size=query_cache_size)
+        self.router.precompute(kb.answers)
+
+        if warmup_generator:
+            self.start_warmup()
     
-    def _build_index(self) -> None:
+    @property
+    def tokenizer(self):
+        return self._load_generator()[0]
+
+    @property
+    def gen_model(self):
+        return self._load_generator()[1]
+
+    @property
+    def generator_loaded(self) -> bool:
+        return self._gen_model is not None
+
+    def _load_generator(self) -> Tuple[Any, Any]:
         """
-        Build a semantic search index using FAISS for efficient retrieval.
+        Load the generative model and tokenizer once; concurrent callers wait for the first load.
+        """
+        if self._gen_model is None:
+            with self._generator_lock:
+                if self._gen_model is None:
+                    start = time.perf_counter()
+                    try:
+                        tokenizer, gen_model = load_generator(
+                            self.gen_model_name, self.inference_backend, self.logger, device=self.device,
+                            fake_latency=self.fake_latency
+                        )
+
+                        # Ensure tokenizer has a pad token.
+                        if tokenizer.pad_token is None:
+                            tokenizer.pad_token = tokenizer.eos_token
+                            gen_model.config.pad_token_id = tokenizer.eos_token_id
+                        # Decoder-only models must be left-padded for batched generation.
+                        tokenizer.padding_side = "left"
+                        if self.prefix_cache_tokens is not None:
+                            self._init_prefix_cache(tokenizer, gen_model)
+                    except Exception as e:
+                        self._generator_error = str(e)
+                        self.logger.error(f"Generator initialization error: {e}")
+                        raise
+                    self._tokenizer = tokenizer
+                    # Published last: a non-None model means the tokenizer is ready too.
+                    self._gen_model = gen_model
+                    self._generator_error = None
+                    self.logger.info(f"Generator ready in {time.perf_counter() - start:.2f}s.")
+        return self._tokenizer, self._gen_model
+
+    def _init_prefix_cache(self, tokenizer, gen_model) -> None:
+        """
+        Create the prompt prefix cache and pin the keys/values of the prompt start shared by
+        every query (the instruction preamble of the policy prompt).
+
+        The pinned head is the longest token prefix shared by prompts with unrelated queries
+        and contexts, so it never depends on how the tokenizer merges across the boundary.
+        """
+        first = tokenizer(self.generator.build_prompt("?", "A"))["input_ids"]
+        second = tokenizer(self.generator.build_prompt("!", "1"))["input_ids"]
+        shared = 0
+        while shared < min(len(first), len(second)) and first[shared] == second[shared]:
+            shared += 1
+        self._prompt_prefix_ids = first[:shared]
+        self._prefix_cache = PromptPrefixCache(gen_model, max_tokens=self.prefix_cache_tokens, logger=self.logger)
+        self._prefix_cache.pin(self._prompt_prefix_ids)
+
+    def _prompt_heads(self, context: str) -> List[List[int]]:
+        """
+        Token ids of the cacheable heads of a prompt for ``context``, longest first: the
+        profile's heads (for the policy prompt: up to the whole context, then up to each
+        shorter run of its packed answers) and the pinned prompt start.
+        """
+        heads = [self.tokenizer(head)["input_ids"] for head in self.generator.prompt_heads(context)]
+        heads.append(self._prompt_prefix_ids)
+        return heads
+
+    def _cached_prefix(self, contexts: List[str], inputs) -> Tuple[Any, List[Tuple[int, int, Tuple[int, ...]]]]:
+        """
+        Look up the cached keys/values for the heads of a tokenized, left-padded batch of
+        prompts. Returns a ``DynamicCache`` covering the start of every row (None when the
+        cache is disabled or some row has no cached head) and the (row, padding, head) of every
+        row whose full context head is not cached yet, for ``_store_prefixes``.
         """
+        if self._prefix_cache is None:
+            return None, []
         try:
-            self.question_embeddings = self.retrieval_model.encode(
-                self.questions, 
-                convert_to_numpy=True,
-                show_progress_bar=False
-            )
-            # Normalize embeddings for cosine similarity (using inner product on L2-normalized vectors).
-            faiss.normalize_L2(self.question_embeddings)
-            dim = self.question_embeddings.shape[1]
-            self.index = faiss.IndexFlatIP(dim)
-            self.index.add(self.question_embeddings)
+            prefixes = []
+            pads = []
+            missing = []
+            for row, (context, ids, mask) in enumerate(zip(contexts, inputs["input_ids"], inputs["attention_mask"])):
+                pad = int((mask == 0).sum())
+                covered, layers, head = self._prefix_cache.lookup(ids[pad:].tolist(), self._prompt_heads(context))
+                prefixes.append((covered, layers))
+                pads.append(pad)
+                if head is not None:
+                    missing.append((row, pad, head))
+            return stack_prefixes(prefixes, pads), missing
         except Exception as e:
-            self.logger.error(f"Index building error: {e}")
+            self.logger.warning(f"Prompt prefix cache unavailable for this batch: {e}")
+            return None, []
+
+    def _store_prefixes(self, missing: List[Tuple[int, int, Tuple[int, ...]]], past_key_values) -> None:
+        """
+        Keep the context heads that were not cached yet from the keys/values of a finished
+        generation.
+        """
+        if not missing or past_key_values is None:
+            return
+        try:
+            for row, pad, head in missing:
+                self._prefix_cache.store_from(head, past_key_values, row, pad)
+        except Exception as e:
+            self.logger.warning(f"Could not cache prompt prefixes: {e}")
+
+    def warm_prefix_cache(self) -> int:
+        """
+        Prefill the prefix cache with the single-answer context of each distinct answer, in
+        knowledge base order, until the token budget is reached. Packed multi-answer contexts
+        then only need their later answers computed. Returns the number of contexts cached.
+        """
+        cache = self._prefix_cache
+        if cache is None or not self.generator.uses_context:
+            return 0
+        kb = self._state.kb
+        seen = set()
+        warmed = 0
+        for entry_id in kb.live_ids():
+            answer_id = int(kb.answer_ids[entry_id])
+            if answer_id in seen:
+                continue
+            seen.add(answer_id)
+            head = self._prompt_heads(self._pack_contexts(kb, [int(entry_id)]))[0]
+            if cache.cached_tokens + len(head) - len(self._prompt_prefix_ids) > cache.max_tokens:
+                break
+            cache.prefill(head)
+            warmed += 1
+        self.logger.info(f"Prompt prefix cache warmed with {warmed} contexts ({cache.cached_tokens} tokens).")
+        return warmed
+
+    def start_warmup(self) -> Thread:
+        """
+        Load the generator on a background daemon thread, run one short generation and fill
+        the prompt prefix cache, so the first real fallback does not pay for loading, first-call
+        initialization or prefilling its context.
+
+        Queries keep being answered while the warm-up runs; a fallback that arrives before it
+        finishes simply waits for the load in progress.
+        """
+        if self._warmup_thread is None:
+            def warm_up():
+                import torch
+                try:
+                    tokenizer, gen_model = self._load_generator()
+                    with torch.inference_mode():
+                        gen_model.generate(
+                            **tokenizer("Hello", return_tensors="pt").to(gen_model.device),
+                            max_new_tokens=1,
+                            pad_token_id=tokenizer.pad_token_id
+                        )
+                    self.warm_prefix_cache()
+                except Exception as e:
+                    self.logger.warning(f"Generator warm-up failed: {e}")
+
+            self._warmup_thread = Thread(target=warm_up, name="generator-warmup", daemon=True)
+            self._warmup_thread.start()
+        return self._warmup_thread
+
+    def readiness(self) -> Dict[str, Any]:
+        """
+        Report which components are loaded. Retrieval is ready once the system is constructed;
+        the generator may still be unloaded (lazy), loading, or failed.
+        """
+        return {
+            "retrieval_model": self.retrieval_model is not None,
+            "index": self._state.index is not None,
+            "knowledge_base_entries": len(self._state.kb),
+            "knowledge_base_version": self._state.version,
+            "generator": self.generator_loaded,
+            "generator_loading": not self.generator_loaded and self._generator_lock.locked(),
+            "generator_error": self._generator_error,
+            "generator_profile": self.generator.name,
+            "generator_device": str(self.gen_model.device) if self.generator_loaded else None
+        }
+
+    def prepare_for_fork(self, load_generator: bool = True) -> None:
+        """
+        Prepare a fully loaded system to be inherited by pre-forked worker processes.
+
+        Workers forked afterwards share the model weights, embedding matrix and index with the
+        parent through copy-on-write pages (and through the page cache for a memory-mapped
+        index), as long as nothing writes to them. Loading the generator here means workers
+        share it too instead of each loading a private copy on its first fallback, along with
+        the prefilled prompt prefix cache. The garbage
+        collector is run and every surviving object is moved to the permanent generation, so
+        later collections in the workers never touch (and thereby copy) the parent's pages.
+        """
+        import gc
+        if load_generator:
+            if self._warmup_thread is not None:
+                self._warmup_thread.join()
+            self._load_generator()
+            if self._prefix_cache is not None and self._prefix_cache.cached_tokens == 0:
+                self.warm_prefix_cache()
+        # Unfreeze first so state replaced by a reload can be collected.
+        gc.unfreeze()
+        gc.collect()
+        gc.freeze()
+
+    @property
+    def kb(self) -> KnowledgeBase:
+        return self._state.kb
+
+    @property
+    def index(self) -> faiss.Index:
+        return self._state.index
+
+    @property
+    def question_embeddings(self) -> np.ndarray:
+        return self._state.embeddings
+
+    @property
+    def kb_version(self) -> int:
+        return self._state.version
+
+    def _load_data(self, data_path: str) -> KnowledgeBase:
+        """
+        Load the QA pairs into a compact knowledge base; the parsed JSON is discarded and a
+        binary ``.qakb`` store is memory-mapped.
+        """
+        try:
+            return KnowledgeBase.from_file(data_path, logger=self.logger)
+        except Exception as e:
+            self.logger.error(f"Error loading data: {e}")
             raise
-    
-    def _select_template(self, query: str, policy_type: str = 'default') -> str:
+
+    def _build_lexical_index(self, kb: KnowledgeBase) -> Optional[LexicalIndex]:
+        """
+        Build the BM25 index for a knowledge-base version (rebuilt on every update; building
+        is linear in the knowledge-base size and far cheaper than encoding it).
+        """
+        if not self.hybrid_retrieval:
+            return None
+        lexical = LexicalIndex.from_knowledge_base(kb)
+        self.logger.info(f"Built lexical index ({len(lexical.postings)} terms).")
+        return lexical
+
+    def _publish(self, kb: KnowledgeBase, embeddings: np.ndarray, index: faiss.Index) -> int:
+        """
+        Atomically swap in a new retrieval state and invalidate cached answers.
+        """
+        version = self._state.version + 1
+        self.router.precompute(kb.answers)
+        self._state = RetrievalState(kb, embeddings, index, version, lexical=self._build_lexical_index(kb))
+        if self.answer_cache is not None:
+            self.answer_cache.invalidate()
+        return version
+
+    def reload_knowledge_base(self, data_path: Optional[str] = None) -> int:
+        """
+        Reload the QA pairs (optionally from a new path), rebuild the index and invalidate
+        every cached answer.
+
+        The new index is built while requests keep being served from the current one and is
+        swapped in atomically once complete. Returns the new knowledge-base version.
+        """
+        with self._update_lock:
+            path = data_path or self.data_path
+            kb = self._load_data(path)
+            embeddings, index = self._build_index(kb, path)
+            self.data_path = path
+            version = self._publish(kb, embeddings, index)
+        self.logger.info(f"Knowledge base reloaded from {self.data_path} ({len(kb)} questions, version {version}).")
+        return version
+
+    def _encode_questions(self, questions: List[str]) -> np.ndarray:
+        import faiss
+        embeddings = self.retrieval_model.encode(
+            questions,
+            convert_to_numpy=True,
+            show_progress_bar=False
+        ).astype(np.float32)
+        # Normalize embeddings for cosine similarity (using inner product on L2-normalized vectors).
+        faiss.normalize_L2(embeddings)
+        return embeddings
+
+    def _encode_queries(self, queries: List[str]) -> np.ndarray:
+        import faiss
+        embeddings = self.retrieval_model.encode(queries, convert_to_numpy=True, show_progress_bar=False)
+        faiss.normalize_L2(embeddings)
+        return embeddings
+
+    def _index_without(self, index: faiss.Index, kb: KnowledgeBase, embeddings: np.ndarray, ids: List[int]) -> faiss.Index:
+        """
+        Remove ids from a private index copy, rebuilding it for types that cannot remove (HNSW).
+        """
+        try:
+            index.remove_ids(np.asarray(ids, dtype=np.int64))
+            return index
+        except RuntimeError:
+            live = np.setdiff1d(kb.live_ids(), np.asarray(ids, dtype=np.int64))
+            self.logger.info(f"{self.index_type} index does not support removal; rebuilding over {len(live)} entries.")
+            return build_faiss_index(embeddings[live], self.index_type, self.index_params, ids=live)
+
+    def add_entries(self, records: List[dict]) -> List[int]:
+        """
+        Add QA pairs (dicts with ``question``, ``answer`` and optional ``metadata``).
+
+        Only the new questions are embedded; they are added to a copy of the current index,
+        which is then swapped in. Returns the ids assigned to the new entries.
+        """
+        if not records:
+            return []
+        new_embeddings = self._encode_questions([r["question"] for r in records])
+        with self._update_lock:
+            state = self._state
+            kb = state.kb.copy()
+            ids = [kb.append(r["question"], r["answer"], r.get("metadata")) for r in records]
+            embeddings = np.concatenate([state.embeddings, new_embeddings])
+            index = clone_faiss_index(state.index)
+            index.add_with_ids(new_embeddings, np.asarray(ids, dtype=np.int64))
+            version = self._publish(kb, embeddings, index)
+        self.logger.info(f"Added {len(ids)} QA entries (version {version}).")
+        return ids
+
+    def update_entry(
+        self,
+        entry_id: int,
+        question: Optional[str] = None,
+        answer: Optional[str] = None,
+        metadata: Optional[dict] = None
+    ) -> None:
+        """
+        Update the question, answer and/or metadata of an entry.
+
+        The index is only touched when the question text changes, in which case just that
+        question is re-embedded and its vector replaced.
+        """
+        new_embedding = None
+        if question is not None:
+            new_embedding = self._encode_questions([question])
+        with self._update_lock:
+            state = self._state
+            kb = state.kb.copy()
+            kb.replace(entry_id, question, answer, metadata)
+            embeddings, index = state.embeddings, state.index
+            if new_embedding is not None:
+                embeddings = np.array(state.embeddings)
+                embeddings[entry_id] = new_embedding[0]
+                index = self._index_without(clone_faiss_index(state.index), state.kb, embeddings, [entry_id])
+                index.add_with_ids(new_embedding, np.asarray([entry_id], dtype=np.int64))
+            version = self._publish(kb, embeddings, index)
+        self.logger.info(f"Updated QA entry {entry_id} (version {version}).")
+
+    def remove_entries(self, entry_ids: List[int]) -> None:
         """
-        Select a formatting template based on query context.
+        Remove entries by id from the knowledge base and the index.
         """
-        templates = self.templates.get(policy_type, self.templates['default'])
-        return np.random.choice(templates)
+        if not entry_ids:
+            return
+        with self._update_lock:
+            state = self._state
+            kb = state.kb.copy()
+            for entry_id in entry_ids:
+                kb.remove(entry_id)
+            index = self._index_without(clone_faiss_index(state.index), state.kb, state.embeddings, list(entry_ids))
+            version = self._publish(kb, state.embeddings, index)
+        self.logger.info(f"Removed {len(entry_ids)} QA entries (version {version}).")
+
+    def _stored_embeddings(self, kb: KnowledgeBase) -> Optional[np.ndarray]:
+        """
+        The question embeddings saved in a binary knowledge-base store, if they were computed
+        by this retrieval model and backend for exactly these rows.
+        """
+        stored = kb.stored_embeddings
+        if stored is None or len(stored) != kb.num_rows:
+            return None
+        if kb.embedding_model != self.retrieval_model_name or kb.embedding_backend != self.inference_backend:
+            self.logger.info(
+                f"Ignoring stored embeddings from {kb.embedding_model} ({kb.embedding_backend}); "
+                f"retrieval uses {self.retrieval_model_name} ({self.inference_backend})."
+            )
+            return None
+        self.logger.info(f"Using {len(stored)} embeddings stored with the knowledge base.")
+        return stored
+
+    def _build_index(self, kb: KnowledgeBase, data_path: str) -> Tuple[np.ndarray, faiss.Index]:
+        """
+        Build a semantic search index using FAISS for efficient retrieval.
+
+        When an index store is configured, a previously persisted index for the same data file
+        and retrieval model is memory-mapped from disk instead of re-encoding every question.
+        Index ids are knowledge-base entry ids, so entries can later be updated in place.
+        """
+        cache_key = None
+        if self.index_store is not None:
+            try:
+                cache_key = EmbeddingIndexStore.compute_key(
+                    data_path,
+                    self.retrieval_model_name,
+                    self.inference_backend,
+                    self.index_type,
+                    json.dumps(self.index_params, sort_keys=True)
+                )
+                cached = self.index_store.load(cache_key)
+                if cached is not None and cached[1].ntotal == len(kb):
+                    embeddings, index = cached
+                    configure_index_search(index, self.index_params)
+                    self.logger.info(f"Loaded cached embedding index ({index.ntotal} vectors).")
+                    return embeddings, index
+            except Exception as e:
+                self.logger.warning(f"Index cache lookup failed, rebuilding: {e}")
+                cache_key = None
+
+        try:
+            embeddings = self._stored_embeddings(kb)
+            if embeddings is None:
+                embeddings = self._encode_questions(list(kb.questions))
+            index = build_faiss_index(embeddings, self.index_type, self.index_params, ids=kb.live_ids())
+        except Exception as e:
+            self.logger.error(f"Index building error: {e}")
+            raise
+
+        if cache_key is not None:
+            try:
+                self.index_store.save(cache_key, embeddings, index, self.retrieval_model_name)
+            except Exception as e:
+                self.logger.warning(f"Could not persist embedding index: {e}")
+        return embeddings, index
     
     def _format_policy_answer(self, answer: str, query: str) -> str:
         """
-        Format the retrieved policy answer using a template.
+        Format the retrieved policy answer using one of its precomputed templates.
         """
         try:
-            answer = answer.strip().rstrip('.')
-            query_lower = query.lower()
-            if query_lower in self.greeting_words:
-                template = self._select_template(query, 'greeting')
-                return template
-            
-            policy_type = 'default'
-            if 'customer satisfaction' in query_lower:
-                policy_type = 'customer_satisfaction'
-            elif 'it' in query_lower or 'technology' in query_lower:
-                policy_type = 'it_policy'
-            
-            template = self._select_template(query, policy_type)
-            if 'and' in answer:
-                parts = [part.strip() for part in answer.split('and')]
-                return template.format(*parts)
-            return template.format(answer)
+            return self.router.format_answer(answer, query)
         except Exception as e:
             self.logger.warning(f"Answer formatting failed: {e}")
             return answer
 
+    def _build_prompt(self, query: str, context: str) -> str:
+        """
+        Build the generative prompt for a query and its retrieved policy context.
+        """
+        return self.generator.build_prompt(query, context)
+
+    def _generation_kwargs(self, prompt_length: int) -> Dict[str, Any]:
+        """
+        ``generate`` arguments shared by the batched and the streaming path.
+        """
+        kwargs = dict(self.sampling, pad_token_id=self.tokenizer.pad_token_id, return_dict_in_generate=True)
+        if self.generator.stop_strings:
+            kwargs["stopping_criteria"] = [stop_on_text(self.tokenizer, self.generator.stop_strings, prompt_length)]
+        return kwargs
+
+    def generate(self, queries: List[str], contexts: Optional[List[str]] = None) -> List[str]:
+        """
+        Generate answers directly with the configured generator, bypassing retrieval and the
+        answer cache (contexts default to empty).
+        """
+        return self._generate_responses(queries, contexts or [""] * len(queries))
+
     def _generate_response(self, query: str, context: str) -> str:
         """
         Generate a response using the generative model, using the provided policy context.
         
         The prompt explicitly instructs the model to base the answer only on the provided text.
         """
+        return self._generate_responses([query], [context])[0]
+
+    def _count_new_tokens(self, tokens: torch.Tensor) -> int:
+        """
+        Count generated tokens, ignoring the padding/EOS tokens that fill finished rows.
+        """
+        return int((tokens != self.tokenizer.pad_token_id).sum())
+
+    def _generate_responses(
+        self, queries: List[str], contexts: List[str], trace: Optional[RequestTrace] = None
+    ) -> List[str]:
+        """
+        Generate responses for several (query, context) pairs in one padded batch.
+
+        Prompts are left-padded so every row continues from its own last prompt token, and only
+        the newly generated tokens are decoded for each row. With the prefix cache, the cached
+        keys/values of the prompt heads are passed to ``generate`` so only the rest is prefilled,
+        and heads seen for the first time are kept from the keys/values it returns.
+        """
+        import torch
+        trace = trace or self.metrics.trace(len(queries))
         try:
-            prompt = (
-                "You are an organizational policy assistant. "
-                "Use the following policy context to answer the query. Do not add any information not present in the context.\n\n"
-                f"Policy Context: {context}\n\n"
-                f"Query: {query}\n\nAnswer:"
-            )
-            inputs = self.tokenizer(prompt, return_tensors="pt")
-            output = self.gen_model.generate(
-                **inputs,
-                max_length=550,
-                num_return_sequences=1,
-                no_repeat_ngram_size=2,
-                early_stopping=True
-            )
-            generated_text = self.tokenizer.decode(output[0], skip_special_tokens=True)
-            response = generated_text.replace(prompt, "").strip()
-            if not response:
-                response = generated_text.strip()
-            return response
+            prompts = [self._build_prompt(query, context) for query, context in zip(queries, contexts)]
+            inputs = self.tokenizer(prompts, return_tensors="pt", padding=True).to(self.gen_model.device)
+            with trace.stage("prefix_cache"):
+                past_key_values, missing = self._cached_prefix(contexts, inputs)
+            with trace.stage("generate"), torch.inference_mode():
+                generated = self.gen_model.generate(
+                    **inputs, past_key_values=past_key_values, **self._generation_kwargs(inputs["input_ids"].shape[1])
+                )
+            self._store_prefixes(missing, generated.past_key_values)
+            output = generated.sequences
+            prompt_length = inputs["input_ids"].shape[1]
+            responses = []
+            for row in output:
+                trace.generated_tokens(self._count_new_tokens(row[prompt_length:]))
+                response = self.generator.clean_response(
+                    self.tokenizer.decode(row[prompt_length:], skip_special_tokens=True)
+                )
+                if not response:
+                    response = self.tokenizer.decode(row, skip_special_tokens=True).strip()
+                responses.append(response)
+            return responses
         except Exception as e:
             self.logger.error(f"Generation error: {e}")
-            return "I encountered an error while generating a response."
+            return [GENERATION_ERROR_MESSAGE] * len(queries)
+
+    def _stream_response(self, query: str, context: str) -> Iterator[str]:
+        """
+        Stream a generated response chunk by chunk as tokens are decoded.
+
+        ``generate`` runs on a background thread and pushes decoded text into a
+        ``TextIteratorStreamer``, which this generator drains.
+        """
+        import torch
+        from transformers import TextIteratorStreamer
+        try:
+            inputs = self.tokenizer(self._build_prompt(query, context), return_tensors="pt").to(self.gen_model.device)
+            past_key_values, missing = self._cached_prefix([context], inputs)
+            streamer = TextIteratorStreamer(self.tokenizer, skip_prompt=True, skip_special_tokens=True)
+        except Exception as e:
+            self.logger.error(f"Generation error: {e}")
+            yield GENERATION_ERROR_MESSAGE
+            return
+
+        errors = []
+
+        def run_generation():
+            try:
+                with torch.inference_mode():
+                    generated = self.gen_model.generate(
+                        **inputs, past_key_values=past_key_values, streamer=streamer,
+                        **self._generation_kwargs(inputs["input_ids"].shape[1])
+                    )
+                self._store_prefixes(missing, generated.past_key_values)
+            except Exception as e:
+                errors.append(e)
+                # Unblock the consumer; generate() only ends the streamer on success.
+                streamer.end()
+
+        worker = Thread(target=run_generation, daemon=True)
+        worker.start()
+        produced = False
+        for chunk in self._trim_stream(streamer):
+            if chunk:
+                produced = True
+                yield chunk
+        worker.join()
+        if errors:
+            self.logger.error(f"Generation error: {errors[0]}")
+            if not produced:
+                yield GENERATION_ERROR_MESSAGE
+
+    def _trim_stream(self, chunks: Iterator[str]) -> Iterator[str]:
+        """
+        Pass streamed text through up to the first of the profile's stop strings, holding back
+        just enough characters to recognise one split across chunks. The rest of the stream is
+        drained so generation can finish.
+        """
+        stops = self.generator.stop_strings
+        if not stops:
+            yield from chunks
+            return
+        hold = max(len(stop) for stop in stops) - 1
+        pending = ""
+        for chunk in chunks:
+            if pending is None:
+                continue
+            pending += chunk
+            cuts = [pending.find(stop) for stop in stops if stop in pending]
+            if cuts:
+                yield pending[:min(cuts)].rstrip()
+                pending = None
+            elif len(pending) > hold:
+                yield pending[:-hold]
+                pending = pending[-hold:]
+        if pending:
+            yield pending
 
     def get_answer(self, query: str, confidence_threshold: float = 0.7) -> str:
         """
         Retrieve the most relevant policy answer from the knowledge base or, if retrieval confidence is low,
         use the generative model with the best available context.
         """
+        return self.get_answers([query], confidence_threshold)[0]
+
+    def _lexical_match(self, kb: KnowledgeBase, terms: List[str], scores: np.ndarray, coverage: np.ndarray) -> int:
+        """
+        Return the entry that clearly answers a query on its exact terms alone, or -1.
+
+        The top BM25 entry must cover every query term in its question or section and beat
+        the best entry with a different answer by ``lexical_margin``. That runner-up is taken
+        over all entries, not just the top-k, which many paraphrases of one answer can fill.
+        """
+        if len(set(terms)) < self.lexical_min_terms:
+            return -1
+        ids = LexicalIndex.top(scores, 1)
+        if not len(ids) or coverage[ids[0]] < 1.0:
+            return -1
+        other_answers = kb.answer_ids[:len(scores)] != kb.answer_ids[ids[0]]
+        runner_up = float(scores[other_answers].max()) if other_answers.any() else 0.0
+        return int(ids[0]) if scores[ids[0]] >= self.lexical_margin * runner_up else -1
+
+    def _rank_candidates(
+        self,
+        state: RetrievalState,
+        query: str,
+        query_embedding: np.ndarray,
+        entry_ids: np.ndarray,
+        similarities: np.ndarray,
+        lexical: Optional[Tuple[np.ndarray, np.ndarray]],
+        trace: RequestTrace
+    ) -> List[Tuple[int, float, float, Optional[float]]]:
+        """
+        Turn one row of top-k search results into distinct answer candidates, best first.
+
+        With hybrid retrieval the lexical top-k entries are added (their cosine similarity is
+        computed from the stored embeddings) and every candidate's confidence is its similarity
+        plus ``lexical_weight`` times its query-term coverage, divided by ``1 + lexical_weight``
+        so it stays on the similarity scale (at most 1); otherwise confidence is the similarity. Many questions share one answer, so candidates are collapsed to the most
+        confident entry per answer. With a reranker they are then reordered by its score.
+        Returns (entry_id, similarity, confidence, rerank_score or None) tuples.
+        """
+        kb = state.kb
+        # FAISS pads missing hits with id -1.
+        similarity_of = {int(e): float(s) for e, s in zip(entry_ids, similarities) if e >= 0}
+        coverage = None
+        if lexical is not None:
+            scores, coverage = lexical
+            for entry_id in LexicalIndex.top(scores, self.top_k):
+                if int(entry_id) not in similarity_of:
+                    similarity_of[int(entry_id)] = float(np.dot(state.embeddings[entry_id], query_embedding))
+        if coverage is None:
+            scored = [(entry_id, similarity, similarity) for entry_id, similarity in similarity_of.items()]
+        else:
+            # A threshold above 1 must never be reached, whatever the coverage.
+            scale = 1.0 / (1.0 + self.lexical_weight)
+            scored = [
+                (entry_id, similarity, (similarity + self.lexical_weight * float(coverage[entry_id])) * scale)
+                for entry_id, similarity in similarity_of.items()
+            ]
+        scored.sort(key=lambda c: c[2], reverse=True)
+
+        seen = set()
+        candidates = []
+        for entry_id, similarity, confidence in scored:
+            answer_id = int(kb.answer_ids[entry_id])
+            if answer_id not in seen:
+                seen.add(answer_id)
+                candidates.append((entry_id, similarity, confidence, None))
+        if self.reranker is None or not candidates:
+            return candidates
+        with trace.stage("rerank"):
+            rerank_scores = self.reranker.score(
+                query, [kb.questions[c[0]] for c in candidates], [kb.answer_for(c[0]) for c in candidates]
+            )
+        ranked = [c[:3] + (float(score),) for c, score in zip(candidates, rerank_scores)]
+        ranked.sort(key=lambda c: (c[3], c[2]), reverse=True)
+        return ranked
+
+    def _pack_contexts(self, kb: KnowledgeBase, entry_ids: List[int]) -> str:
+        """
+        Join the answers of the best distinct candidates into one prompt context.
+
+        Answers are added in ranking order until ``max_contexts`` is reached or the next one
+        would exceed ``context_token_budget`` generator tokens; a first answer that alone is
+        over budget is truncated to it.
+        """
         try:
-            query_lower = query.lower().strip()
-            # Quick response for greetings.
-            if query_lower in self.greeting_words:
-                return self._select_template(query, 'greeting')
-            
-            # Retrieve the best matching question from the index.
-            query_embedding = self.retrieval_model.encode([query], convert_to_numpy=True)
-            faiss.normalize_L2(query_embedding)
-            distances, indices = self.index.search(query_embedding, k=1)
-            best_distance = distances[0][0]
-            best_match = indices[0][0]
-            retrieved_context = self.answers[self.questions[best_match]]
-            
-            # If the retrieval confidence is low, use the generative fallback with the retrieved context.
-            if best_distance < confidence_threshold:
-                self.logger.info("Low retrieval confidence; using generative model with retrieved context.")
-                return self._generate_response(query, retrieved_context)
-            
-            # Otherwise, return the retrieved answer formatted via templating.
-            return self._format_policy_answer(retrieved_context, query)
-        
+            tokenizer = self.tokenizer
+        except Exception:
+            # The generator could not be loaded; generation will report the error.
+            return kb.answer_for(entry_ids[0])
+        parts: List[str] = []
+        used = 0
+        for entry_id in entry_ids[:self.max_contexts]:
+            answer = kb.answer_for(entry_id)
+            token_ids = tokenizer(answer, add_special_tokens=False)["input_ids"]
+            if used + len(token_ids) > self.context_token_budget:
+                if not parts:
+                    parts.append(tokenizer.decode(token_ids[:self.context_token_budget]))
+                break
+            parts.append(answer)
+            used += len(token_ids)
+        return "\n\n".join(parts)
+
+    def _answer_without_encoder(
+        self,
+        queries: List[str],
+        state: RetrievalState,
+        cache_version: int,
+        trace: RequestTrace,
+        responses: List[Optional[str]]
+    ) -> Tuple[List[int], Dict[int, Tuple[np.ndarray, np.ndarray]]]:
+        """
+        Fill in ``responses`` for the queries that need neither the encoder nor the generator:
+        greetings, thanks and help requests, exact cache hits and clear lexical matches.
+
+        Returns the positions of the other queries and their lexical scores, if computed.
+        """
+        cache = self.answer_cache
+        pending = []
+        with trace.stage("cache_lookup"):
+            for i, query in enumerate(queries):
+                # Quick response for greetings, thanks and help requests.
+                intent = self.router.match_intent(query)
+                if intent is not None:
+                    responses[i] = self.router.respond(intent)
+                    trace.path(intent)
+                    continue
+                if cache is not None:
+                    responses[i] = cache.get_exact(query)
+                if responses[i] is None:
+                    pending.append(i)
+                else:
+                    trace.path("cache_exact")
+        if not pending:
+            return pending, {}
+
+        # Answer clear exact-term matches from the lexical index without running the encoder.
+        lexical_of: Dict[int, Tuple[np.ndarray, np.ndarray]] = {}
+        if state.lexical is not None:
+            with trace.stage("lexical"):
+                remaining = []
+                for i in pending:
+                    terms = content_tokens(queries[i])
+                    lexical_of[i] = state.lexical.score(terms)
+                    match = self._lexical_match(state.kb, terms, *lexical_of[i])
+                    if match < 0:
+                        remaining.append(i)
+                        continue
+                    responses[i] = self._format_policy_answer(state.kb.answer_for(match), queries[i])
+                    trace.path("lexical")
+                    if cache is not None:
+                        cache.put(queries[i], None, responses[i], cache_version)
+            pending = remaining
+        return pending, lexical_of
+
+    def answer_fast(self, query: str) -> Optional[str]:
+        """
+        Answer a query only if that needs neither the encoder nor the generator (small talk,
+        an exact cache hit or a clear lexical match); returns None otherwise.
+
+        Servers call this on the request thread so fast answers never wait behind batched
+        encoder and generator work. Queries it leaves unanswered go through ``get_answers``,
+        which repeats these cheap checks (and so also picks up answers cached meanwhile).
+        """
+        cache_version = self.answer_cache.version if self.answer_cache is not None else 0
+        trace = self.metrics.trace()
+        responses: List[Optional[str]] = [None]
+        try:
+            self._answer_without_encoder([query], self._state, cache_version, trace, responses)
+        except Exception as e:
+            self.logger.error(f"Fast-path lookup failed: {e}")
+            return None
+        # Unanswered queries are traced by the get_answers call that answers them.
+        if responses[0] is not None:
+            trace.finish()
+        return responses[0]
+
+    def _plan_answers(
+        self, queries: List[str], confidence_threshold: float, cache_version: int, trace: RequestTrace
+    ) -> Tuple[List[Optional[str]], List[Tuple[int, int, str, np.ndarray]]]:
+        """
+        Resolve every query that does not need the generative model.
+
+        Returns the responses (None for queries that still need generation) and, for those,
+        (position, best_match, retrieved_context, query_embedding) tuples. Greetings, thanks
+        and help requests are answered directly, cached answers are reused, all remaining
+        queries are encoded (unless their embedding is cached) and searched together (top-k
+        each), and confident matches are formatted and cached. A
+        query is answered from the knowledge base when it is a clear lexical match (before
+        encoding), when the reranked top candidate reaches ``rerank_threshold`` or when the best
+        fused confidence reaches ``confidence_threshold``; otherwise the best distinct answers
+        are packed into the generation context.
+        """
+        cache = self.answer_cache
+        state = self._state
+        responses: List[Optional[str]] = [None] * len(queries)
+        fallbacks: List[Tuple[int, int, str, np.ndarray]] = []
+        pending, lexical_of = self._answer_without_encoder(queries, state, cache_version, trace, responses)
+        if not pending:
+            return responses, fallbacks
+
+        # Encode every remaining query not in the router's embedding cache at once.
+        with trace.stage("encode"):
+            query_embeddings = self.router.encode([queries[i] for i in pending], self._encode_queries)
+        embedding_of = {i: query_embeddings[row] for row, i in enumerate(pending)}
+
+        if cache is not None:
+            with trace.stage("cache_lookup"):
+                for i in pending:
+                    responses[i] = cache.get_semantic(embedding_of[i])
+            remaining = [i for i in pending if responses[i] is None]
+            trace.path("cache_semantic", len(pending) - len(remaining))
+            pending = remaining
+            if not pending:
+                return responses, fallbacks
+
+        # Retrieve the top-k matching questions for every remaining query at once.
+        with trace.stage("search"):
+            distances, indices = state.index.search(np.stack([embedding_of[i] for i in pending]), k=self.top_k)
+
+        for row, i in enumerate(pending):
+            candidates = self._rank_candidates(
+                state, queries[i], embedding_of[i], indices[row], distances[row], lexical_of.get(i), trace
+            )
+            # An empty index returns no candidates; fall back to generation without context.
+            best_match = candidates[0][0] if candidates else -1
+            answer_match = None
+            if candidates:
+                trace.similarity(max(c[1] for c in candidates))
+                most_confident = max(candidates, key=lambda c: c[2])
+                if candidates[0][3] is not None and candidates[0][3] >= self.rerank_threshold:
+                    answer_match = best_match
+                elif most_confident[2] >= confidence_threshold:
+                    answer_match = most_confident[0]
+
+            # If the retrieval confidence is low, use the generative fallback with the retrieved contexts.
+            if answer_match is None:
+                if cache is not None:
+                    responses[i] = cache.get_generated(best_match, queries[i])
+                if responses[i] is None:
+                    with trace.stage("pack_context"):
+                        context = (
+                            self._pack_contexts(state.kb, [c[0] for c in candidates])
+                            if candidates and self.generator.uses_context else ""
+                        )
+                    fallbacks.append((i, best_match, context, embedding_of[i]))
+                    continue
+                trace.path("cache_generation")
+            else:
+                # Otherwise, return the retrieved answer formatted via templating.
+                with trace.stage("format"):
+                    responses[i] = self._format_policy_answer(state.kb.answer_for(answer_match), queries[i])
+                trace.path("retrieval")
+            if cache is not None:
+                cache.put(queries[i], embedding_of[i], responses[i], cache_version)
+        return responses, fallbacks
+
+    def _cache_generated(
+        self, query: str, best_match: int, embedding: np.ndarray, response: str, cache_version: int
+    ) -> None:
+        if self.answer_cache is not None and response != GENERATION_ERROR_MESSAGE:
+            self.answer_cache.put_generated(best_match, query, response, cache_version)
+            self.answer_cache.put(query, embedding, response, cache_version)
+
+    def get_answers(self, queries: List[str], confidence_threshold: float = 0.7) -> List[str]:
+        """
+        Answer a batch of queries in one pass.
+
+        All non-small-talk queries are encoded and searched together, and every low-confidence
+        query is sent through a single padded generation call, so a batch costs roughly one
+        encoder pass, one FAISS search and at most one ``generate`` call. When the answer cache
+        is enabled, exact repeats skip the encoder entirely, near-duplicate queries skip the
+        search, and generated responses are reused per (best match, query).
+        """
+        cache_version = self.answer_cache.version if self.answer_cache is not None else 0
+        trace = self.metrics.trace(len(queries))
+        responses: List[Optional[str]] = [None] * len(queries)
+        try:
+            responses, fallbacks = self._plan_answers(queries, confidence_threshold, cache_version, trace)
+            if fallbacks:
+                self.logger.info(
+                    f"Low retrieval confidence for {len(fallbacks)} queries; "
+                    "using generative model with retrieved context."
+                )
+                generated = self._generate_responses(
+                    [queries[i] for i, _, _, _ in fallbacks],
+                    [context for _, _, context, _ in fallbacks],
+                    trace
+                )
+                for (i, best_match, _, embedding), response in zip(fallbacks, generated):
+                    responses[i] = response
+                    trace.path("generation" if response != GENERATION_ERROR_MESSAGE else "error")
+                    self._cache_generated(queries[i], best_match, embedding, response, cache_version)
+            return responses
+
         except Exception as e:
             self.logger.error(f"Answer retrieval failed: {e}")
-            return "I encountered an error while processing your query."
+            trace.path("error", sum(response is None for response in responses))
+            return [
+                response if response is not None else "I encountered an error while processing your query."
+                for response in responses
+            ]
+        finally:
+            trace.finish()
+
+    def stream_answer(self, query: str, confidence_threshold: float = 0.7) -> Iterator[str]:
+        """
+        Answer a single query as a stream of text chunks.
+
+        Greetings, cached answers and high-confidence retrievals are yielded as one chunk; the
+        generative fallback yields text as soon as each token is decoded.
+        """
+        cache_version = self.answer_cache.version if self.answer_cache is not None else 0
+        trace = self.metrics.trace()
+        try:
+            try:
+                responses, fallbacks = self._plan_answers([query], confidence_threshold, cache_version, trace)
+            except Exception as e:
+                self.logger.error(f"Answer retrieval failed: {e}")
+                trace.path("error")
+                yield "I encountered an error while processing your query."
+                return
+            if not fallbacks:
+                yield responses[0]
+                return
+
+            self.logger.info("Low retrieval confidence; streaming generative model output with retrieved context.")
+            _, best_match, context, embedding = fallbacks[0]
+            chunks = []
+            # The generate stage includes the time the client takes to consume each chunk.
+            with trace.stage("generate"):
+                for chunk in self._stream_response(query, context):
+                    chunks.append(chunk)
+                    yield chunk
+            response = "".join(chunks).strip()
+            if response and response != GENERATION_ERROR_MESSAGE:
+                trace.path("generation")
+                trace.generated_tokens(len(self.tokenizer(response)["input_ids"]))
+                self._cache_generated(query, best_match, embedding, response, cache_version)
+            else:
+                trace.path("error")
+        finally:
+            trace.finish()
+
+    def render_metrics(self) -> str:
+        """
+        Render pipeline metrics, answer cache statistics and knowledge base size in the
+        Prometheus text exposition format.
+        """
+        gauges = [
+            ("qa_knowledge_base_entries", "Live entries in the knowledge base.", {}, len(self.kb)),
+            ("qa_knowledge_base_version", "Knowledge base version (bumped on every update).", {}, self.kb_version),
+            ("qa_trace_hook_failures", "Request traces the profiling hook failed to record.", {}, self.metrics.trace_hook_failures)
+        ]
+        if self.answer_cache is not None:
+            stats = self.answer_cache.stats()
+            for tier in ("exact", "semantic", "generation"):
+                for key, value in stats[tier].items():
+                    gauges.append((
+                        f"qa_answer_cache_{key}", f"Answer cache {key} per tier.", {"tier": tier}, value
+                    ))
+        for key, value in self.router.stats().items():
+            gauges.append((f"qa_router_{key}", f"Query router {key.replace('_', ' ')}.", {}, value))
+        if self._prefix_cache is not None:
+            for key, value in self._prefix_cache.stats().items():
+                gauges.append((f"qa_prefix_cache_{key}", f"Prompt prefix cache {key}.", {}, value))
+        return self.metrics.render_prometheus(gauges)
 
 def configure_logging(log_level=logging.INFO):
     logging.basicConfig(
@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+import json
+import logging
+import numpy as np
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+from data_processing.kb_store import QAStore, is_qa_store
+
+
+MetadataKey = Tuple[str, str, str]
+
+
+class QAMetadata:
+    """
+    Metadata shared by the QA pairs generated from one policy section.
+
+    ``section`` and ``source`` are used by retrieval; any other fields (tags, complexity, ...)
+    are kept in ``extra`` so they survive export.
+    """
+    __slots__ = ("section", "source", "extra")
+
+    def __init__(self, section: str = "", source: str = "", extra: Optional[Dict[str, Any]] = None):
+        self.section = section
+        self.source = source
+        self.extra = extra or {}
+
+    @classmethod
+    def from_dict(cls, meta: Optional[dict]) -> "QAMetadata":
+        meta = dict(meta or {})
+        return cls(meta.pop("section", ""), meta.pop("source", ""), meta)
+
+    @staticmethod
+    def key_of(meta: Optional[dict]) -> MetadataKey:
+        """
+        Interning key of a metadata dict: records with equal fields share one QAMetadata.
+        """
+        meta = dict(meta or {})
+        section = meta.pop("section", "")
+        source = meta.pop("source", "")
+        return section, source, json.dumps(meta, sort_keys=True, ensure_ascii=False)
+
+    def key(self) -> MetadataKey:
+        return self.key_of(self.to_dict())
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"section": self.section, "source": self.source, **self.extra}
+
+
+class KnowledgeBase:
+    """
+    Compact in-memory representation of the QA knowledge base.
+
+    Row ``i`` corresponds to row ``i`` of the FAISS index. Each distinct answer text is stored
+    once in ``answers`` and rows point at it through the integer array ``answer_ids``; identical
+    metadata records are shared between rows in the same way. The parsed JSON is not kept.
+
+    Loaded from a binary ``.qakb`` store, ``questions`` and ``answer_ids`` are read-only views
+    of its memory map (copied the first time the entry is mutated) and ``stored_embeddings``
+    holds the question embeddings saved with it, if any, computed by ``embedding_model``.
+    """
+
+    def __init__(
+        self,
+        questions: Sequence[Optional[str]],
+        answers: List[str],
+        answer_ids: np.ndarray,
+        metadata: List[Optional[QAMetadata]],
+        stored_embeddings: Optional[np.ndarray] = None,
+        embedding_model: str = "",
+        embedding_backend: str = ""
+    ):
+        self.questions = questions
+        self.answers = answers
+        self.answer_ids = answer_ids
+        self.metadata = metadata
+        self.stored_embeddings = stored_embeddings
+        self.embedding_model = embedding_model
+        self.embedding_backend = embedding_backend
+        self._answer_index = {answer: i for i, answer in enumerate(answers)}
+        self._metadata_index = {m.key(): m for m in metadata if m is not None}
+        self._live = int(np.count_nonzero(answer_ids >= 0))
+
+    @classmethod
+    def from_records(cls, records: Iterable[dict], logger: Optional[logging.Logger] = None) -> "KnowledgeBase":
+        """
+        Build a knowledge base from QA dicts with ``question``, ``answer`` and optional ``metadata``.
+        """
+        logger = logger or logging.getLogger(__name__)
+        questions: List[str] = []
+        answers: List[str] = []
+        answer_ids: List[int] = []
+        metadata: List[QAMetadata] = []
+        answer_index: Dict[str, int] = {}
+        metadata_index: Dict[MetadataKey, QAMetadata] = {}
+        answer_of_question: Dict[str, int] = {}
+        conflicts = 0
+
+        for item in records:
+            question = item["question"]
+            answer = item["answer"]
+            answer_id = answer_index.setdefault(answer, len(answers))
+            if answer_id == len(answers):
+                answers.append(answer)
+            if answer_of_question.setdefault(question, answer_id) != answer_id:
+                conflicts += 1
+
+            meta = item.get("metadata")
+            meta_key = QAMetadata.key_of(meta)
+            record = metadata_index.get(meta_key)
+            if record is None:
+                record = metadata_index[meta_key] = QAMetadata.from_dict(meta)
+
+            questions.append(question)
+            answer_ids.append(answer_id)
+            metadata.append(record)
+
+        if conflicts:
+            logger.warning(f"{conflicts} duplicate questions map to different answers; each row keeps its own answer.")
+
+        return cls(questions, answers, np.asarray(answer_ids, dtype=np.int32), metadata)
+
+    @classmethod
+    def from_store(cls, store: QAStore) -> "KnowledgeBase":
+        """
+        Wrap a binary knowledge-base store without parsing or copying its rows.
+        """
+        records: Dict[MetadataKey, QAMetadata] = {}
+        table = []
+        # The trailing empty record is picked by rows without metadata (id -1).
+        for meta in store.metadata + [None]:
+            key = QAMetadata.key_of(meta)
+            if key not in records:
+                records[key] = QAMetadata.from_dict(meta)
+            table.append(records[key])
+        return cls(
+            store.questions,
+            list(store.answers),
+            store.answer_ids,
+            [table[i] for i in store.metadata_ids.tolist()],
+            store.embeddings,
+            store.embedding_model,
+            store.embedding_backend
+        )
+
+    @classmethod
+    def from_file(cls, data_path: str, logger: Optional[logging.Logger] = None) -> "KnowledgeBase":
+        """
+        Load a knowledge base from a JSON file of QA pairs, a JSONL file with one pair per line
+        or a binary ``.qakb`` store.
+        """
+        if is_qa_store(data_path):
+            return cls.from_store(QAStore(data_path))
+        with open(data_path, "r", encoding="utf-8") as f:
+            if data_path.endswith(".jsonl"):
+                return cls.from_records((json.loads(line) for line in f if line.strip()), logger=logger)
+            records = json.load(f)
+        return cls.from_records(records, logger=logger)
+
+    def copy(self) -> "KnowledgeBase":
+        """
+        Return a copy that can be mutated without affecting this instance. Stored embeddings
+        are not carried over, as they stop matching the rows once the copy is changed.
+        """
+        return KnowledgeBase(list(self.questions), list(self.answers), self.answer_ids.copy(), list(self.metadata))
+
+    def _make_mutable(self) -> None:
+        if not isinstance(self.questions, list):
+            self.questions = list(self.questions)
+        if not self.answer_ids.flags.writeable:
+            self.answer_ids = self.answer_ids.copy()
+        self.stored_embeddings = None
+
+    def _intern_answer(self, answer: str) -> int:
+        answer_id = self._answer_index.get(answer)
+        if answer_id is None:
+            answer_id = self._answer_index[answer] = len(self.answers)
+            self.answers.append(answer)
+        return answer_id
+
+    def _intern_metadata(self, meta: Optional[dict]) -> QAMetadata:
+        key = QAMetadata.key_of(meta)
+        record = self._metadata_index.get(key)
+        if record is None:
+            record = self._metadata_index[key] = QAMetadata.from_dict(meta)
+        return record
+
+    def append(self, question: str, answer: str, metadata: Optional[dict] = None) -> int:
+        """
+        Add a QA pair and return its entry id.
+        """
+        self._make_mutable()
+        self.questions.append(question)
+        self.answer_ids = np.append(self.answer_ids, np.int32(self._intern_answer(answer)))
+        self.metadata.append(self._intern_metadata(metadata))
+        self._live += 1
+        return len(self.questions) - 1
+
+    def replace(
+        self,
+        entry_id: int,
+        question: Optional[str] = None,
+        answer: Optional[str] = None,
+        metadata: Optional[dict] = None
+    ) -> None:
+        """
+        Update the given fields of a live entry in place.
+        """
+        if not self.is_live(entry_id):
+            raise KeyError(f"No QA entry with id {entry_id}")
+        self._make_mutable()
+        if question is not None:
+            self.questions[entry_id] = question
+        if answer is not None:
+            self.answer_ids[entry_id] = self._intern_answer(answer)
+        if metadata is not None:
+            self.metadata[entry_id] = self._intern_metadata(metadata)
+
+    def remove(self, entry_id: int) -> None:
+        """
+        Tombstone a live entry.
+        """
+        if not self.is_live(entry_id):
+            raise KeyError(f"No QA entry with id {entry_id}")
+        self._make_mutable()
+        self.questions[entry_id] = None
+        self.answer_ids[entry_id] = -1
+        self.metadata[entry_id] = None
+        self._live -= 1
+
+    def is_live(self, entry_id: int) -> bool:
+        return 0 <= entry_id < len(self.questions) and self.answer_ids[entry_id] >= 0
+
+    def live_ids(self) -> np.ndarray:
+        return np.flatnonzero(self.answer_ids >= 0).astype(np.int64)
+
+    def to_records(self) -> List[dict]:
+        """
+        Export the live entries as QA dicts in the JSON knowledge-base layout.
+        """
+        return [
+            {
+                "question": self.questions[i],
+                "answer": self.answer_for(i),
+                "metadata": self.metadata[i].to_dict()
+            }
+            for i in self.live_ids()
+        ]
+
+    @property
+    def num_rows(self) -> int:
+        """
+        Number of entry ids allocated so far, including removed entries.
+        """
+        return len(self.questions)
+
+    def answer_for(self, row: int) -> str:
+        """
+        Return the answer text for an index row.
+        """
+        return self.answers[self.answer_ids[row]]
+
+    def __len__(self) -> int:
+        return self._live
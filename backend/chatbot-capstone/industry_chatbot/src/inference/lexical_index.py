@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+import math
+import numpy as np
+from collections import Counter, defaultdict
+from typing import Dict, List, Sequence, Tuple
+from inference.knowledge_base import KnowledgeBase
+from inference.reranking import content_tokens
+
+# Per-field weights of the BM25 contributions: section headings and questions name the topic,
+# answers mostly add supporting vocabulary.
+FIELD_WEIGHTS = {"question": 1.0, "section": 0.75, "answer": 0.35}
+
+
+class LexicalIndex:
+    """
+    Prebuilt BM25 inverted index over the questions, answers and section names of a
+    knowledge base.
+
+    For every term the index stores the ids of the entries containing it and their
+    query-independent BM25 impact (the field-weighted sum of ``idf * tf * (k1 + 1) /
+    (tf + k1 * (1 - b + b * len / avg_len))``), so scoring a query is one vectorized add per
+    query term. It also stores, per term, the entries whose question or section contains it,
+    which gives the fraction of query terms an entry covers on its topic fields.
+    """
+
+    def __init__(
+        self,
+        num_rows: int,
+        postings: Dict[str, Tuple[np.ndarray, np.ndarray]],
+        topic_postings: Dict[str, np.ndarray]
+    ):
+        self.num_rows = num_rows
+        self.postings = postings
+        self.topic_postings = topic_postings
+
+    @classmethod
+    def from_knowledge_base(
+        cls, kb: KnowledgeBase, k1: float = 1.2, b: float = 0.75, field_weights: Dict[str, float] = FIELD_WEIGHTS
+    ) -> "LexicalIndex":
+        """
+        Build the index over the live entries of a knowledge base. Shared answers and sections
+        are tokenized once.
+        """
+        answer_tokens: Dict[int, List[str]] = {}
+        section_tokens: Dict[str, List[str]] = {}
+        fields: Dict[str, Dict[int, Counter]] = {name: {} for name in field_weights}
+        for entry_id in kb.live_ids():
+            entry_id = int(entry_id)
+            answer_id = int(kb.answer_ids[entry_id])
+            if answer_id not in answer_tokens:
+                answer_tokens[answer_id] = content_tokens(kb.answers[answer_id])
+            meta = kb.metadata[entry_id]
+            section = meta.section if meta is not None else ""
+            if section not in section_tokens:
+                section_tokens[section] = content_tokens(section)
+            fields["question"][entry_id] = Counter(content_tokens(kb.questions[entry_id]))
+            fields["answer"][entry_id] = Counter(answer_tokens[answer_id])
+            fields["section"][entry_id] = Counter(section_tokens[section])
+
+        num_docs = max(1, len(kb))
+        document_frequency: Counter = Counter()
+        for entry_id in fields["question"]:
+            document_frequency.update(set().union(*(fields[name][entry_id] for name in field_weights)))
+        idf = {
+            term: math.log(1.0 + (num_docs - df + 0.5) / (df + 0.5))
+            for term, df in document_frequency.items()
+        }
+
+        impacts: Dict[str, Dict[int, float]] = defaultdict(dict)
+        topic: Dict[str, List[int]] = defaultdict(list)
+        for name, weight in field_weights.items():
+            counts = fields[name]
+            avg_length = max(1e-9, sum(sum(c.values()) for c in counts.values()) / max(1, len(counts)))
+            for entry_id, tf in counts.items():
+                norm = k1 * (1.0 - b + b * sum(tf.values()) / avg_length)
+                for term, freq in tf.items():
+                    impact = weight * idf[term] * freq * (k1 + 1.0) / (freq + norm)
+                    impacts[term][entry_id] = impacts[term].get(entry_id, 0.0) + impact
+                    if name != "answer":
+                        topic[term].append(entry_id)
+
+        postings = {
+            term: (np.fromiter(by_entry.keys(), dtype=np.int64, count=len(by_entry)),
+                   np.fromiter(by_entry.values(), dtype=np.float32, count=len(by_entry)))
+            for term, by_entry in impacts.items()
+        }
+        topic_postings = {term: np.unique(np.asarray(ids, dtype=np.int64)) for term, ids in topic.items()}
+        return cls(kb.num_rows, postings, topic_postings)
+
+    def score(self, terms: Sequence[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Score every entry for the given query terms.
+
+        Returns (BM25 scores, topic coverage) arrays indexed by entry id, where coverage is the
+        fraction of the distinct terms found in the entry's question or section.
+        """
+        scores = np.zeros(self.num_rows, dtype=np.float32)
+        coverage = np.zeros(self.num_rows, dtype=np.float32)
+        distinct = set(terms)
+        for term in distinct:
+            posting = self.postings.get(term)
+            if posting is not None:
+                ids, impacts = posting
+                scores[ids] += impacts
+            topic_ids = self.topic_postings.get(term)
+            if topic_ids is not None:
+                coverage[topic_ids] += 1.0
+        if distinct:
+            coverage /= len(distinct)
+        return scores, coverage
+
+    @staticmethod
+    def top(scores: np.ndarray, k: int) -> np.ndarray:
+        """
+        Ids of the ``k`` highest non-zero scores, best first.
+        """
+        ids = np.flatnonzero(scores)
+        if len(ids) > k:
+            ids = ids[np.argpartition(scores[ids], -k)[-k:]]
+        return ids[np.argsort(-scores[ids], kind="stable")]
@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+import json
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Upper bounds (seconds) for stage and request latency histograms.
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SIMILARITY_BUCKETS = (0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.85, 0.9, 0.95, 0.99, 1.0)
+TOKEN_BUCKETS = (8, 16, 32, 64, 128, 256, 512)
+
+logger = logging.getLogger(__name__)
+
+# Ways a query can be answered, in pipeline order.
+ANSWER_PATHS = (
+    "greeting", "thanks", "help", "cache_exact", "lexical", "cache_semantic", "cache_generation", "retrieval", "generation", "error"
+)
+
+
+class Histogram:
+    """
+    A cumulative-bucket histogram with optional labels, rendered in Prometheus text format.
+    """
+
+    def __init__(self, name: str, help_text: str, buckets: Sequence[float], label: Optional[str] = None):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        self.label = label
+        self._series: Dict[str, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, label_value: str = "") -> None:
+        with self._lock:
+            # Layout: one count per bucket, then +Inf count, then sum.
+            series = self._series.setdefault(label_value, [0.0] * (len(self.buckets) + 2))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += 1
+            series[-1] += value
+
+    def label_values(self) -> List[str]:
+        with self._lock:
+            return sorted(self._series)
+
+    def totals(self, label_value: str = "") -> Tuple[int, float]:
+        """
+        Return the (count, sum) of all observations for one label value.
+        """
+        with self._lock:
+            series = self._series.get(label_value)
+            return (int(series[-2]), series[-1]) if series else (0, 0.0)
+
+    def _labels(self, label_value: str, extra: str = "") -> str:
+        parts = [f'{self.label}="{label_value}"'] if self.label else []
+        if extra:
+            parts.append(extra)
+        return "{" + ",".join(parts) + "}" if parts else ""
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for label_value, series in sorted(self._series.items()):
+                for bound, count in zip(self.buckets, series):
+                    labels = self._labels(label_value, f'le="{bound}"')
+                    lines.append(f"{self.name}_bucket{labels} {int(count)}")
+                labels = self._labels(label_value, 'le="+Inf"')
+                lines.append(f"{self.name}_bucket{labels} {int(series[-2])}")
+                lines.append(f"{self.name}_sum{self._labels(label_value)} {series[-1]:.6f}")
+                lines.append(f"{self.name}_count{self._labels(label_value)} {int(series[-2])}")
+        return lines
+
+
+class Counter:
+    """
+    A monotonically increasing counter with one optional label.
+    """
+
+    def __init__(self, name: str, help_text: str, label: Optional[str] = None):
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        self._values: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, label_value: str = "", amount: float = 1.0) -> None:
+        with self._lock:
+            self._values[label_value] = self._values.get(label_value, 0.0) + amount
+
+    def value(self, label_value: str = "") -> float:
+        return self._values.get(label_value, 0.0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for label_value, value in sorted(self._values.items()):
+                labels = f'{{{self.label}="{label_value}"}}' if self.label else ""
+                lines.append(f"{self.name}{labels} {int(value)}")
+        return lines
+
+
+class RequestTrace:
+    """
+    Per-call record of stage timings, answer paths, similarities and generated tokens.
+
+    Every observation is also forwarded to the shared PipelineMetrics histograms; the trace
+    itself is only kept (and passed to the profiling hook) when one is installed.
+    """
+
+    def __init__(self, metrics: "PipelineMetrics", batch_size: int):
+        self.metrics = metrics
+        self.started = time.perf_counter()
+        self.record: Dict[str, Any] = {
+            "timestamp": time.time(),
+            "batch_size": batch_size,
+            "stages": {},
+            "paths": [],
+            "similarities": [],
+            "generated_tokens": []
+        }
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.metrics.stage_seconds.observe(elapsed, name)
+            stages = self.record["stages"]
+            stages[name] = stages.get(name, 0.0) + elapsed
+
+    def path(self, name: str, count: int = 1) -> None:
+        self.metrics.answers.inc(name, count)
+        self.record["paths"].extend([name] * count)
+
+    def similarity(self, value: float) -> None:
+        self.metrics.similarity.observe(value)
+        self.record["similarities"].append(round(value, 4))
+
+    def generated_tokens(self, count: int) -> None:
+        self.metrics.generated_tokens.observe(count)
+        self.record["generated_tokens"].append(count)
+
+    def finish(self) -> None:
+        elapsed = time.perf_counter() - self.started
+        self.metrics.request_seconds.observe(elapsed)
+        hook = self.metrics.trace_hook
+        if hook is not None:
+            self.record["total_seconds"] = elapsed
+            try:
+                hook(self.record)
+            except Exception:
+                # A broken hook must not fail requests; report it once rather than per request.
+                if self.metrics.record_hook_failure() == 1:
+                    logger.exception("Trace hook failed; further failures are only counted")
+
+
+class PipelineMetrics:
+    """
+    Hot-path instrumentation for PolicyQASystem.
+
+    Args:
+        trace_hook (Optional[Callable[[dict], None]]): Called with the trace record of every
+            finished request (e.g. ``JsonlTraceWriter``); None disables tracing.
+    """
+
+    def __init__(self, trace_hook: Optional[Callable[[dict], None]] = None):
+        self.trace_hook = trace_hook
+        self.trace_hook_failures = 0
+        self._lock = threading.Lock()
+        self.stage_seconds = Histogram(
+            "qa_stage_seconds", "Time spent in each QA pipeline stage.", LATENCY_BUCKETS, label="stage"
+        )
+        self.request_seconds = Histogram(
+            "qa_request_seconds", "End-to-end time of a get_answers/stream_answer call.", LATENCY_BUCKETS
+        )
+        self.similarity = Histogram(
+            "qa_best_match_similarity", "Cosine similarity of the best retrieved question.", SIMILARITY_BUCKETS
+        )
+        self.generated_tokens = Histogram(
+            "qa_generated_tokens", "Tokens produced per generative fallback answer.", TOKEN_BUCKETS
+        )
+        self.answers = Counter("qa_answers_total", "Answered queries by path.", label="path")
+
+    def trace(self, batch_size: int = 1) -> RequestTrace:
+        return RequestTrace(self, batch_size)
+
+    def record_hook_failure(self) -> int:
+        with self._lock:
+            self.trace_hook_failures += 1
+            return self.trace_hook_failures
+
+    def render_prometheus(self, gauges: Optional[List[Tuple[str, str, Dict[str, str], float]]] = None) -> str:
+        """
+        Render all metrics in the Prometheus text exposition format.
+
+        ``gauges`` adds point-in-time values as (name, help, labels, value) tuples, e.g. cache sizes.
+        """
+        lines: List[str] = []
+        for metric in (self.answers, self.request_seconds, self.stage_seconds, self.similarity, self.generated_tokens):
+            lines.extend(metric.render())
+        declared = set()
+        for name, help_text, labels, value in gauges or []:
+            if name not in declared:
+                lines.extend([f"# HELP {name} {help_text}", f"# TYPE {name} gauge"])
+                declared.add(name)
+            label_text = ",".join(f'{k}="{v}"' for k, v in labels.items())
+            lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+class JsonlTraceWriter:
+    """
+    Profiling hook that appends every request trace as one JSON line to a file.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def __call__(self, record: dict) -> None:
+        line = json.dumps(record)
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
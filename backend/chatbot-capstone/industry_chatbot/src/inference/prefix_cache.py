@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+import logging
+import threading
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Dict, List, Optional, Sequence, Tuple
+
+if TYPE_CHECKING:
+    import torch
+
+# Per-layer (key, value) tensors of shape (1, heads, tokens, head_dim).
+Layers = Tuple[Tuple["torch.Tensor", "torch.Tensor"], ...]
+
+
+class PromptPrefixCache:
+    """
+    Past key/values of prompt heads shared by many generations, keyed by their token ids.
+
+    Fallback prompts all start with the same instruction preamble and there are few distinct
+    retrieved contexts, so the attention keys/values of those heads are computed once and
+    reused: a generation then only runs the model over the query-specific rest of its prompt.
+
+    Pinned entries (the instruction preamble) are kept forever. Other entries store only the
+    tokens after the pinned head they extend and are evicted least-recently-used once
+    ``max_tokens`` cached tokens are exceeded; every cached token costs
+    ``layers * 2 * hidden_size * 4`` bytes (about 72KB for gpt-neo-125M).
+    """
+
+    def __init__(self, model, max_tokens: int = 4096, logger: Optional[logging.Logger] = None):
+        """
+        Initialize the cache.
+
+        Args:
+            model: A transformers causal language model returning ``past_key_values``.
+            max_tokens (int): Budget of cached tokens over all unpinned entries.
+            logger (Optional[logging.Logger]): Custom logger for tracking operations.
+        """
+        self.model = model
+        self.max_tokens = max_tokens
+        self.logger = logger or logging.getLogger(__name__)
+        self._pinned: Dict[Tuple[int, ...], Layers] = {}
+        # key -> (pinned head it extends or None, layers of the tokens after that head)
+        self._entries: "OrderedDict[Tuple[int, ...], Tuple[Optional[Tuple[int, ...]], Layers]]" = OrderedDict()
+        self._tokens = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.reused_tokens = 0
+
+    def __len__(self) -> int:
+        return len(self._pinned) + len(self._entries)
+
+    @property
+    def cached_tokens(self) -> int:
+        return self._tokens
+
+    def _forward(self, ids: Sequence[int], past: Optional[Layers] = None) -> Layers:
+        """
+        Run the model over ``ids`` after ``past`` and return the keys/values of ``ids`` only.
+        """
+        import torch
+        from transformers import DynamicCache
+        cache = DynamicCache(past) if past is not None else None
+        offset = past[0][0].shape[2] if past is not None else 0
+        with torch.inference_mode():
+            output = self.model(input_ids=torch.tensor([list(ids)], device=self.model.device), past_key_values=cache, use_cache=True)
+        return tuple(
+            (layer.keys[:, :, offset:].clone(), layer.values[:, :, offset:].clone())
+            for layer in output.past_key_values.layers
+        )
+
+    def _lookup(self, key: Tuple[int, ...]) -> Optional[Layers]:
+        """
+        Full keys/values of a cached head (the pinned head it extends included), or None.
+        """
+        import torch
+        with self._lock:
+            if key in self._pinned:
+                return self._pinned[key]
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+        root, layers = entry
+        if root is None:
+            return layers
+        return tuple(
+            (torch.cat([rk, k], dim=2), torch.cat([rv, v], dim=2))
+            for (rk, rv), (k, v) in zip(self._pinned[root], layers)
+        )
+
+    def pin(self, ids: Sequence[int]) -> None:
+        """
+        Compute and permanently keep the keys/values of a head shared by every prompt.
+        """
+        key = tuple(ids)
+        if key and key not in self._pinned:
+            layers = self._forward(key)
+            with self._lock:
+                self._pinned[key] = layers
+
+    def store(self, ids: Sequence[int], layers: Layers) -> None:
+        """
+        Keep the keys/values of a prompt head, evicting least recently used heads over budget.
+        """
+        key = tuple(ids)
+        root = next((p for p in self._pinned if key[:len(p)] == p), None)
+        own = len(key) - (len(root) if root is not None else 0)
+        if own <= 0 or own > self.max_tokens:
+            return
+        if root is not None:
+            layers = tuple((k[:, :, len(root):], v[:, :, len(root):]) for k, v in layers)
+        with self._lock:
+            if key in self._pinned or key in self._entries:
+                return
+            self._entries[key] = (root, layers)
+            self._tokens += own
+            while self._tokens > self.max_tokens:
+                old_key, (old_root, _) = self._entries.popitem(last=False)
+                self._tokens -= len(old_key) - (len(old_root) if old_root is not None else 0)
+
+    def store_from(self, ids: Sequence[int], cache, row: int, start: int) -> None:
+        """
+        Keep a prompt head from the ``DynamicCache`` of a finished generation, where it occupies
+        positions ``start:start + len(ids)`` of batch row ``row``. Keys/values of a token only
+        depend on the tokens before it, so no extra forward pass is needed.
+        """
+        end = start + len(ids)
+        self.store(ids, tuple(
+            (layer.keys[row:row + 1, :, start:end].clone(), layer.values[row:row + 1, :, start:end].clone())
+            for layer in cache.layers
+        ))
+
+    def prefill(self, ids: Sequence[int]) -> None:
+        """
+        Compute and keep a prompt head ahead of time, starting from its pinned head if any.
+        """
+        import torch
+        key = tuple(ids)
+        base = next((p for p in self._pinned if key[:len(p)] == p and len(p) < len(key)), ())
+        past = self._pinned.get(base)
+        new = self._forward(key[len(base):], past)
+        if past is not None:
+            new = tuple((torch.cat([pk, k], dim=2), torch.cat([pv, v], dim=2)) for (pk, pv), (k, v) in zip(past, new))
+        self.store(key, new)
+
+    def lookup(
+        self, ids: Sequence[int], heads: Sequence[Sequence[int]]
+    ) -> Tuple[int, Optional[Layers], Optional[Tuple[int, ...]]]:
+        """
+        Keys/values for the start of a prompt.
+
+        ``heads`` are candidate prompt heads, longest first (e.g. the head up to the full
+        retrieved context, then up to its first answer, then the instruction preamble); only
+        those whose token ids are a strict prefix of ``ids`` are usable. Returns (number of
+        prompt tokens covered, their keys/values or None, the longest usable head if it is
+        not cached yet so the caller can ``store_from`` it after generating).
+        """
+        ids = tuple(ids)
+        usable = [tuple(h) for h in heads if 0 < len(h) < len(ids) and ids[:len(h)] == tuple(h)]
+        if not usable:
+            return 0, None, None
+        for position, head in enumerate(usable):
+            layers = self._lookup(head)
+            if layers is not None:
+                if position == 0:
+                    self.hits += 1
+                else:
+                    self.misses += 1
+                self.reused_tokens += len(head)
+                return len(head), layers, usable[0] if position else None
+        self.misses += 1
+        return 0, None, usable[0]
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "entries": len(self),
+            "tokens": self._tokens,
+            "hits": self.hits,
+            "misses": self.misses,
+            "reused_tokens": self.reused_tokens
+        }
+
+
+def stack_prefixes(prefixes: List[Tuple[int, Optional[Layers]]], pads: List[int]):
+    """
+    Build one ``DynamicCache`` for a left-padded batch from per-row prompt prefixes.
+
+    Row ``i`` is preceded by ``pads[i]`` padding positions, whose keys/values are zeros (they
+    are masked out by the attention mask). All rows must share one cache length, so the
+    cache covers the first ``min(pad + prefix length)`` positions of the batch and each row's
+    remaining prefix tokens are recomputed with its suffix. Returns None when a row has no
+    usable prefix.
+    """
+    import torch
+    from transformers import DynamicCache
+    if any(layers is None for _, layers in prefixes):
+        return None
+    length = min(pad + covered for pad, (covered, _) in zip(pads, prefixes))
+    if length <= 0:
+        return None
+    stacked = []
+    for layer in range(len(prefixes[0][1])):
+        keys, values = [], []
+        for pad, (_, layers) in zip(pads, prefixes):
+            k, v = layers[layer]
+            padding = min(pad, length)
+            keep = length - padding
+            if padding:
+                zeros = k.new_zeros(k.shape[0], k.shape[1], padding, k.shape[3])
+                keys.append(torch.cat([zeros, k[:, :, :keep]], dim=2))
+                values.append(torch.cat([zeros, v[:, :, :keep]], dim=2))
+            else:
+                keys.append(k[:, :, :keep])
+                values.append(v[:, :, :keep])
+        stacked.append((torch.cat(keys, dim=0), torch.cat(values, dim=0)))
+    return DynamicCache(stacked)
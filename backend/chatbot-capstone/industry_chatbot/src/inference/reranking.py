@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+import re
+import logging
+import numpy as np
+from typing import List, Optional, Sequence, Union
+
+# "lexical": query-term coverage of the candidate question and answer (no model, microseconds).
+# "cross-encoder": a sentence-transformers CrossEncoder scoring (query, candidate) pairs jointly.
+RERANKERS = ("lexical", "cross-encoder")
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset({
+    "a", "about", "an", "and", "any", "are", "as", "at", "be", "by", "can", "could", "do", "does",
+    "for", "from", "how", "i", "if", "in", "is", "it", "me", "my", "of", "on", "or", "our", "please",
+    "should", "tell", "that", "the", "there", "this", "to", "us", "we", "what", "when", "where",
+    "which", "who", "why", "will", "with", "would", "you", "your"
+})
+
+
+def content_tokens(text: str) -> List[str]:
+    """
+    Lowercase alphanumeric tokens of a text without stopwords.
+    """
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOPWORDS]
+
+
+class LexicalReranker:
+    """
+    Scores candidates by the fraction of the query's content terms they contain.
+
+    A term found in the candidate question counts fully and a term found only in its answer
+    counts ``answer_weight``, so scores lie in [0, 1]. Cheap enough to run on every query.
+    """
+
+    def __init__(self, answer_weight: float = 0.5):
+        self.answer_weight = answer_weight
+
+    def score(self, query: str, questions: Sequence[str], answers: Sequence[str]) -> np.ndarray:
+        terms = set(content_tokens(query))
+        scores = np.zeros(len(questions), dtype=np.float32)
+        if not terms:
+            return scores
+        for i, (question, answer) in enumerate(zip(questions, answers)):
+            in_question = terms.intersection(content_tokens(question))
+            in_answer = terms.difference(in_question).intersection(content_tokens(answer))
+            scores[i] = (len(in_question) + self.answer_weight * len(in_answer)) / len(terms)
+        return scores
+
+
+class CrossEncoderReranker:
+    """
+    Scores (query, question + answer) pairs with a cross-encoder; scores are sigmoid-squashed
+    into [0, 1]. The model is loaded on first use.
+    """
+
+    def __init__(
+        self,
+        model_name: str = "cross-encoder/ms-marco-MiniLM-L-6-v2",
+        max_length: int = 256,
+        logger: Optional[logging.Logger] = None
+    ):
+        self.model_name = model_name
+        self.max_length = max_length
+        self.logger = logger or logging.getLogger(__name__)
+        self._model = None
+
+    def _load(self):
+        if self._model is None:
+            from sentence_transformers import CrossEncoder
+            self._model = CrossEncoder(self.model_name, max_length=self.max_length)
+            self.logger.info(f"Loaded cross-encoder reranker {self.model_name}.")
+        return self._model
+
+    def score(self, query: str, questions: Sequence[str], answers: Sequence[str]) -> np.ndarray:
+        import torch
+        pairs = [(query, f"{question} {answer}") for question, answer in zip(questions, answers)]
+        scores = self._load().predict(
+            pairs, activation_fn=torch.nn.Sigmoid(), convert_to_numpy=True, show_progress_bar=False
+        )
+        return np.asarray(scores, dtype=np.float32).reshape(-1)
+
+
+def load_reranker(
+    reranker: Union[str, LexicalReranker, CrossEncoderReranker, None],
+    logger: Optional[logging.Logger] = None
+):
+    """
+    Resolve a reranker name from ``RERANKERS`` (or pass through a reranker instance / None).
+    """
+    if reranker is None or not isinstance(reranker, str):
+        return reranker
+    if reranker == "lexical":
+        return LexicalReranker()
+    if reranker == "cross-encoder":
+        return CrossEncoderReranker(logger=logger)
+    raise ValueError(f"Unknown reranker '{reranker}'; expected one of {RERANKERS}")
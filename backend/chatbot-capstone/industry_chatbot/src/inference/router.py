@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+import re
+import threading
+import numpy as np
+from typing import Callable, Dict, Iterable, List, Optional, Sequence
+from inference.cache import AnswerCache, LRUTTLCache
+
+# Small talk answered without retrieval, matched against the whole normalized query.
+INTENT_PATTERNS = {
+    "greeting": r"(hi|hello|hey|greetings)( there)?",
+    "thanks": r"(thanks?|thank (you|u)|thx|ty|cheers|much appreciated)( (so|very) much| a lot)?( for (the|your) help)?",
+    "help": r"help|help me|(what|how) can you (do|help( me)?)|what do you do|who are you|what are you"
+}
+
+INTENT_RESPONSES = {
+    "thanks": [
+        "You're welcome! Let me know if you have any other policy questions.",
+        "Happy to help! Is there anything else you would like to know?",
+        "Anytime! Feel free to ask about any other policy."
+    ],
+    "help": [
+        "I can answer questions about our organizational and IT policies, such as hardware allocation, "
+        "email usage, data backup or security. What would you like to know?",
+        "Ask me about any company policy, for example laptop maintenance, software installation or "
+        "network access, and I will find the relevant guidelines."
+    ]
+}
+
+# Query words that select a policy-specific answer template (same substring tests as before
+# the router existed, compiled once).
+CUSTOMER_SATISFACTION = re.compile(r"customer satisfaction")
+IT_POLICY = re.compile(r"it|technology")
+
+
+class QueryRouter:
+    """
+    Fast path in front of retrieval: everything about a query that can be answered or reused
+    without running the encoder.
+
+    * Intents: greetings, thanks and help requests are matched by one precompiled pattern
+      and answered from fixed responses.
+    * Query embeddings: a bounded LRU of normalized query text -> normalized embedding, so
+      repeated queries (and queries differing only in case, spacing or trailing punctuation)
+      are never encoded twice. Embeddings do not depend on the knowledge base, so the cache
+      survives reloads.
+    * Answer templates: every knowledge-base answer is formatted with every template once
+      (``precompute``); formatting a retrieved answer is then a dictionary lookup and a
+      random choice.
+    """
+
+    def __init__(
+        self,
+        templates: Dict[str, List[str]],
+        intent_responses: Optional[Dict[str, List[str]]] = None,
+        embedding_cache_size: int = 4096
+    ):
+        """
+        Initialize the router.
+
+        Args:
+            templates (Dict[str, List[str]]): Answer templates per policy type ("greeting",
+                "customer_satisfaction", "it_policy" and "default").
+            intent_responses (Optional[Dict[str, List[str]]]): Responses per intent; greetings
+                use ``templates['greeting']``.
+            embedding_cache_size (int): Maximum number of cached query embeddings (0 disables).
+        """
+        self.templates = templates
+        self.intent_responses = dict(INTENT_RESPONSES, greeting=templates['greeting'])
+        self.intent_responses.update(intent_responses or {})
+        self._intents = re.compile("|".join(f"(?P<{name}>{pattern})" for name, pattern in INTENT_PATTERNS.items()))
+        self.embeddings = LRUTTLCache(embedding_cache_size, ttl_seconds=None) if embedding_cache_size > 0 else None
+        self._formatted: Dict[str, Dict[str, List[str]]] = {}
+        self._lock = threading.Lock()
+
+    def match_intent(self, query: str) -> Optional[str]:
+        """
+        Return the small-talk intent of a query ("greeting", "thanks" or "help"), or None.
+        """
+        match = self._intents.fullmatch(AnswerCache.normalize(query))
+        return match.lastgroup if match else None
+
+    def respond(self, intent: str) -> str:
+        return str(np.random.choice(self.intent_responses[intent]))
+
+    def encode(self, queries: Sequence[str], encoder: Callable[[List[str]], np.ndarray]) -> np.ndarray:
+        """
+        Embeddings of ``queries``: cached rows are reused and the distinct uncached queries are
+        sent to ``encoder`` in one batch (it must return L2-normalized float32 rows).
+        """
+        if self.embeddings is None:
+            return encoder(list(queries))
+        keys = [AnswerCache.normalize(query) for query in queries]
+        found = {}
+        for key in keys:
+            if key not in found:
+                embedding = self.embeddings.get(key)
+                if embedding is not None:
+                    found[key] = embedding
+        missing = {}
+        for key, query in zip(keys, queries):
+            if key not in found:
+                missing.setdefault(key, query)
+        if missing:
+            for key, embedding in zip(missing, encoder(list(missing.values()))):
+                found[key] = embedding
+                self.embeddings.set(key, embedding)
+        return np.stack([found[key] for key in keys])
+
+    def _format_all(self, answer: str) -> Dict[str, List[str]]:
+        """
+        Format an answer with every template of every policy type.
+        """
+        answer = answer.strip().rstrip('.')
+        parts = [part.strip() for part in answer.split('and')] if 'and' in answer else [answer]
+        formatted = {}
+        for policy_type, templates in self.templates.items():
+            if policy_type == 'greeting':
+                continue
+            formatted[policy_type] = []
+            for template in templates:
+                try:
+                    formatted[policy_type].append(template.format(*parts))
+                except (IndexError, KeyError, ValueError):
+                    # Too few answer parts for the template's placeholders.
+                    formatted[policy_type].append(answer)
+        return formatted
+
+    def precompute(self, answers: Iterable[str]) -> None:
+        """
+        Format every answer of a knowledge-base version ahead of time, reusing answers that
+        were already formatted and dropping those no longer present.
+        """
+        formatted = {}
+        for answer in answers:
+            formatted[answer] = self._formatted.get(answer) or self._format_all(answer)
+        with self._lock:
+            self._formatted = formatted
+
+    def format_answer(self, answer: str, query: str) -> str:
+        """
+        Format a retrieved answer with a template chosen from the query's policy type.
+        """
+        query_lower = query.lower()
+        if self.match_intent(query) == "greeting":
+            return self.respond("greeting")
+        policy_type = 'default'
+        if CUSTOMER_SATISFACTION.search(query_lower):
+            policy_type = 'customer_satisfaction'
+        elif IT_POLICY.search(query_lower):
+            policy_type = 'it_policy'
+        formatted = self._formatted.get(answer)
+        if formatted is None:
+            # Answers added after the last precompute are formatted (and kept) on first use.
+            formatted = self._format_all(answer)
+            with self._lock:
+                self._formatted[answer] = formatted
+        return str(np.random.choice(formatted.get(policy_type) or formatted['default']))
+
+    def stats(self) -> Dict[str, int]:
+        stats = {"formatted_answers": len(self._formatted)}
+        if self.embeddings is not None:
+            stats.update({f"embedding_cache_{key}": value for key, value in self.embeddings.stats().items()})
+        return stats
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""
+Pre-fork multi-process server for the Flask app.
+
+The parent process binds the listening socket and imports ``App`` once, which loads the
+retrieval model, the knowledge base and the FAISS index (memory-mapped from the index cache
+when available); it then loads the generator, calls ``PolicyQASystem.prepare_for_fork`` and
+forks ``QA_WORKERS`` workers that all accept on the shared socket. Workers inherit the parent's memory, so the
+read-only model weights, embedding matrix and index pages stay physically shared
+(copy-on-write) instead of being loaded once per worker; only per-request state is private.
+
+The parent only supervises: it restarts workers that die, performs a rolling restart on
+SIGHUP after reloading the knowledge base (``/api/admin/reload`` only reloads the worker that
+serves it), and stops every worker on SIGTERM/SIGINT.
+
+Usage (from the ``src`` directory):
+    QA_WORKERS=4 python prefork.py --port 5000
+
+Per-worker memory: Rss counts shared pages in every worker, Pss splits them between the
+processes sharing them, so sum(Pss) is the real footprint of the whole server:
+    python -m benchmarks.worker_memory --pid <parent pid>
+
+The same layout works under gunicorn with ``gunicorn -c gunicorn.conf.py App:app``.
+"""
+import os
+import sys
+import time
+import signal
+import socket
+import logging
+import argparse
+from typing import Dict
+
+WORKERS = int(os.environ.get('QA_WORKERS', 2))
+
+logger = logging.getLogger("prefork")
+
+
+def worker_threads(workers: int) -> int:
+    """
+    Torch intra-op threads per worker, so that all workers together use each core once.
+    """
+    return max(1, (os.cpu_count() or 1) // max(1, workers))
+
+
+def configure_worker(torch_threads: int) -> None:
+    """
+    Per-worker setup after fork: size torch's thread pool for this worker.
+    """
+    import torch
+    torch.set_num_threads(torch_threads)
+
+
+def run_worker(app, listener: socket.socket, torch_threads: int) -> None:
+    from werkzeug.serving import make_server
+    signal.signal(signal.SIGHUP, signal.SIG_DFL)
+    # werkzeug stops serve_forever cleanly on KeyboardInterrupt.
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    signal.signal(signal.SIGINT, signal.default_int_handler)
+    configure_worker(torch_threads)
+    host, port = listener.getsockname()[:2]
+    server = make_server(host, port, app, threaded=True, fd=listener.fileno())
+    logger.info(f"Worker {os.getpid()} serving")
+    server.serve_forever()
+
+
+class PreforkServer:
+    """
+    Supervises forked workers that share one listening socket and one loaded PolicyQASystem.
+    """
+
+    def __init__(
+        self, app, qa_system, listener: socket.socket, workers: int, torch_threads: int, load_generator: bool = True
+    ):
+        """
+        Initialize the supervisor.
+
+        Args:
+            app: The WSGI application served by every worker.
+            qa_system: The PolicyQASystem the app uses; reloaded and re-frozen on SIGHUP.
+            listener (socket.socket): Bound, listening socket inherited by the workers.
+            workers (int): Number of worker processes.
+            torch_threads (int): Torch intra-op threads per worker.
+            load_generator (bool): Load the generator in the parent before every fork, including
+                the rolling restart after a reload (False leaves it to each worker).
+        """
+        self.app = app
+        self.qa_system = qa_system
+        self.listener = listener
+        self.num_workers = workers
+        self.torch_threads = torch_threads
+        self.load_generator = load_generator
+        self.workers: Dict[int, float] = {}
+        self._stopping = False
+        self._reload_requested = False
+
+    def spawn(self) -> int:
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                run_worker(self.app, self.listener, self.torch_threads)
+            except KeyboardInterrupt:
+                pass
+            except Exception as e:
+                logger.error(f"Worker {os.getpid()} crashed: {e}")
+                code = 1
+            finally:
+                os._exit(code)
+        self.workers[pid] = time.time()
+        return pid
+
+    def _reap(self) -> None:
+        while self.workers:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                self.workers.clear()
+                return
+            if pid == 0:
+                return
+            if self.workers.pop(pid, None) is not None and not self._stopping:
+                logger.warning(f"Worker {pid} exited with status {status}; restarting")
+
+    def _stop_worker(self, pid: int, timeout: float = 30.0) -> None:
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            try:
+                if os.waitpid(pid, os.WNOHANG)[0] == pid:
+                    break
+            except ChildProcessError:
+                break
+            time.sleep(0.05)
+        else:
+            os.kill(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+        self.workers.pop(pid, None)
+
+    def reload(self) -> None:
+        """
+        Reload the knowledge base in the parent, then replace the workers one at a time so
+        the server keeps accepting requests throughout.
+        """
+        try:
+            version = self.qa_system.reload_knowledge_base()
+        except Exception as e:
+            logger.error(f"Reload failed; keeping current workers: {e}")
+            return
+        self.qa_system.prepare_for_fork(load_generator=self.load_generator)
+        for pid in list(self.workers):
+            self.spawn()
+            self._stop_worker(pid)
+        logger.info(f"Reloaded knowledge base version {version}")
+
+    def run(self) -> None:
+        def stop(signum, frame):
+            self._stopping = True
+
+        def request_reload(signum, frame):
+            self._reload_requested = True
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+        signal.signal(signal.SIGHUP, request_reload)
+
+        while not self._stopping:
+            self._reap()
+            while len(self.workers) < self.num_workers and not self._stopping:
+                self.spawn()
+            if self._reload_requested:
+                self._reload_requested = False
+                self.reload()
+            time.sleep(0.2)
+
+        for pid in list(self.workers):
+            self._stop_worker(pid)
+        self.listener.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the policy QA app with pre-forked workers.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    parser.add_argument("--torch-threads", type=int, help="Defaults to cpu_count // workers.")
+    parser.add_argument("--lazy-generator", action="store_true",
+                        help="Do not load the generator before forking (each worker loads its own copy on demand).")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    listener = socket.create_server((args.host, args.port), backlog=128)
+    listener.set_inheritable(True)
+
+    from App import app, qa_system
+    load_generator = not args.lazy_generator
+    qa_system.prepare_for_fork(load_generator=load_generator)
+
+    host, port = listener.getsockname()[:2]
+    logger.info(f"Parent {os.getpid()} listening on http://{host}:{port} with {args.workers} workers")
+    PreforkServer(
+        app, qa_system, listener, args.workers, args.torch_threads or worker_threads(args.workers), load_generator
+    ).run()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+The PolicyQASystem shared by the server entry points (App for Flask, asgi_app for ASGI).
+
+Data, models and caches are configured from the environment, so importing this module builds
+exactly one system and nothing server-specific (no Flask app, no micro-batcher).
+"""
+import os
+import json
+from inference.inference import PolicyQASystem
+from inference.metrics import JsonlTraceWriter, PipelineMetrics
+
+# Set QA_TRACE_FILE to append a JSON trace (stage timings, answer paths, similarities) per request.
+TRACE_FILE = os.environ.get('QA_TRACE_FILE')
+
+# Data, models and caches can be overridden from the environment (e.g. by the benchmarks,
+# which run the app against tiny local models).
+DATA_PATH = os.environ.get(
+    'QA_DATA_PATH',
+    r'C:\Users\moksh\classroom\chatbot_deepseek\industry_chatbot\data\knowledge_base\cleaned_augmented_qa_pairs.json'
+)
+RETRIEVAL_MODEL = os.environ.get('QA_RETRIEVAL_MODEL', 'sentence-transformers/all-MiniLM-L6-v2')
+# QA_GENERATOR=fine-tuned serves the checkpoint written by Model_finetuning.train_model
+# (./fine_tuned_model unless QA_GEN_MODEL is set) instead of prompting base GPT-Neo.
+GENERATOR = os.environ.get('QA_GENERATOR', 'policy')
+GEN_MODEL = os.environ.get('QA_GEN_MODEL') or None
+# Generator device ("auto", "cpu", "cuda") and optional JSON generate() settings,
+# e.g. QA_SAMPLING='{"do_sample": true, "temperature": 0.7, "max_new_tokens": 80}'.
+DEVICE = os.environ.get('QA_DEVICE', 'auto')
+SAMPLING = json.loads(os.environ['QA_SAMPLING']) if os.environ.get('QA_SAMPLING') else None
+INDEX_CACHE_DIR = os.environ.get('QA_INDEX_CACHE_DIR')
+USE_ANSWER_CACHE = os.environ.get('QA_ANSWER_CACHE', '1') != '0'
+# The generator loads on the first low-confidence query unless QA_LAZY_GENERATOR=0;
+# QA_WARMUP_GENERATOR=1 loads it on a background thread right after startup instead.
+LAZY_GENERATOR = os.environ.get('QA_LAZY_GENERATOR', '1') != '0'
+WARMUP_GENERATOR = os.environ.get('QA_WARMUP_GENERATOR', '0') == '1'
+# Candidates fetched per query and optional reranker ("lexical" or "cross-encoder").
+TOP_K = int(os.environ.get('QA_TOP_K', 5))
+RERANKER = os.environ.get('QA_RERANKER') or None
+# QA_HYBRID=0 disables the BM25 lexical index (exact-term shortcut and score fusion).
+HYBRID_RETRIEVAL = os.environ.get('QA_HYBRID', '1') != '0'
+# Reuse the attention keys/values of the prompt preamble and of retrieved contexts across
+# fallback generations; QA_PREFIX_CACHE_TOKENS bounds the cached context tokens.
+PREFIX_CACHE = os.environ.get('QA_PREFIX_CACHE', '1') != '0'
+PREFIX_CACHE_TOKENS = int(os.environ.get('QA_PREFIX_CACHE_TOKENS', 4096))
+# Query embeddings cached by normalized text, so repeated queries never reach the encoder.
+QUERY_CACHE_SIZE = int(os.environ.get('QA_QUERY_CACHE_SIZE', 4096))
+# QA_INFERENCE_BACKEND: "torch", "int8", "onnx" or "fake" (fixed-latency stand-in models for
+# hermetic load tests, tuned with QA_FAKE_LATENCY='{"token_ms": 20, "response_tokens": 48}').
+INFERENCE_BACKEND = os.environ.get('QA_INFERENCE_BACKEND', 'torch')
+FAKE_LATENCY = json.loads(os.environ['QA_FAKE_LATENCY']) if os.environ.get('QA_FAKE_LATENCY') else None
+
+qa_system = PolicyQASystem(
+    data_path=DATA_PATH,
+    retrieval_model=RETRIEVAL_MODEL,
+    gen_model=GEN_MODEL,
+    generator=GENERATOR,
+    device=DEVICE,
+    sampling=SAMPLING,
+    index_cache_dir=INDEX_CACHE_DIR,
+    use_answer_cache=USE_ANSWER_CACHE,
+    lazy_generator=LAZY_GENERATOR,
+    warmup_generator=WARMUP_GENERATOR,
+    top_k=TOP_K,
+    reranker=RERANKER,
+    hybrid_retrieval=HYBRID_RETRIEVAL,
+    prefix_cache=PREFIX_CACHE,
+    prefix_cache_tokens=PREFIX_CACHE_TOKENS,
+    query_cache_size=QUERY_CACHE_SIZE,
+    inference_backend=INFERENCE_BACKEND,
+    fake_latency=FAKE_LATENCY,
+    metrics=PipelineMetrics(trace_hook=JsonlTraceWriter(TRACE_FILE) if TRACE_FILE else None)
+)
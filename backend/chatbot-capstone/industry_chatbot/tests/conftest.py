@@ -0,0 +1,94 @@
+import json
+import os
+import sys
+
+import pytest
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+if SRC_DIR not in sys.path:
+    sys.path.insert(0, SRC_DIR)
+
+
+QA_RECORDS = [
+    {"question": "hi", "answer": "hello, how can I help you?",
+     "metadata": {"section": "Greetings", "source": "General"}},
+    {"question": "What is the leave policy?",
+     "answer": "Employees get 20 days of paid leave per year.",
+     "metadata": {"section": "Leave", "source": "HR Policy"}},
+    {"question": "How many days of paid leave do employees get?",
+     "answer": "Employees get 20 days of paid leave per year.",
+     "metadata": {"section": "Leave", "source": "HR Policy"}},
+    {"question": "Who approves remote work requests?",
+     "answer": "Remote work requests are approved by the line manager.",
+     "metadata": {"section": "Remote Work", "source": "HR Policy"}},
+    {"question": "How often must passwords be changed?",
+     "answer": "Passwords must be changed every 90 days.",
+     "metadata": {"section": "Access Control", "source": "IT Policy"}},
+    {"question": "Who owns the data retention schedule?",
+     "answer": "The data protection officer owns the retention schedule.",
+     "metadata": {"section": "Data Retention", "source": "Data Policy"}},
+]
+
+
+NO_LATENCY = {"encode_ms": 0, "encode_per_text_ms": 0, "prefill_ms": 0, "token_ms": 0}
+
+
+@pytest.fixture
+def qa_records():
+    return [dict(record, metadata=dict(record["metadata"])) for record in QA_RECORDS]
+
+
+@pytest.fixture
+def kb_path(tmp_path, qa_records):
+    path = tmp_path / "qa_pairs.json"
+    path.write_text(json.dumps(qa_records), encoding="utf-8")
+    return str(path)
+
+
+@pytest.fixture
+def make_qa_system(tmp_path):
+    """
+    Build a PolicyQASystem on the hermetic fake backend, caching its index under tmp_path.
+    """
+    from inference.inference import PolicyQASystem
+
+    def factory(data_path, **kwargs):
+        kwargs.setdefault("index_cache_dir", str(tmp_path / "index_cache"))
+        kwargs.setdefault("fake_latency", NO_LATENCY)
+        return PolicyQASystem(data_path, inference_backend="fake", **kwargs)
+
+    return factory
+
+
+@pytest.fixture(scope="session")
+def qa_service(tmp_path_factory):
+    """
+    Import qa_service, which builds its PolicyQASystem from the environment at import time,
+    on the fake backend so the server modules (App, asgi_app) can be imported.
+    """
+    root = tmp_path_factory.mktemp("qa_service")
+    data_path = root / "qa_pairs.json"
+    data_path.write_text(json.dumps(QA_RECORDS), encoding="utf-8")
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setenv("QA_DATA_PATH", str(data_path))
+        patch.setenv("QA_INFERENCE_BACKEND", "fake")
+        patch.setenv("QA_FAKE_LATENCY", json.dumps(NO_LATENCY))
+        patch.setenv("QA_INDEX_CACHE_DIR", str(root / "index_cache"))
+        import qa_service
+    return qa_service
+
+
+@pytest.fixture(scope="session")
+def tiny_models(tmp_path_factory):
+    """
+    The tiny offline encoder and generator from ``benchmarks.tiny_models``, with a vocabulary
+    built from QA_RECORDS. Returns (data_path, retrieval_model, gen_model).
+    """
+    for module in ("torch", "transformers", "sentence_transformers", "tokenizers"):
+        pytest.importorskip(module)
+    from benchmarks.tiny_models import build_tiny_models
+    root = tmp_path_factory.mktemp("tiny_models")
+    data_path = root / "qa_pairs.json"
+    data_path.write_text(json.dumps(QA_RECORDS), encoding="utf-8")
+    encoder, generator = build_tiny_models(str(root / "models"), str(data_path))
+    return str(data_path), encoder, generator
@@ -0,0 +1,351 @@
+import json
+import logging
+import os
+
+import numpy as np
+import pytest
+
+from data_processing.kb_store import QAStore, export_json, import_json, write_qa_store
+from data_processing.preprocess import SECTION_SPLIT_PATTERN, generate_qa_pairs, iter_qa_pairs
+from data_processing.post_process_qa_pairs import cluster_near_duplicates, cluster_stats, semantic_dedup
+from data_processing.qa_io import QARecordWriter, iter_qa_records
+
+
+def at_angles(*degrees):
+    """
+    Unit vectors in the plane at the given angles, so cosine similarities are easy to control.
+    """
+    radians = np.radians(degrees)
+    return np.stack([np.cos(radians), np.sin(radians)], axis=1).astype(np.float32)
+
+
+class TestClusterNearDuplicates:
+
+    def test_groups_rows_above_threshold(self):
+        embeddings = at_angles(0, 5, 90, 3, 92)
+        assert cluster_near_duplicates(embeddings, threshold=0.99) == [[0, 1, 3], [2, 4]]
+
+    def test_paraphrases_of_paraphrases_are_not_chained(self):
+        # 0 ~ 1 and 1 ~ 2, but 0 and 2 are 40 degrees apart.
+        embeddings = at_angles(0, 20, 40)
+        threshold = float(np.cos(np.radians(25)))
+        assert cluster_near_duplicates(embeddings, threshold) == [[0, 1], [2]]
+
+    @pytest.mark.parametrize("block_size", [1, 2, 1024])
+    def test_block_size_does_not_change_clusters(self, block_size):
+        rng = np.random.default_rng(0)
+        base = rng.normal(size=(6, 16))
+        embeddings = np.concatenate([base, base + rng.normal(scale=0.05, size=base.shape)])
+        embeddings = (embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)).astype(np.float32)
+        assert cluster_near_duplicates(embeddings, 0.95, block_size) == [[i, i + 6] for i in range(6)]
+
+
+class TestSemanticDedup:
+
+    def test_keeps_first_of_each_cluster_in_input_order(self):
+        entries = [
+            {"question": "What is the leave policy?", "answer": "20 days."},
+            {"question": "Who approves travel?", "answer": "The manager."},
+            {"question": "Tell me the leave policy", "answer": "20 days. "},
+            {"question": "Who signs off on travel?", "answer": "The manager."},
+        ]
+        kept, clusters = semantic_dedup(entries, threshold=0.99, embeddings=at_angles(0, 90, 2, 91))
+        assert [entry["question"] for entry in kept] == ["What is the leave policy?", "Who approves travel?"]
+        assert sorted(clusters) == [[0, 2], [1, 3]]
+
+    def test_similar_questions_with_different_answers_are_kept(self):
+        entries = [
+            {"question": "What is the leave policy?", "answer": "20 days."},
+            {"question": "What is the leave policy?", "answer": "25 days for managers."},
+        ]
+        kept, clusters = semantic_dedup(entries, threshold=0.9, embeddings=at_angles(0, 0))
+        assert kept == entries
+        assert sorted(clusters) == [[0], [1]]
+
+    def test_stats_count_removed_duplicates(self):
+        entries = [{"question": f"q{i}", "answer": "a" if i < 3 else "b"} for i in range(5)]
+        kept, clusters = semantic_dedup(entries, threshold=0.99, embeddings=at_angles(0, 1, 45, 0, 60))
+        stats = cluster_stats(entries, clusters)
+        assert len(kept) == 4
+        assert stats["answer_groups"] == 2
+        assert stats["duplicates_removed"] == 1
+        assert stats["largest_cluster"] == 2
+
+    def test_empty_input(self):
+        assert semantic_dedup([], embeddings=np.zeros((0, 2), dtype=np.float32)) == ([], [])
+
+
+# A policy document as extracted lines. The heading "Data" is only recognized together with the
+# capitalized word that starts the next line, so splitting pages there cuts a heading in two.
+DOCUMENT_LINES = [
+    "Information Technology Policy",
+    "Policy Ref. No. IT-01 Page 1",
+    "Hardware Allocation",
+    "Laptops are issued to every permanent employee by the IT department.",
+    "They remain company property and must be returned on exit.",
+    "Email Usage",
+    "Company email is for business use and must not be used for",
+    "personal subscriptions or bulk forwarding.",
+    "Data",
+    "Retention rules",
+    "Records are kept for seven years and then securely destroyed.",
+    "",
+    "Network Access Rules",
+    "Guests use the visitor network; internal systems require VPN access.",
+    "Email Usage",
+    "This duplicate heading is skipped by the question generator.",
+]
+
+
+def page_splits(lines):
+    """
+    Every way of cutting the document into three pages at line boundaries (pages may be empty).
+    """
+    for i in range(len(lines) + 1):
+        for j in range(i, len(lines) + 1):
+            yield ["\n".join(lines[:i]), "\n".join(lines[i:j]), "\n".join(lines[j:])]
+
+
+class TestStreamingIngestion:
+
+    @pytest.fixture(autouse=True)
+    def ingest(self):
+        pytest.importorskip("pdfplumber")
+        from data_processing import ingest
+        return ingest
+
+    def test_sections_match_whole_document_split(self, ingest):
+        sections = SECTION_SPLIT_PATTERN.split("\n".join(DOCUMENT_LINES))
+        assert "Data\nRetention rules\nRecords are kept for seven years and then securely destroyed.\n" in sections
+        for pages in page_splits(DOCUMENT_LINES):
+            assert list(ingest.iter_sections(pages)) == SECTION_SPLIT_PATTERN.split("\n".join(pages)), pages
+
+    def test_section_crossing_a_page_boundary(self, ingest):
+        # The retention heading is cut after "Data" and its content spans the next page.
+        cut = DOCUMENT_LINES.index("Data") + 1
+        pages = ["\n".join(DOCUMENT_LINES[:cut]), "\n".join(DOCUMENT_LINES[cut:])]
+        pairs = list(iter_qa_pairs(ingest.iter_sections(pages)))
+        assert pairs == generate_qa_pairs("\n".join(DOCUMENT_LINES))
+        retention = [pair for pair in pairs if pair["metadata"]["section"] == "Data"]
+        assert retention and retention[0]["answer"].startswith("Retention rules Records are kept")
+
+    def test_ingest_pdf_streams_the_same_pairs(self, ingest, tmp_path, monkeypatch):
+        pages = ["\n".join(DOCUMENT_LINES[:4]), "", "\n".join(DOCUMENT_LINES[4:11]), "\n".join(DOCUMENT_LINES[11:])]
+        monkeypatch.setattr(ingest, "iter_page_texts", lambda pdf_path, executor=None, pages_per_task=8: iter(pages))
+        path = str(tmp_path / "qa.jsonl")
+        with QARecordWriter(path) as out:
+            count = ingest.ingest_pdf("policy.pdf", out, source="IT Policy Document")
+        expected = generate_qa_pairs("\n".join(pages))
+        assert count == len(expected) > 0
+        assert list(iter_qa_records(path)) == expected
+
+    def test_empty_document(self, ingest):
+        assert list(ingest.iter_sections([])) == []
+        assert list(ingest.iter_sections([""])) == SECTION_SPLIT_PATTERN.split("")
+
+
+RECORDS = [
+    {"question": "What is the leave policy?", "answer": "20 days.", "metadata": {"section": "Leave", "source": "HR"}},
+    {"question": "Is leave paid?", "answer": "20 days.", "metadata": {"section": "Leave", "source": "HR"}},
+    {"question": "Qui approuve le télétravail ?", "answer": "Le manager.",
+     "metadata": {"section": "Remote", "tags": ["fr"], "complexity": "basic"}},
+    {"question": "Who owns backups?", "answer": "IT."},
+]
+
+
+class TestQAStore:
+
+    def test_round_trip_keeps_records_and_embeddings(self, tmp_path):
+        path = str(tmp_path / "kb.qakb")
+        embeddings = np.eye(len(RECORDS), 8, dtype=np.float32)
+        assert write_qa_store(path, RECORDS, embeddings, "test-model") == len(RECORDS)
+        store = QAStore(path)
+        assert len(store) == len(RECORDS)
+        assert list(store.records()) == RECORDS
+        assert len(store.answers) == 3
+        np.testing.assert_array_equal(store.embeddings, embeddings)
+        assert store.embedding_model == "test-model"
+
+    def test_json_import_and_export(self, tmp_path):
+        json_path = tmp_path / "kb.json"
+        json_path.write_text(json.dumps(RECORDS), encoding="utf-8")
+        store_path = str(tmp_path / "kb.qakb")
+        import_json(str(json_path), store_path)
+        assert export_json(store_path, str(tmp_path / "out.jsonl")) == len(RECORDS)
+        assert list(iter_qa_records(str(tmp_path / "out.jsonl"))) == RECORDS
+        assert list(iter_qa_records(store_path)) == RECORDS
+
+    def test_knowledge_base_reads_store(self, tmp_path):
+        from inference.knowledge_base import KnowledgeBase
+        path = str(tmp_path / "kb.qakb")
+        write_qa_store(path, RECORDS)
+        kb = KnowledgeBase.from_file(path)
+        assert kb.to_records()[2]["metadata"] == {"section": "Remote", "source": "", "tags": ["fr"], "complexity": "basic"}
+        assert kb.answer_ids[0] == kb.answer_ids[1]
+
+
+class TestQARecordWriter:
+
+    @pytest.mark.parametrize("name", ["out.json", "out.jsonl", "out.qakb"])
+    def test_round_trip(self, tmp_path, name):
+        path = str(tmp_path / name)
+        with QARecordWriter(path) as writer:
+            for record in RECORDS:
+                writer.write(record)
+        assert list(iter_qa_records(path)) == RECORDS
+        assert os.listdir(tmp_path) == [name]
+
+    def test_json_layout_matches_json_dump(self, tmp_path):
+        path = tmp_path / "out.json"
+        with QARecordWriter(str(path)) as writer:
+            for record in RECORDS:
+                writer.write(record)
+        assert path.read_text(encoding="utf-8") == json.dumps(RECORDS, indent=2, ensure_ascii=False)
+
+    @pytest.mark.parametrize("name", ["out.json", "out.jsonl", "out.qakb"])
+    def test_resume_after_failure(self, tmp_path, name):
+        path = str(tmp_path / name)
+        with pytest.raises(RuntimeError):
+            with QARecordWriter(path) as writer:
+                writer.write(RECORDS[0])
+                writer.write(RECORDS[1])
+                offset, count = writer.offset(), writer.count
+                writer.write(RECORDS[2])
+                raise RuntimeError("interrupted")
+        if name.endswith(".qakb"):
+            # The spill file is kept (and nothing is converted) so the run can be resumed.
+            assert not os.path.exists(path)
+            assert os.path.exists(path + ".rows.jsonl")
+
+        with QARecordWriter(path, offset, count) as writer:
+            writer.write(RECORDS[2])
+            writer.write(RECORDS[3])
+        assert list(iter_qa_records(path)) == RECORDS
+        assert os.listdir(tmp_path) == [name]
+
+    def test_resume_without_partial_output_fails(self, tmp_path):
+        with pytest.raises(FileNotFoundError):
+            QARecordWriter(str(tmp_path / "out.qakb"), resume_offset=10, resume_count=2)
+
+
+class TestAugmentationResume:
+
+    def make_enhancer(self, fail_on_call=None):
+        augmentation = pytest.importorskip("data_processing.advance_aq_augumentation_system")
+        calls = []
+
+        class Enhancer(augmentation.QADatasetEnhancer):
+            def __init__(self):
+                self.logger = logging.getLogger("test_augmentation")
+                self.prompt_batches = []
+
+            def generate_alternative_questions(self, questions):
+                self.prompt_batches.append(len(questions))
+                return [f"{question} (rephrased)" for question in questions]
+
+            def _augment_batch(self, entries, augmentation_factor):
+                calls.append(entries[0]["question"])
+                if len(calls) == fail_on_call:
+                    raise RuntimeError("worker crashed")
+                return super()._augment_batch(entries, augmentation_factor)
+
+        return Enhancer(), calls
+
+    def write_input(self, tmp_path, count):
+        input_path = tmp_path / "qa.json"
+        records = [{"question": f"Question {i}?", "answer": f"Answer {i}."} for i in range(count)]
+        input_path.write_text(json.dumps(records), encoding="utf-8")
+        return str(input_path)
+
+    def test_empty_input(self, tmp_path):
+        input_path = self.write_input(tmp_path, 0)
+        output_path = str(tmp_path / "augmented.jsonl")
+        enhancer, calls = self.make_enhancer()
+        assert enhancer.augment_dataset(input_path, output_path) == 0
+        assert calls == []
+        assert list(iter_qa_records(output_path)) == []
+        assert sorted(os.listdir(tmp_path)) == ["augmented.jsonl", "qa.json"]
+
+    @pytest.mark.parametrize("num_workers", [1, 3])
+    def test_batches_generate_every_variation_at_once(self, tmp_path, num_workers):
+        input_path = self.write_input(tmp_path, 7)
+        output_path = str(tmp_path / "augmented.jsonl")
+        enhancer, calls = self.make_enhancer()
+        written = enhancer.augment_dataset(
+            input_path, output_path, augmentation_factor=2, batch_size=3, num_workers=num_workers
+        )
+        assert written == 21
+        assert calls == ["Question 0?", "Question 3?", "Question 6?"]
+        # One generate call per batch, covering every variation of every entry in it.
+        assert sorted(enhancer.prompt_batches) == [2, 6, 6]
+        rows = list(iter_qa_records(output_path))
+        assert [row["question"] for row in rows] == [
+            q for i in range(7) for q in [f"Question {i}?"] + [f"Question {i}? (rephrased)"] * 2
+        ]
+        assert all(row["answer"] == f"Answer {i // 3}." for i, row in enumerate(rows))
+
+    def test_checkpoint_records_progress_and_resumes_mid_run(self, tmp_path):
+        input_path = self.write_input(tmp_path, 7)
+        output_path = str(tmp_path / "augmented.jsonl")
+        checkpoint_path = output_path + ".ckpt"
+
+        enhancer, _ = self.make_enhancer(fail_on_call=3)
+        with pytest.raises(RuntimeError):
+            enhancer.augment_dataset(input_path, output_path, augmentation_factor=1, batch_size=2)
+        with open(checkpoint_path, encoding="utf-8") as f:
+            checkpoint = json.load(f)
+        assert checkpoint["completed_batches"] == 2
+        assert checkpoint["rows_written"] == 8
+
+        enhancer, calls = self.make_enhancer()
+        assert enhancer.augment_dataset(input_path, output_path, augmentation_factor=1, batch_size=2) == 14
+        assert calls == ["Question 4?", "Question 6?"]
+        questions = [record["question"] for record in iter_qa_records(output_path)]
+        assert questions == [q for i in range(7) for q in (f"Question {i}?", f"Question {i}? (rephrased)")]
+        assert not os.path.exists(checkpoint_path)
+
+    def test_checkpoint_for_other_settings_is_ignored(self, tmp_path):
+        input_path = self.write_input(tmp_path, 4)
+        output_path = str(tmp_path / "augmented.jsonl")
+
+        enhancer, _ = self.make_enhancer(fail_on_call=2)
+        with pytest.raises(RuntimeError):
+            enhancer.augment_dataset(input_path, output_path, augmentation_factor=1, batch_size=2)
+
+        enhancer, calls = self.make_enhancer()
+        assert enhancer.augment_dataset(input_path, output_path, augmentation_factor=1, batch_size=3) == 8
+        assert calls == ["Question 0?", "Question 3?"]
+
+    def test_interrupted_qakb_run_resumes(self, tmp_path):
+        input_path = tmp_path / "qa.json"
+        records = [{"question": f"Question {i}?", "answer": f"Answer {i}."} for i in range(5)]
+        input_path.write_text(json.dumps(records), encoding="utf-8")
+        output_path = str(tmp_path / "augmented.qakb")
+
+        enhancer, _ = self.make_enhancer(fail_on_call=2)
+        with pytest.raises(RuntimeError):
+            enhancer.augment_dataset(str(input_path), output_path, augmentation_factor=1, batch_size=2)
+        assert os.path.exists(output_path + ".rows.jsonl")
+
+        enhancer, calls = self.make_enhancer()
+        assert enhancer.augment_dataset(str(input_path), output_path, augmentation_factor=1, batch_size=2) == 10
+        # Only the unfinished batches were generated again.
+        assert calls == ["Question 2?", "Question 4?"]
+        questions = [record["question"] for record in iter_qa_records(output_path)]
+        assert questions == [q for i in range(5) for q in (f"Question {i}?", f"Question {i}? (rephrased)")]
+        assert sorted(os.listdir(tmp_path)) == ["augmented.qakb", "qa.json"]
+
+    def test_missing_partial_output_restarts(self, tmp_path):
+        input_path = tmp_path / "qa.json"
+        records = [{"question": f"Question {i}?", "answer": f"Answer {i}."} for i in range(4)]
+        input_path.write_text(json.dumps(records), encoding="utf-8")
+        output_path = str(tmp_path / "augmented.qakb")
+
+        enhancer, _ = self.make_enhancer(fail_on_call=2)
+        with pytest.raises(RuntimeError):
+            enhancer.augment_dataset(str(input_path), output_path, augmentation_factor=1, batch_size=2)
+        os.remove(output_path + ".rows.jsonl")
+
+        enhancer, calls = self.make_enhancer()
+        assert enhancer.augment_dataset(str(input_path), output_path, augmentation_factor=1, batch_size=2) == 8
+        assert calls == ["Question 0?", "Question 2?"]
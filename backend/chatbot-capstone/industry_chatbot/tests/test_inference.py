@@ -0,0 +1,788 @@
+import json
+import logging
+import os
+import time
+
+import numpy as np
+import pytest
+
+from inference.batching import MicroBatcher
+from inference.cache import AnswerCache
+from inference.generators import GeneratorProfile, load_generator_profile
+from inference import index_store
+from inference.index_store import EmbeddingIndexStore
+from inference.lexical_index import LexicalIndex
+from inference.knowledge_base import KnowledgeBase
+from inference.metrics import PipelineMetrics
+from inference.reranking import LexicalReranker, content_tokens, load_reranker
+from inference.router import QueryRouter
+
+
+def unit(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+class TestAnswerCache:
+
+    def test_exact_hit_uses_normalized_query(self):
+        cache = AnswerCache()
+        cache.put("What is the leave policy?", None, "20 days", cache.version)
+        assert cache.get_exact("  what IS the   leave policy ") == "20 days"
+        assert cache.get_exact("what is the remote work policy") is None
+
+    def test_semantic_hit_respects_threshold(self):
+        cache = AnswerCache(semantic_threshold=0.9)
+        cache.put("leave policy", unit([1.0, 0.0, 0.0]), "20 days", cache.version)
+        assert cache.get_semantic(unit([1.0, 0.1, 0.0])) == "20 days"
+        assert cache.get_semantic(unit([0.0, 1.0, 0.0])) is None
+        assert cache.stats()["semantic"]["hits"] == 1
+        assert cache.stats()["semantic"]["misses"] == 1
+
+    def test_put_with_stale_version_is_ignored(self):
+        cache = AnswerCache()
+        version = cache.version
+        cache.invalidate()
+        cache.put("leave policy", unit([1.0, 0.0]), "stale answer", version)
+        cache.put_generated(3, "leave policy", "stale response", version)
+        assert cache.get_exact("leave policy") is None
+        assert cache.get_semantic(unit([1.0, 0.0])) is None
+        assert cache.get_generated(3, "leave policy") is None
+
+        cache.put("leave policy", unit([1.0, 0.0]), "fresh answer", cache.version)
+        assert cache.get_exact("leave policy") == "fresh answer"
+
+    def test_invalidate_clears_every_tier_and_bumps_version(self):
+        cache = AnswerCache()
+        cache.put("leave policy", unit([1.0, 0.0]), "20 days", cache.version)
+        cache.put_generated(3, "leave policy", "generated", cache.version)
+        cache.invalidate()
+        assert cache.version == 1
+        assert cache.get_exact("leave policy") is None
+        assert cache.get_semantic(unit([1.0, 0.0])) is None
+        assert cache.get_generated(3, "leave policy") is None
+
+    def test_generated_responses_are_keyed_by_best_match(self):
+        cache = AnswerCache()
+        cache.put_generated(3, "Leave policy?", "generated", cache.version)
+        assert cache.get_generated(3, "leave policy") == "generated"
+        assert cache.get_generated(4, "leave policy") is None
+
+
+class TestAnswerCacheInSystem:
+
+    def test_answers_are_cached_until_reload(self, kb_path, make_qa_system):
+        system = make_qa_system(kb_path)
+        query = "Who approves remote work requests?"
+        answer = system.get_answers([query])[0]
+        assert system.answer_cache.get_exact(query) == answer
+
+        system.reload_knowledge_base()
+        assert system.answer_cache.version == 1
+        assert system.answer_cache.get_exact(query) is None
+
+
+class TestMicroBatcher:
+
+    def run_batches(self, items, **kwargs):
+        batches = []
+
+        def handler(batch):
+            batches.append(list(batch))
+            return [item * 10 for item in batch]
+
+        batcher = MicroBatcher(handler, **kwargs)
+        try:
+            futures = [batcher.submit(item) for item in items]
+            results = [future.result(timeout=5) for future in futures]
+        finally:
+            batcher.close()
+        return results, batches
+
+    def test_batches_are_capped_at_max_batch_size(self):
+        results, batches = self.run_batches(range(7), max_batch_size=3, max_wait_ms=200)
+        assert results == [i * 10 for i in range(7)]
+        assert batches == [[0, 1, 2], [3, 4, 5], [6]]
+
+    def test_batch_is_dispatched_after_max_wait(self):
+        batches = []
+        batcher = MicroBatcher(lambda batch: batches.append(list(batch)) or list(batch), max_batch_size=100, max_wait_ms=50)
+        try:
+            start = time.monotonic()
+            assert batcher(1, timeout=5) == 1
+            assert time.monotonic() - start >= 0.04
+            # Items arriving after the window closed form a new batch.
+            assert batcher(2, timeout=5) == 2
+        finally:
+            batcher.close()
+        assert batches == [[1], [2]]
+
+    def test_handler_error_is_raised_for_every_item(self):
+        def handler(batch):
+            raise ValueError("encoder failed")
+
+        batcher = MicroBatcher(handler, max_batch_size=3, max_wait_ms=200)
+        try:
+            futures = [batcher.submit(item) for item in range(3)]
+            for future in futures:
+                with pytest.raises(ValueError, match="encoder failed"):
+                    future.result(timeout=5)
+            # The worker survives a failed batch.
+            batcher.handler = lambda batch: batch
+            assert batcher(4, timeout=5) == 4
+        finally:
+            batcher.close()
+
+    def test_result_count_mismatch_is_an_error(self):
+        batcher = MicroBatcher(lambda batch: batch[:1], max_batch_size=2, max_wait_ms=200)
+        try:
+            futures = [batcher.submit(item) for item in range(2)]
+            for future in futures:
+                with pytest.raises(RuntimeError, match="1 results for 2 items"):
+                    future.result(timeout=5)
+        finally:
+            batcher.close()
+
+    def test_closed_batcher_rejects_items(self):
+        batcher = MicroBatcher(lambda batch: batch)
+        batcher.close()
+        with pytest.raises(RuntimeError):
+            batcher.submit(1)
+        with pytest.raises(ValueError):
+            MicroBatcher(lambda batch: batch, max_batch_size=0)
+
+
+class TestBatchedAnswers:
+
+    QUERIES = [
+        "thanks",
+        "Who approves remote work requests?",
+        "How often must passwords be changed?",
+        "Describe the colour of the office walls",
+        "Who approves remote work requests?",
+        "employees paid leave days",
+    ]
+
+    def test_get_answers_matches_get_answer(self, kb_path, make_qa_system, monkeypatch):
+        # Always pick the first template so both runs format answers the same way.
+        monkeypatch.setattr(np.random, "choice", lambda options: options[0])
+        batched = make_qa_system(kb_path, use_answer_cache=False).get_answers(self.QUERIES)
+        system = make_qa_system(kb_path, use_answer_cache=False)
+        assert batched == [system.get_answer(query) for query in self.QUERIES]
+
+    def test_answer_fast_skips_queries_that_need_the_encoder(self, kb_path, make_qa_system, monkeypatch):
+        system = make_qa_system(kb_path, hybrid_retrieval=True)
+
+        def no_encoder(queries):
+            raise AssertionError("answer_fast must not run the encoder")
+
+        monkeypatch.setattr(system, "_encode_queries", no_encoder)
+        assert system.answer_fast("thank you") is not None
+        assert "line manager" in system.answer_fast("Who approves remote work requests?")
+        assert system.answer_fast("Describe the colour of the office walls") is None
+
+        monkeypatch.undo()
+        answer = system.get_answers(["Describe the colour of the office walls"])[0]
+        # Answered through retrieval or generation, and cached for the fast path.
+        assert system.answer_fast("Describe the colour of the office walls") == answer
+
+
+class TestKnowledgeBase:
+
+    def test_answers_and_metadata_are_interned(self, qa_records):
+        kb = KnowledgeBase.from_records(qa_records)
+        assert kb.num_rows == len(qa_records)
+        assert len(kb.answers) == len(qa_records) - 1
+        assert kb.answer_ids[1] == kb.answer_ids[2]
+        assert kb.answer_for(2) == qa_records[2]["answer"]
+        assert kb.metadata[1] is kb.metadata[2]
+        assert kb.metadata[1] is not kb.metadata[3]
+
+    def test_extra_metadata_fields_survive_export(self):
+        records = [
+            {"question": "q1", "answer": "a", "metadata": {"section": "Leave", "tags": ["pto"], "complexity": "basic"}},
+            {"question": "q2", "answer": "a", "metadata": {"section": "Leave", "tags": ["pto"], "complexity": "basic"}},
+            {"question": "q3", "answer": "a", "metadata": {"section": "Leave", "tags": ["pto"], "complexity": "detailed"}},
+        ]
+        kb = KnowledgeBase.from_records(records)
+        assert kb.metadata[0] is kb.metadata[1]
+        assert kb.metadata[0] is not kb.metadata[2]
+        assert kb.metadata[0].section == "Leave"
+        assert kb.metadata[0].extra == {"tags": ["pto"], "complexity": "basic"}
+        exported = kb.to_records()
+        assert exported[2]["metadata"] == {"section": "Leave", "source": "", "tags": ["pto"], "complexity": "detailed"}
+
+        kb.append("q4", "b", {"section": "Leave", "tags": ["pto"], "complexity": "basic"})
+        assert kb.metadata[3] is kb.metadata[0]
+
+    def test_remove_tombstones_the_row(self, qa_records):
+        kb = KnowledgeBase.from_records(qa_records)
+        kb.remove(3)
+        assert not kb.is_live(3)
+        assert kb.answer_ids[3] == -1
+        assert kb.questions[3] is None
+        assert kb.num_rows == len(qa_records)
+        assert len(kb) == len(qa_records) - 1
+        assert 3 not in kb.live_ids()
+        assert all(record["question"] != qa_records[3]["question"] for record in kb.to_records())
+        with pytest.raises(KeyError):
+            kb.remove(3)
+        with pytest.raises(KeyError):
+            kb.replace(3, answer="anything")
+
+    def test_append_and_replace_reuse_answers(self, qa_records):
+        kb = KnowledgeBase.from_records(qa_records)
+        entry_id = kb.append("Is leave paid?", qa_records[1]["answer"], {"section": "Leave", "source": "HR Policy"})
+        assert entry_id == len(qa_records)
+        assert kb.answer_ids[entry_id] == kb.answer_ids[1]
+        assert kb.metadata[entry_id] is kb.metadata[1]
+
+        kb.replace(entry_id, answer="Leave is paid.")
+        assert kb.answer_for(entry_id) == "Leave is paid."
+        assert len(kb.answers) == len(qa_records)
+
+    def test_copy_is_independent(self, qa_records):
+        kb = KnowledgeBase.from_records(qa_records)
+        clone = kb.copy()
+        clone.remove(1)
+        clone.append("new question", "new answer")
+        assert kb.is_live(1)
+        assert kb.num_rows == len(qa_records)
+
+
+TOPICS = ["leave", "travel", "laptop", "password", "badge", "expense", "training", "parking",
+          "overtime", "holiday", "remote", "privacy", "backup", "vendor", "safety", "insurance"]
+
+
+@pytest.fixture
+def large_kb_path(tmp_path, qa_records):
+    # Enough rows for IVF and PQ training (build_faiss_index clamps nlist to n // 39).
+    records = list(qa_records)
+    for i in range(120):
+        topic, other = TOPICS[i % len(TOPICS)], TOPICS[(i * 7 + 3) % len(TOPICS)]
+        records.append({
+            "question": f"What does rule {i} say about {topic} and {other}?",
+            "answer": f"Rule {i} covers {topic} together with {other}.",
+            "metadata": {"section": topic.title(), "source": "Handbook"}
+        })
+    path = tmp_path / "large_qa_pairs.json"
+    path.write_text(json.dumps(records), encoding="utf-8")
+    return str(path)
+
+
+def indexed_ids(system):
+    index = system.index
+    _, ids = index.search(system.question_embeddings[:1], index.ntotal)
+    return set(ids[0].tolist()) - {-1}
+
+
+class TestIncrementalUpdates:
+
+    @pytest.fixture(params=["flat", "ivf", "hnsw", "pq", "ivfpq"])
+    def cached_system(self, request, large_kb_path, make_qa_system, caplog):
+        options = {"index_type": request.param, "index_params": {"m": 8, "ef_search": 512}}
+        make_qa_system(large_kb_path, **options)
+        with caplog.at_level(logging.INFO):
+            system = make_qa_system(large_kb_path, **options)
+        assert "Loaded cached embedding index" in caplog.text
+        return system
+
+    def test_add_entries_after_cache_load(self, cached_system):
+        before = cached_system.index
+        count = before.ntotal
+        ids = cached_system.add_entries([
+            {"question": "Can interns claim mileage?", "answer": "Interns can claim mileage.",
+             "metadata": {"section": "Travel", "source": "Handbook"}}
+        ])
+        assert cached_system.index is not before
+        assert before.ntotal == count
+        assert cached_system.index.ntotal == count + 1
+        assert set(ids) <= indexed_ids(cached_system)
+        assert cached_system.kb.answer_for(ids[0]) == "Interns can claim mileage."
+
+    def test_update_entry_after_cache_load(self, cached_system):
+        before = cached_system.index
+        count = before.ntotal
+        cached_system.update_entry(3, question="Who signs off on working from home?", answer="The line manager.")
+        assert before.ntotal == count
+        assert cached_system.index.ntotal == count
+        assert 3 in indexed_ids(cached_system)
+        assert cached_system.kb.questions[3] == "Who signs off on working from home?"
+        expected = cached_system._encode_questions(["Who signs off on working from home?"])[0]
+        np.testing.assert_allclose(cached_system.question_embeddings[3], expected, rtol=1e-5, atol=1e-6)
+
+    def test_remove_entries_after_cache_load(self, cached_system):
+        before = cached_system.index
+        count = before.ntotal
+        cached_system.remove_entries([3, 4])
+        assert before.ntotal == count
+        assert cached_system.index.ntotal == count - 2
+        assert not {3, 4} & indexed_ids(cached_system)
+        assert len(cached_system.kb) == count - 2
+
+    def test_updates_bump_version_and_invalidate_answers(self, cached_system):
+        version = cached_system.kb_version
+        query = "Who approves remote work requests?"
+        cached_system.get_answers([query])
+        cached_system.remove_entries([3])
+        assert cached_system.kb_version == version + 1
+        assert cached_system.answer_cache.get_exact(query) is None
+
+
+class TestReload:
+
+    def test_reload_picks_up_new_file_and_reuses_cache(self, kb_path, qa_records, tmp_path, make_qa_system, caplog):
+        system = make_qa_system(kb_path)
+        version = system.kb_version
+
+        records = qa_records + [{"question": "Is parking free?", "answer": "Parking is free for staff."}]
+        new_path = tmp_path / "updated_qa_pairs.json"
+        new_path.write_text(json.dumps(records), encoding="utf-8")
+        assert system.reload_knowledge_base(str(new_path)) == version + 1
+        assert len(system.kb) == len(records)
+        assert system.index.ntotal == len(records)
+        assert system.data_path == str(new_path)
+
+        with caplog.at_level(logging.INFO):
+            reloaded = make_qa_system(str(new_path))
+        assert "Loaded cached embedding index" in caplog.text
+        assert reloaded.index.ntotal == len(records)
+
+
+class TestTraceHook:
+
+    def test_failing_hook_is_logged_once_and_counted(self, kb_path, make_qa_system, caplog):
+        def hook(record):
+            raise OSError("disk full")
+
+        system = make_qa_system(kb_path, metrics=PipelineMetrics(trace_hook=hook))
+        with caplog.at_level(logging.ERROR, logger="inference.metrics"):
+            answers = system.get_answers(["hi", "Who approves remote work requests?"])
+            assert all(answers)
+            system.get_answers(["hi"])
+        assert system.metrics.trace_hook_failures == 2
+        assert len([r for r in caplog.records if r.name == "inference.metrics"]) == 1
+        assert "qa_trace_hook_failures 2" in system.render_metrics()
+
+
+class PreferAnswer:
+    """
+    Reranker that scores only candidates with the given answer.
+    """
+
+    def __init__(self, answer, score):
+        self.answer = answer
+        self.value = score
+
+    def score(self, query, questions, answers):
+        return np.array([self.value if answer == self.answer else 0.0 for answer in answers], dtype=np.float32)
+
+
+class TestReranking:
+
+    def test_content_tokens_drop_stopwords(self):
+        assert content_tokens("What is the Leave policy for 2024?") == ["leave", "policy", "2024"]
+
+    def test_lexical_reranker_weights_answer_terms(self):
+        scores = LexicalReranker(answer_weight=0.5).score(
+            "remote work approval",
+            ["Who handles remote work approval?", "Who approves remote work?", "Parking rules"],
+            ["The manager.", "Approval comes from the manager.", "Remote staff park free."]
+        )
+        np.testing.assert_allclose(scores, [1.0, 2.5 / 3, 0.5 / 3], rtol=1e-6)
+        assert not LexicalReranker().score("what is the", ["anything"], ["anything"]).any()
+
+    def test_load_reranker(self):
+        assert load_reranker(None) is None
+        assert isinstance(load_reranker("lexical"), LexicalReranker)
+        custom = LexicalReranker(answer_weight=0.2)
+        assert load_reranker(custom) is custom
+        with pytest.raises(ValueError):
+            load_reranker("bm25")
+
+    def test_confident_rerank_answers_from_the_knowledge_base(self, kb_path, qa_records, make_qa_system):
+        target = qa_records[4]["answer"]
+        options = {"top_k": 10, "hybrid_retrieval": False, "use_answer_cache": False}
+        query = "Describe the colour of the office walls"
+
+        system = make_qa_system(kb_path, reranker=PreferAnswer(target, 0.9), **options)
+        answered = system.get_answers([query])[0]
+        assert target.rstrip(".") in answered
+        assert 'qa_answers_total{path="retrieval"} 1' in system.render_metrics()
+
+        # Below rerank_threshold (and with low similarity) the query falls back to generation.
+        system = make_qa_system(kb_path, reranker=PreferAnswer(target, 0.5), **options)
+        system.get_answers([query])
+        assert 'qa_answers_total{path="generation"} 1' in system.render_metrics()
+
+    def test_rerank_reorders_distinct_candidates(self, kb_path, qa_records, make_qa_system):
+        target = qa_records[5]["answer"]
+        system = make_qa_system(kb_path, reranker=PreferAnswer(target, 0.9), top_k=10, hybrid_retrieval=False)
+        query = "How many days of paid leave do employees get?"
+        embedding = system._encode_queries([query])[0]
+        distances, indices = system.index.search(embedding[None, :], 10)
+        candidates = system._rank_candidates(
+            system._state, query, embedding, indices[0], distances[0], None, system.metrics.trace()
+        )
+        assert system.kb.answer_for(candidates[0][0]) == target
+        assert candidates[0][3] == pytest.approx(0.9)
+        answers = [system.kb.answer_for(c[0]) for c in candidates]
+        assert len(answers) == len(set(answers))
+
+
+SHIPPED_KB = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "knowledge_base", "cleaned_augmented_qa_pairs.json"
+)
+
+
+class TestLexicalMatch:
+
+    @pytest.fixture
+    def paraphrase_kb_path(self, tmp_path):
+        retention = "Records are kept for seven years."
+        records = [
+            {"question": "What is the data retention policy?", "answer": retention},
+            {"question": "Explain the data retention policy", "answer": retention},
+            {"question": "Summarize the data retention policy", "answer": retention},
+            {"question": "Who owns the data retention policy schedule?", "answer": "The compliance office."},
+            {"question": "How are laptops repaired?", "answer": "IT repairs laptops."},
+        ]
+        path = tmp_path / "paraphrases.json"
+        path.write_text(json.dumps(records), encoding="utf-8")
+        return str(path)
+
+    def test_runner_up_is_taken_beyond_top_k(self, paraphrase_kb_path, make_qa_system):
+        system = make_qa_system(paraphrase_kb_path, top_k=2, use_answer_cache=False)
+        terms = content_tokens("data retention policy")
+        scores, coverage = system._state.lexical.score(terms)
+        top = LexicalIndex.top(scores, 2)
+        # The top-k holds only paraphrases of one answer; a different answer scores close behind.
+        assert len(set(system.kb.answer_ids[top].tolist())) == 1
+        assert scores[3] * system.lexical_margin > scores[top[0]]
+        assert system._lexical_match(system.kb, terms, scores, coverage) == -1
+        assert system.answer_fast("data retention policy") is None
+
+    def test_clear_match_still_answers_without_encoder(self, paraphrase_kb_path, make_qa_system):
+        system = make_qa_system(paraphrase_kb_path, top_k=2, use_answer_cache=False)
+        assert "IT repairs laptops" in system.answer_fast("How are laptops repaired?")
+
+    @pytest.mark.skipif(not os.path.exists(SHIPPED_KB), reason="shipped knowledge base not present")
+    def test_data_policy_is_not_answered_with_purpose_section(self, make_qa_system):
+        system = make_qa_system(SHIPPED_KB, use_answer_cache=False)
+        answer = system.answer_fast("What is the data policy?")
+        assert answer is None or "I. Purpose" not in answer
+
+
+class TestFusedConfidence:
+
+    def test_confidence_is_normalized_similarity_and_coverage(self, kb_path, qa_records, make_qa_system):
+        system = make_qa_system(kb_path)
+        query = qa_records[3]["question"]
+        embedding = system._encode_queries([query])[0]
+        distances, indices = system.index.search(embedding[None, :], system.top_k)
+        lexical = system._state.lexical.score(content_tokens(query))
+        candidates = system._rank_candidates(
+            system._state, query, embedding, indices[0], distances[0], lexical, system.metrics.trace()
+        )
+        weight = system.lexical_weight
+        for entry_id, similarity, confidence, _ in candidates:
+            assert confidence == pytest.approx((similarity + weight * lexical[1][entry_id]) / (1 + weight))
+            assert confidence <= 1.0 + 1e-6
+        # The exact question covers every query term and is still the most confident candidate.
+        assert candidates[0][2] == pytest.approx(1.0, abs=1e-5)
+
+    @pytest.mark.parametrize("hybrid_retrieval", [True, False])
+    def test_threshold_above_one_always_generates(self, kb_path, qa_records, make_qa_system, monkeypatch, hybrid_retrieval):
+        # lexical_min_terms disables the exact-term shortcut, which answers before any threshold.
+        system = make_qa_system(kb_path, use_answer_cache=False, hybrid_retrieval=hybrid_retrieval, lexical_min_terms=100)
+        generated = []
+        generate = system._generate_responses
+
+        def spy(queries, contexts, trace=None):
+            generated.extend(queries)
+            return generate(queries, contexts, trace)
+
+        monkeypatch.setattr(system, "_generate_responses", spy)
+        queries = [record["question"] for record in qa_records if record["question"] != "hi"]
+        system.get_answers(queries, confidence_threshold=1.01)
+        assert sorted(generated) == sorted(queries)
+        assert system.get_answer(queries[0], confidence_threshold=1.01) is not None
+        assert generated[-1] == queries[0]
+
+
+class TestPromptPrefixCacheParity:
+    """
+    Greedy generation must not change when the prompt heads come from the prefix cache.
+    """
+
+    # Queries of different lengths, so the batch is left-padded by different amounts.
+    QUERIES = [
+        "leave",
+        "Who approves remote work requests for employees?",
+        "How often must passwords be changed and who owns the data retention schedule?",
+    ]
+
+    @pytest.fixture
+    def systems(self, tiny_models, tmp_path):
+        """
+        Two systems on the same tiny generator, with and without the prefix cache, decoding greedily.
+        """
+        from inference.inference import PolicyQASystem
+        data_path, encoder, generator = tiny_models
+        options = {
+            "index_cache_dir": str(tmp_path / "index_cache"), "use_answer_cache": False, "lazy_generator": False,
+            "sampling": {"max_new_tokens": 12, "do_sample": False}, "device": "cpu"
+        }
+        cached = PolicyQASystem(data_path, encoder, generator, prefix_cache=True, **options)
+        uncached = PolicyQASystem(data_path, encoder, generator, prefix_cache=False, **options)
+        assert cached._prefix_cache is not None and uncached._prefix_cache is None
+        return cached, uncached
+
+    def contexts(self, system):
+        # A single-answer context, a packed two-answer context and a packed context reusing its first answer.
+        kb = system.kb
+        return [
+            system._pack_contexts(kb, [1]),
+            system._pack_contexts(kb, [3, 4]),
+            system._pack_contexts(kb, [1, 5]),
+        ]
+
+    def test_batched_generation_matches_uncached(self, systems):
+        from inference.inference import GENERATION_ERROR_MESSAGE
+        cached, uncached = systems
+        contexts = self.contexts(cached)
+        expected = uncached.generate(self.QUERIES, contexts)
+        assert GENERATION_ERROR_MESSAGE not in expected
+        cache = cached._prefix_cache
+
+        # Cold: only the instruction preamble is cached.
+        assert cached.generate(self.QUERIES, contexts) == expected
+        cold_reused = cache.reused_tokens
+        # Warm: the contexts stored by the first generation are reused.
+        assert cached.generate(self.QUERIES, contexts) == expected
+        assert cache.reused_tokens - cold_reused > cold_reused
+        # Rows with different cached coverage in one batch.
+        mixed_queries = self.QUERIES + ["Who owns backups?"]
+        mixed_contexts = contexts + [cached._pack_contexts(cached.kb, [2])]
+        assert cached.generate(mixed_queries, mixed_contexts) == uncached.generate(mixed_queries, mixed_contexts)
+
+    def test_warmed_cache_matches_uncached(self, systems):
+        cached, uncached = systems
+        contexts = self.contexts(cached)
+        assert cached.warm_prefix_cache() > 0
+        assert cached.generate(self.QUERIES, contexts) == uncached.generate(self.QUERIES, contexts)
+
+    def test_streaming_matches_uncached(self, systems):
+        from inference.inference import GENERATION_ERROR_MESSAGE
+        cached, uncached = systems
+        for query, context in zip(self.QUERIES, self.contexts(cached)):
+            expected = "".join(uncached._stream_response(query, context))
+            assert expected and expected != GENERATION_ERROR_MESSAGE
+            before = cached._prefix_cache.reused_tokens
+            # Cold, then warm with the context stored by the first stream.
+            assert "".join(cached._stream_response(query, context)) == expected
+            cold = cached._prefix_cache.reused_tokens - before
+            assert "".join(cached._stream_response(query, context)) == expected
+            assert cached._prefix_cache.reused_tokens - before > 2 * cold
+
+
+def format_before_router(templates, answer, query, pick):
+    """
+    PolicyQASystem._format_policy_answer as it was before the query router (non-greeting queries),
+    with ``pick`` choosing the template.
+    """
+    try:
+        answer = answer.strip().rstrip('.')
+        query_lower = query.lower()
+        policy_type = 'default'
+        if 'customer satisfaction' in query_lower:
+            policy_type = 'customer_satisfaction'
+        elif 'it' in query_lower or 'technology' in query_lower:
+            policy_type = 'it_policy'
+        template = pick(templates.get(policy_type, templates['default']))
+        if 'and' in answer:
+            parts = [part.strip() for part in answer.split('and')]
+            return template.format(*parts)
+        return template.format(answer)
+    except Exception:
+        return answer
+
+
+class TestQueryRouter:
+
+    @pytest.fixture
+    def router(self, kb_path, make_qa_system):
+        return make_qa_system(kb_path).router
+
+    @pytest.mark.parametrize("query, intent", [
+        ("hi", "greeting"),
+        ("Hello there!", "greeting"),
+        ("  HEY ", "greeting"),
+        ("thanks", "thanks"),
+        ("Thank you so much for your help.", "thanks"),
+        ("cheers", "thanks"),
+        ("help", "help"),
+        ("What can you do?", "help"),
+        ("who are you", "help"),
+        ("What is the leave policy?", None),
+        ("hi, what is the IT policy?", None),
+        ("help desk opening hours", None),
+        ("Thanks to whom are remote work requests approved?", None),
+        ("Who approves hardware requests?", None),
+    ])
+    def test_match_intent(self, router, query, intent):
+        assert router.match_intent(query) == intent
+
+    def test_small_talk_is_answered_from_fixed_responses(self, router):
+        assert router.respond("greeting") in router.templates["greeting"]
+        assert router.respond("thanks") in router.intent_responses["thanks"]
+
+    def test_duplicate_queries_are_encoded_once(self):
+        router = QueryRouter({"greeting": [], "default": ["{}"]}, embedding_cache_size=2)
+        batches = []
+
+        def encoder(queries):
+            batches.append(list(queries))
+            return np.stack([unit([len(query), 1.0]) for query in queries])
+
+        first = router.encode(["Leave policy?", "leave   policy", "Remote work"], encoder)
+        assert batches == [["Leave policy?", "Remote work"]]
+        np.testing.assert_array_equal(first[0], first[1])
+        second = router.encode(["LEAVE POLICY", "Remote work!"], encoder)
+        assert len(batches) == 1
+        np.testing.assert_array_equal(second, first[[0, 2]])
+        # Least recently used entries are evicted beyond the cache size.
+        router.encode(["Passwords"], encoder)
+        router.encode(["Leave policy", "Remote work"], encoder)
+        assert batches[-1] == ["Leave policy"]
+        assert router.stats()["embedding_cache_hits"] == 3
+
+    def test_repeated_query_skips_the_encoder(self, kb_path, make_qa_system, monkeypatch):
+        system = make_qa_system(kb_path, use_answer_cache=False, hybrid_retrieval=False)
+        encoded = []
+        encode = system._encode_queries
+
+        def spy(queries):
+            encoded.extend(queries)
+            return encode(queries)
+
+        monkeypatch.setattr(system, "_encode_queries", spy)
+        first = system.get_answers(["Who approves remote work requests?", "who approves remote work requests"])
+        second = system.get_answers(["Who approves remote work requests?"])
+        assert encoded == ["Who approves remote work requests?"]
+        assert "line manager" in first[0] and "line manager" in first[1] and "line manager" in second[0]
+
+    @pytest.mark.parametrize("query", [
+        "What is the leave policy?",
+        "Explain our customer satisfaction policy",
+        "Which technology rules apply?",
+        "Who edits the schedule?",
+    ])
+    def test_precomputed_answers_match_previous_formatting(self, router, qa_records, monkeypatch, query):
+        answers = [record["answer"] for record in qa_records] + [
+            "Laptops are serviced yearly and replaced every four years.",
+            "Backups run nightly and are tested monthly and kept offsite.",
+            "  Trailing spaces and dots...  ",
+            "No placeholders needed",
+        ]
+        router.precompute(answers)
+        for index in range(3):
+            pick = lambda options: options[index]
+            monkeypatch.setattr(np.random, "choice", pick)
+            for answer in answers:
+                assert router.format_answer(answer, query) == format_before_router(router.templates, answer, query, pick)
+
+    def test_precompute_drops_answers_no_longer_in_the_knowledge_base(self, router):
+        router.precompute(["First answer.", "Second answer."])
+        formatted = router._formatted["First answer."]
+        router.precompute(["First answer."])
+        assert router.stats()["formatted_answers"] == 1
+        assert router._formatted["First answer."] is formatted
+        # Answers added since the last precompute are formatted on first use.
+        assert router.format_answer("New answer.", "leave") in ["According to our organizational policy, New answer",
+                                                                 "Our structured guidelines specify that New answer",
+                                                                 "We adhere to the principle that New answer"]
+        assert router.stats()["formatted_answers"] == 2
+
+
+class TestGeneratorProfiles:
+
+    def test_profile_must_implement_build_prompt(self):
+        class Incomplete(GeneratorProfile):
+            name = "incomplete"
+
+        with pytest.raises(TypeError):
+            Incomplete()
+
+    @pytest.mark.parametrize("name", ["policy", "fine-tuned"])
+    def test_builtin_profiles_build_prompts(self, name):
+        profile = load_generator_profile(name)
+        assert "leave policy" in profile.build_prompt("What is the leave policy?", "Employees get 20 days.")
+
+
+class TestEmbeddingIndexStore:
+
+    @pytest.fixture
+    def store(self, tmp_path):
+        return EmbeddingIndexStore(str(tmp_path / "index_cache"))
+
+    @pytest.fixture
+    def entry(self):
+        from inference.inference import build_faiss_index
+        rng = np.random.default_rng(0)
+        embeddings = rng.normal(size=(20, 8)).astype(np.float32)
+        embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+        return embeddings, build_faiss_index(embeddings, ids=np.arange(20))
+
+    @pytest.mark.parametrize("mmap", [True, False])
+    def test_save_and_load(self, store, entry, kb_path, mmap):
+        embeddings, index = entry
+        key = EmbeddingIndexStore.compute_key(kb_path, "model")
+        assert store.load(key) is None
+        store.save(key, embeddings, index, "model")
+        loaded_embeddings, loaded_index = store.load(key, mmap=mmap)
+        np.testing.assert_array_equal(loaded_embeddings, embeddings)
+        np.testing.assert_array_equal(loaded_index.search(embeddings[:3], 5)[1], index.search(embeddings[:3], 5)[1])
+
+    def test_key_changes_with_data_model_backend_and_params(self, kb_path, tmp_path):
+        key = EmbeddingIndexStore.compute_key(kb_path, "model", "torch", "flat", "{}")
+        assert key == EmbeddingIndexStore.compute_key(kb_path, "model", "torch", "flat", "{}")
+        assert key != EmbeddingIndexStore.compute_key(kb_path, "other-model", "torch", "flat", "{}")
+        assert key != EmbeddingIndexStore.compute_key(kb_path, "model", "onnx", "flat", "{}")
+        assert key != EmbeddingIndexStore.compute_key(kb_path, "model", "torch", "ivf", "{}")
+        assert key != EmbeddingIndexStore.compute_key(kb_path, "model", "torch", "flat", '{"nlist": 10}')
+        with open(kb_path, "a", encoding="utf-8") as f:
+            f.write(" ")
+        assert key != EmbeddingIndexStore.compute_key(kb_path, "model", "torch", "flat", "{}")
+
+    def test_key_changes_with_store_version(self, kb_path, monkeypatch):
+        key = EmbeddingIndexStore.compute_key(kb_path, "model")
+        monkeypatch.setattr(index_store, "INDEX_STORE_VERSION", index_store.INDEX_STORE_VERSION + 1)
+        assert key != EmbeddingIndexStore.compute_key(kb_path, "model")
+
+    def test_entry_from_another_store_version_is_rejected(self, store, entry, kb_path):
+        key = EmbeddingIndexStore.compute_key(kb_path, "model")
+        store.save(key, *entry)
+        meta_path = os.path.join(store.cache_dir, key, EmbeddingIndexStore.META_FILE)
+        with open(meta_path, encoding="utf-8") as f:
+            meta = json.load(f)
+        meta["version"] = index_store.INDEX_STORE_VERSION - 1
+        with open(meta_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        assert store.load(key) is None
+
+    def test_unreadable_entry_is_discarded(self, store, entry, kb_path):
+        key = EmbeddingIndexStore.compute_key(kb_path, "model")
+        store.save(key, *entry)
+        with open(os.path.join(store.cache_dir, key, EmbeddingIndexStore.INDEX_FILE), "wb") as f:
+            f.write(b"not an index")
+        assert store.load(key) is None
+
+    def test_system_rebuilds_when_data_changes(self, kb_path, qa_records, make_qa_system, caplog):
+        make_qa_system(kb_path)
+        with open(kb_path, "w", encoding="utf-8") as f:
+            json.dump(qa_records[:-1], f)
+        with caplog.at_level(logging.INFO):
+            system = make_qa_system(kb_path)
+        assert "Loaded cached embedding index" not in caplog.text
+        assert system.index.ntotal == len(qa_records) - 1
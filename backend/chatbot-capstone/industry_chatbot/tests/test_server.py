@@ -0,0 +1,243 @@
+import asyncio
+import json
+import threading
+import time
+
+import pytest
+
+
+def sse_events(body):
+    """
+    Split a Server-Sent-Events body into (event, data) pairs.
+    """
+    assert body.endswith("\n\n")
+    events = []
+    for block in body[:-2].split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.split("\n"))
+        events.append((fields.get("event", "message"), json.loads(fields["data"])))
+    return events
+
+
+@pytest.fixture
+def flask_app(qa_service, kb_path, make_qa_system, monkeypatch):
+    """
+    The Flask app serving a fresh fake-backend system (the generator is loaded lazily).
+    """
+    pytest.importorskip("flask")
+    pytest.importorskip("flask_cors")
+    import App
+    system = make_qa_system(kb_path)
+    monkeypatch.setattr(App, "qa_system", system)
+    return App.app.test_client(), system
+
+
+class TestStreaming:
+
+    def test_knowledge_base_answer_is_one_chunk_then_done(self, flask_app):
+        client, _ = flask_app
+        response = client.post("/api/ask/stream", json={"query": "Who approves remote work requests?"})
+        assert response.status_code == 200
+        assert response.mimetype == "text/event-stream"
+        assert response.headers["Cache-Control"] == "no-cache"
+        events = sse_events(response.get_data(as_text=True))
+        assert len(events) == 2
+        assert events[0][0] == "message" and "line manager" in events[0][1]["token"]
+        assert events[1] == ("done", {})
+
+    def test_generated_answer_streams_tokens(self, flask_app):
+        client, system = flask_app
+        query = "Describe the colour of the office walls"
+        response = client.get("/api/ask/stream", query_string={"query": query})
+        events = sse_events(response.get_data(as_text=True))
+        assert events[-1] == ("done", {})
+        tokens = [data["token"] for event, data in events[:-1]]
+        assert all(event == "message" for event, _ in events[:-1])
+        assert len(tokens) > 1
+        assert 'qa_answers_total{path="generation"} 1' in system.render_metrics()
+        # The streamed text is what a non-streaming request answers (now from the cache).
+        assert system.get_answers([query])[0] == "".join(tokens).strip()
+
+    def test_failure_mid_stream_ends_with_error_event(self, flask_app, monkeypatch):
+        client, system = flask_app
+
+        def failing_stream(query):
+            yield "Partial"
+            raise RuntimeError("generator crashed")
+
+        monkeypatch.setattr(system, "stream_answer", failing_stream)
+        response = client.post("/api/ask/stream", json={"query": "anything"})
+        assert response.status_code == 200
+        events = sse_events(response.get_data(as_text=True))
+        assert events == [("message", {"token": "Partial"}), ("error", {"error": "Failed to answer the query"})]
+
+    def test_missing_query_is_rejected(self, flask_app):
+        client, _ = flask_app
+        assert client.post("/api/ask/stream", json={}).status_code == 400
+        assert client.get("/api/ask/stream").status_code == 400
+
+
+class TestReadiness:
+
+    def test_generator_readiness_follows_lazy_loading(self, flask_app):
+        client, system = flask_app
+        response = client.get("/api/ready")
+        assert response.status_code == 200
+        status = response.get_json()
+        assert status["ready"] and status["retrieval_model"] and status["index"]
+        assert not status["generator"] and not status["generator_loading"]
+        assert status["knowledge_base_entries"] == len(system.kb)
+
+        response = client.get("/api/ready", query_string={"require": "generator"})
+        assert response.status_code == 503
+        assert response.get_json()["ready"] is False
+
+        # A low-confidence query loads the generator on first use.
+        system.get_answers(["Describe the colour of the office walls"])
+        response = client.get("/api/ready", query_string={"require": "generator"})
+        assert response.status_code == 200
+        status = response.get_json()
+        assert status["ready"] and status["generator"]
+        assert status["generator_device"] is not None
+
+    def test_eager_generator_is_ready_at_startup(self, flask_app, kb_path, make_qa_system, monkeypatch):
+        import App
+        client, _ = flask_app
+        monkeypatch.setattr(App, "qa_system", make_qa_system(kb_path, lazy_generator=False))
+        assert client.get("/api/ready", query_string={"require": "generator"}).status_code == 200
+
+
+def asgi_request(app, method, path, body=None, query_string=b""):
+    """
+    Call an ASGI app once and return the response status and body.
+    """
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": json.dumps(body).encode() if body is not None else b"", "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {"type": "http", "method": method, "path": path, "query_string": query_string}
+    asyncio.run(app(scope, receive, send))
+    return messages[0]["status"], b"".join(message.get("body", b"") for message in messages[1:]).decode()
+
+
+class BlockingSystem:
+    """
+    Stand-in for PolicyQASystem whose calls block until ``release`` is set.
+    """
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.calls = 0
+
+    def get_answer(self, query):
+        self.calls += 1
+        self.release.wait(5)
+        return f"answer to {query}"
+
+    def stream_answer(self, query):
+        yield "first"
+        self.release.wait(5)
+        yield "second"
+
+
+def wait_until_idle(pool):
+    deadline = time.monotonic() + 5
+    while pool.pending and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert pool.pending == 0
+
+
+class TestInferencePool:
+
+    @pytest.fixture
+    def server(self, qa_service, monkeypatch):
+        """
+        The ASGI app with a blocking system and a one-worker pool; returns (asgi_app, system).
+        """
+        import asgi_app
+        system = BlockingSystem()
+        monkeypatch.setattr(asgi_app, "qa_system", system)
+        monkeypatch.setattr(asgi_app, "pool", asgi_app.InferencePool(max_workers=1, max_pending=1, timeout=5))
+        yield asgi_app, system
+        system.release.set()
+        asgi_app.pool.shutdown()
+
+    def test_full_pool_rejects_with_503(self, server):
+        asgi_app, system = server
+        held = asgi_app.pool.submit(system.get_answer, "slow")
+        status, body = asgi_request(asgi_app.app, "POST", "/api/ask", {"query": "leave policy"})
+        assert status == 503
+        assert json.loads(body) == {"error": "Server is busy, please retry shortly"}
+        assert asgi_request(asgi_app.app, "GET", "/api/ask/stream", query_string=b"query=leave")[0] == 503
+        assert asgi_app.pool.stats()["rejected"] == 2
+
+        system.release.set()
+        assert held.result(timeout=5) == "answer to slow"
+        wait_until_idle(asgi_app.pool)
+        status, body = asgi_request(asgi_app.app, "POST", "/api/ask", {"query": "leave policy"})
+        assert status == 200
+        assert json.loads(body) == {"question": "leave policy", "answer": "answer to leave policy"}
+
+    def test_deadline_returns_504_and_keeps_the_slot_until_the_call_ends(self, server):
+        asgi_app, system = server
+        asgi_app.pool.timeout = 0.05
+        status, body = asgi_request(asgi_app.app, "POST", "/api/ask", {"query": "leave policy"})
+        assert status == 504
+        assert json.loads(body) == {"error": "Timed out while answering the query"}
+        stats = asgi_app.pool.stats()
+        assert stats["timed_out"] == 1
+        # The abandoned call is still running and still counts against max_pending.
+        assert stats["pending"] == 1
+        assert asgi_request(asgi_app.app, "POST", "/api/ask", {"query": "again"})[0] == 503
+
+        system.release.set()
+        wait_until_idle(asgi_app.pool)
+        assert system.calls == 1
+
+    def test_queued_call_is_dropped_on_timeout(self, server):
+        asgi_app, system = server
+        asgi_app.pool.max_pending = 2
+        asgi_app.pool.timeout = 0.05
+        asgi_app.pool.submit(system.get_answer, "slow")
+        assert asgi_request(asgi_app.app, "POST", "/api/ask", {"query": "queued"})[0] == 504
+        system.release.set()
+        wait_until_idle(asgi_app.pool)
+        # Only the call that was already running reached the system.
+        assert system.calls == 1
+
+    def test_stream_deadline_ends_with_timeout_event(self, server):
+        asgi_app, system = server
+        asgi_app.pool.timeout = 0.2
+        status, body = asgi_request(asgi_app.app, "GET", "/api/ask/stream", query_string=b"query=leave")
+        assert status == 200
+        assert sse_events(body) == [("message", {"token": "first"}), ("error", {"error": "timeout"})]
+        assert asgi_app.pool.stats()["timed_out"] == 1
+
+    def test_stream_failure_ends_with_error_event(self, server, monkeypatch):
+        asgi_app, system = server
+
+        def failing_stream(query):
+            yield "Partial"
+            raise RuntimeError("generator crashed")
+
+        monkeypatch.setattr(system, "stream_answer", failing_stream)
+        status, body = asgi_request(asgi_app.app, "POST", "/api/ask/stream", {"query": "leave"})
+        assert status == 200
+        assert sse_events(body) == [("message", {"token": "Partial"}), ("error", {"error": "Failed to answer the query"})]
+
+
+class TestPreforkReload:
+
+    @pytest.mark.parametrize("load_generator", [True, False])
+    def test_reload_keeps_the_generator_setting(self, kb_path, make_qa_system, load_generator):
+        import socket
+        from prefork import PreforkServer
+        system = make_qa_system(kb_path)
+        with socket.socket() as listener:
+            server = PreforkServer(None, system, listener, workers=0, torch_threads=1, load_generator=load_generator)
+            server.reload()
+        assert system.kb_version == 1
+        assert system.generator_loaded is load_generator
@@ -0,0 +1,101 @@
+import numpy as np
+import pytest
+
+torch = pytest.importorskip("torch")
+transformers = pytest.importorskip("transformers")
+
+from Model_finetuning.data_pipeline import IGNORE_INDEX, DynamicPaddingCollator, TokenizedQADataset, pack_examples
+
+
+def make_dataset(examples, sequences):
+    """
+    A TokenizedQADataset over the given token lists, grouped into sequences of example indices.
+    """
+    offsets = np.zeros(len(examples) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(e) for e in examples])
+    tokens = np.asarray([t for e in examples for t in e], dtype=np.int32)
+    return TokenizedQADataset(tokens, offsets, np.asarray(sequences, dtype=np.int64))
+
+
+def tiny_gpt2(attn_implementation):
+    config = transformers.GPT2Config(vocab_size=64, n_positions=64, n_embd=32, n_layer=2, n_head=2)
+    torch.manual_seed(0)
+    model = transformers.GPT2LMHeadModel._from_config(config, attn_implementation=attn_implementation)
+    return model.eval()
+
+
+class TestPacking:
+
+    def test_pack_examples_fills_sequences_up_to_max_length(self):
+        lengths = [5, 3, 4, 2, 6, 1]
+        bins = pack_examples(lengths, 8)
+        assert sorted(i for b in bins for i in b) == list(range(len(lengths)))
+        assert all(sum(lengths[i] for i in b) <= 8 for b in bins)
+        assert len(bins) == 3
+
+    def test_position_ids_restart_per_packed_example(self):
+        dataset = make_dataset([[5, 6, 7], [8, 9], [10]], [[0, 2], [2, 3]])
+        assert dataset[0] == {"input_ids": [5, 6, 7, 8, 9], "position_ids": [0, 1, 2, 0, 1]}
+        assert dataset[1] == {"input_ids": [10], "position_ids": [0]}
+        assert dataset.lengths().tolist() == [5, 1]
+
+
+class TestDynamicPaddingCollator:
+
+    def test_unpacked_batch_keeps_padding_mask(self):
+        dataset = make_dataset([[5, 6, 7], [8, 9]], [[0, 1], [1, 2]])
+        collator = DynamicPaddingCollator(pad_token_id=0, pad_to_multiple_of=4)
+        batch = collator([dataset[0], dataset[1]])
+        assert batch["attention_mask"].tolist() == [[1, 1, 1, 0], [1, 1, 0, 0]]
+        assert batch["labels"].tolist() == [[5, 6, 7, IGNORE_INDEX], [8, 9, IGNORE_INDEX, IGNORE_INDEX]]
+        assert (collator.real_tokens, collator.padded_tokens) == (5, 3)
+
+    def test_packed_batch_gets_block_diagonal_mask(self):
+        dataset = make_dataset([[5, 6, 7], [8, 9], [10, 11]], [[0, 2], [2, 3]])
+        collator = DynamicPaddingCollator(pad_token_id=0, pad_to_multiple_of=None)
+        batch = collator([dataset[0], dataset[1]])
+        mask = batch["attention_mask"]
+        assert mask.shape == (2, 1, 5, 5)
+        allowed = (mask[:, 0] == 0).int().tolist()
+        assert allowed[0] == [
+            [1, 0, 0, 0, 0],
+            [1, 1, 0, 0, 0],
+            [1, 1, 1, 0, 0],
+            [0, 0, 0, 1, 0],
+            [0, 0, 0, 1, 1],
+        ]
+        # Padding rows attend only to themselves, so no row is fully masked.
+        assert allowed[1] == [
+            [1, 0, 0, 0, 0],
+            [1, 1, 0, 0, 0],
+            [0, 0, 1, 0, 0],
+            [0, 0, 0, 1, 0],
+            [0, 0, 0, 0, 1],
+        ]
+        assert batch["labels"][0].tolist() == [5, 6, 7, IGNORE_INDEX, 9]
+        assert (collator.real_tokens, collator.padded_tokens) == (7, 3)
+
+    @pytest.mark.parametrize("attn_implementation", ["eager", "sdpa"])
+    def test_packed_examples_do_not_attend_to_each_other(self, attn_implementation):
+        model = tiny_gpt2(attn_implementation)
+        first, second = [3, 14, 15, 9, 26], [5, 35, 8, 9]
+        dataset = make_dataset([first, second], [[0, 2], [1, 2]])
+        collator = DynamicPaddingCollator(pad_token_id=0, pad_to_multiple_of=None)
+        batch = collator([dataset[0], dataset[1]])
+        with torch.no_grad():
+            packed = model(**{k: v for k, v in batch.items() if k != "labels"}).logits
+            alone = model(input_ids=torch.tensor([second])).logits
+        torch.testing.assert_close(packed[0, len(first):], alone[0], rtol=1e-4, atol=1e-5)
+        torch.testing.assert_close(packed[1, :len(second)], alone[0], rtol=1e-4, atol=1e-5)
+
+    def test_packed_loss_matches_examples_trained_alone(self):
+        model = tiny_gpt2("eager")
+        first, second = [3, 14, 15, 9, 26], [5, 35, 8, 9]
+        collator = DynamicPaddingCollator(pad_token_id=0, pad_to_multiple_of=None)
+        packed = collator([make_dataset([first, second], [[0, 2]])[0]])
+        with torch.no_grad():
+            packed_loss = model(**packed).loss
+            losses = [model(input_ids=torch.tensor([ids]), labels=torch.tensor([ids])).loss for ids in (first, second)]
+        # Each example contributes its own len - 1 predictions.
+        expected = (losses[0] * (len(first) - 1) + losses[1] * (len(second) - 1)) / (len(first) + len(second) - 2)
+        torch.testing.assert_close(packed_loss, expected, rtol=1e-4, atol=1e-5)